@@ -15,13 +15,20 @@ import socket
 from wsgiref import simple_server
 import threading
 
+import eventlet
+from eventlet import wsgi
 import netaddr
 from oslo.config import cfg
 import pecan
 from pecan import hooks
 
+from entropy.api import watch
+from entropy.openstack.common.gettextutils import _LW
 from entropy.openstack.common import log
+from entropy.openstack.common import service as os_service
 from entropy import db
+from entropy.db import cache
+from entropy import utils
 
 
 LOG = log.getLogger(__name__)
@@ -35,6 +42,78 @@ API_SERVICE_OPTS = [
                default='0.0.0.0',
                help='The listen IP for the entropy API server.',
                ),
+    cfg.IntOpt('max_limit',
+               default=1000,
+               help='The maximum number of items returned in a single '
+                    'response from a collection resource.',
+               ),
+    cfg.StrOpt('server',
+               default='simple',
+               help='The WSGI server running the entropy API: "simple" for '
+                    'the single-threaded wsgiref server or "eventlet" for '
+                    'pre-forked workers serving requests on green threads. '
+                    'Watching transitions holds requests open and is only '
+                    'served by the eventlet server.',
+               ),
+    cfg.IntOpt('workers',
+               help='Number of worker processes of the eventlet server. '
+                    'Defaults to the number of CPUs available.',
+               ),
+    cfg.IntOpt('threads',
+               default=1000,
+               help='Size of the green thread pool serving requests in '
+                    'each eventlet server worker.',
+               ),
+    cfg.BoolOpt('keepalive',
+                default=True,
+                help='Whether the eventlet server keeps client connections '
+                     'open between requests.',
+                ),
+    cfg.IntOpt('client_socket_timeout',
+               default=900,
+               help='Timeout in seconds for idle client connections of the '
+                    'eventlet server, 0 means wait forever.',
+               ),
+    cfg.IntOpt('resource_cache_size',
+               default=0,
+               help='Maximum number of resource lookups cached by each API '
+                    'process, 0 disables the cache.',
+               ),
+    cfg.IntOpt('resource_cache_ttl',
+               default=5,
+               help='Number of seconds a cached resource lookup is served '
+                    'before the database is queried again. Resources read '
+                    'one by one may be this old, listings are cached by '
+                    'collection version and are never stale.',
+               ),
+    cfg.FloatOpt('watch_poll_interval',
+                 default=1.0,
+                 help='Number of seconds between two checks for new HA '
+                      'condition transitions by each API process with '
+                      'watching clients. Only used by the eventlet server.',
+                 ),
+    cfg.IntOpt('watch_buffer_size',
+               default=100,
+               help='Maximum number of transitions buffered for a watching '
+                    'client, a client falling further behind is asked to '
+                    'reconnect.',
+               ),
+    cfg.IntOpt('watch_max_clients',
+               default=1000,
+               help='Maximum number of clients watching transitions on each '
+                    'API process. Watching clients hold a green thread of '
+                    'the eventlet server each.',
+               ),
+    cfg.IntOpt('watch_timeout',
+               default=30,
+               help='Maximum number of seconds a long poll waits for '
+                    'transitions.',
+               ),
+    cfg.IntOpt('watch_keepalive',
+               default=15,
+               help='Number of seconds between two keepalive comments sent '
+                    'to idle server-sent event streams.',
+               ),
 ]
 
 opt_group = cfg.OptGroup(name='api',
@@ -53,6 +132,15 @@ class DBHook(pecan.hooks.PecanHook):
     def on_route(self, state):
         state.request.db_conn = self.db_conn
 
+
+class WatchHook(pecan.hooks.PecanHook):
+
+    def __init__(self, watch_hub):
+        self.watch_hub = watch_hub
+
+    def on_route(self, state):
+        state.request.watch_hub = self.watch_hub
+
 PECAN_CONFIG = {
     'app': {
         'root': 'entropy.api.v1.RootController',
@@ -62,8 +150,50 @@ PECAN_CONFIG = {
 }
 
 
+def _check_db_pool():
+    """Warn if the API workers can run out of database connections."""
+    # NOTE: unset pool options fall back to the sqlalchemy QueuePool
+    # defaults.
+    pool_size = CONF.database.max_pool_size or 5
+    max_overflow = CONF.database.max_overflow
+    if max_overflow is None:
+        max_overflow = 10
+    if max_overflow < 0:
+        return
+    threads = CONF.api.threads if CONF.api.server == 'eventlet' else 1
+    capacity = pool_size + max_overflow
+    if capacity < threads:
+        LOG.warning(_LW('Each API worker serves up to %(threads)d requests '
+                        'concurrently with at most %(capacity)d database '
+                        'connections, requests beyond that wait up to '
+                        '%(timeout)s seconds for a connection. Raise '
+                        'database/max_pool_size or database/max_overflow, '
+                        'or lower api/threads.'),
+                    {'threads': threads, 'capacity': capacity,
+                     'timeout': CONF.database.pool_timeout or 30})
+
+
+def get_db_connection():
+    _check_db_pool()
+    db_conn = db.get_connection_from_config(cfg.CONF)
+    if CONF.api.resource_cache_size > 0:
+        db_conn = cache.CachedConnection(db_conn,
+                                         CONF.api.resource_cache_size,
+                                         CONF.api.resource_cache_ttl)
+    return db_conn
+
+
 def setup_app(pecan_config=PECAN_CONFIG):
-    app_hooks = [DBHook(db.get_connection_from_config(cfg.CONF))]
+    db_conn = get_db_connection()
+    # NOTE: a watching client holds its request open, which would block
+    # every other client of the single-threaded simple server.
+    watch_hub = None
+    if CONF.api.server == 'eventlet':
+        watch_hub = watch.Hub(db_conn,
+                              CONF.api.watch_poll_interval,
+                              CONF.api.watch_buffer_size,
+                              CONF.api.watch_max_clients)
+    app_hooks = [DBHook(db_conn), WatchHook(watch_hub)]
     pecan.configuration.set_config(dict(pecan_config), overwrite=True)
     app = pecan.make_app(
         pecan_config['app']['root'],
@@ -87,13 +217,52 @@ def get_server_cls(host):
     return server_cls
 
 
-def build_server():
+class WSGIService(os_service.Service):
+    """Serve the entropy API with eventlet.wsgi on a green thread pool.
 
-    host, port = cfg.CONF.api.host, cfg.CONF.api.port
-    srv = simple_server.make_server(host,
-                                    port,
-                                    setup_app(),
-                                    get_server_cls(cfg.CONF.api.host))
+    The listening socket is opened when the service is created so that it
+    is shared by every worker forked by the ProcessLauncher, while the
+    application, and thus its database connection, is built in each
+    worker when the service starts.  On SIGHUP the launcher stops and
+    starts the service again, which rebuilds the application from the
+    reloaded configuration and lets in-flight requests complete.
+    """
+
+    def __init__(self, host, port):
+        super(WSGIService, self).__init__()
+        family = socket.AF_INET6 if netaddr.valid_ipv6(host) else (
+            socket.AF_INET)
+        self._socket = eventlet.listen((host, port), family=family)
+        self._pool = None
+        self._server = None
+
+    def start(self):
+        self._pool = eventlet.GreenPool(CONF.api.threads)
+        # NOTE: wsgi.server() closes the socket it is given when it exits,
+        # hand it a duplicate so the service can be started again.
+        self._server = eventlet.spawn(
+            wsgi.server, self._socket.dup(), setup_app(),
+            custom_pool=self._pool,
+            keepalive=CONF.api.keepalive,
+            socket_timeout=CONF.api.client_socket_timeout or None,
+            log=log.WritableLogger(LOG),
+            debug=False)
+
+    def stop(self):
+        # Stop accepting new connections, requests already being served
+        # by the pool are waited for in wait().
+        if self._server is not None:
+            self._server.kill()
+            self._server = None
+        super(WSGIService, self).stop()
+
+    def wait(self):
+        if self._pool is not None:
+            self._pool.waitall()
+        super(WSGIService, self).wait()
+
+
+def _log_serving(host, port):
     LOG.info(_('Starting server in PID %s') % os.getpid())
     if host == '0.0.0.0':
         LOG.info(_(
@@ -103,4 +272,26 @@ def build_server():
         LOG.info(_("serving on http://%(host)s:%(port)s") % (
                  {'host': host, 'port': port}))
 
+
+def build_server():
+
+    host, port = cfg.CONF.api.host, cfg.CONF.api.port
+    if cfg.CONF.api.server == 'eventlet':
+        workers = cfg.CONF.api.workers or utils.cpu_count()
+        if workers > 1:
+            # Writes handled by one worker must flush the others' caches.
+            cache.enable_shared_invalidation()
+        service = WSGIService(host, port)
+        _log_serving(host, port)
+        os_service.launch(service, workers=workers).wait()
+        return
+    elif cfg.CONF.api.server != 'simple':
+        raise ValueError(_('Unknown API server %s') % cfg.CONF.api.server)
+
+    srv = simple_server.make_server(host,
+                                    port,
+                                    setup_app(),
+                                    get_server_cls(cfg.CONF.api.host))
+    _log_serving(host, port)
+
     srv.serve_forever()
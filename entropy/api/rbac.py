@@ -0,0 +1,54 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Access control for the entropy API."""
+
+from oslo.config import cfg
+import pecan
+
+from entropy.openstack.common import policy
+
+# Rules enforced when no policy file is found.
+DEFAULT_RULES = {'context_is_admin': 'role:admin'}
+
+_ENFORCER = None
+
+
+def _get_enforcer():
+    global _ENFORCER
+    if _ENFORCER is None:
+        _ENFORCER = policy.Enforcer()
+        if not cfg.CONF.find_file(_ENFORCER.policy_file):
+            _ENFORCER.set_rules(dict(
+                (name, policy.parse_rule(rule))
+                for name, rule in DEFAULT_RULES.items()))
+    return _ENFORCER
+
+
+def get_creds(headers):
+    """Return the credentials of the identity headers of a request.
+
+    The headers are set by the authentication middleware deployed in front
+    of the API, such as the keystone auth_token middleware.
+    """
+    return {'roles': [role.strip() for role in
+                      headers.get('X-Roles', '').split(',') if role.strip()],
+            'user_id': headers.get('X-User-Id'),
+            'project_id': headers.get('X-Project-Id')}
+
+
+def enforce_admin(request):
+    """Abort the request with a 403 unless it is made by an admin."""
+    if not _get_enforcer().enforce('context_is_admin', {},
+                                   get_creds(request.headers)):
+        pecan.abort(403, 'Admin role required')
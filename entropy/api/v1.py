@@ -12,14 +12,160 @@
 # under the License.
 
 import functools
+import hashlib
 
+from oslo.config import cfg
 from oslo.utils import strutils
 from oslo.utils import timeutils
 import pecan
 from pecan import rest
+from six.moves.urllib import parse as urlparse
+import wsme.api
 from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
 
+from entropy.api import rbac
+from entropy.api import watch
+from entropy import exception
+from entropy.openstack.common import jsonutils
+from entropy import utils
+
+
+# Number of serialized items sent to the client per chunk when streaming.
+STREAM_CHUNK_SIZE = 100
+
+
+def _get_limit(limit):
+    """Validate the limit query parameter against the configured maximum."""
+    max_limit = cfg.CONF.api.max_limit
+    if limit is None:
+        return max_limit
+    try:
+        limit = int(limit)
+    except ValueError:
+        pecan.abort(400, 'Limit must be an integer')
+    if limit <= 0:
+        pecan.abort(400, 'Limit must be positive')
+    return min(limit, max_limit)
+
+
+def _get_timestamp(timestamp):
+    """Parse an ISO 8601 timestamp query parameter."""
+    if timestamp is None:
+        return None
+    try:
+        return utils.sanitize_timestamp(timestamp)
+    except ValueError:
+        pecan.abort(400, 'Invalid timestamp: %s' % timestamp)
+
+
+def _not_modified(version):
+    """Set the validators of a collection and evaluate the preconditions.
+
+    :param version: A (change sequence, last modified) tuple identifying
+                    the state of the collection.
+    :returns: True if the client copy is current and a 304 should be sent.
+    """
+    seq, last_modified = version
+    etag = hashlib.md5(('%s-%s' % (
+        seq, pecan.request.query_string)).encode('utf-8')).hexdigest()
+    pecan.response.etag = etag
+    # NOTE: HTTP dates have a one second resolution, a change later in the
+    # second of the last one would go unnoticed, so Last-Modified is only
+    # used once that second is over.
+    if last_modified is not None and (
+            last_modified.replace(microsecond=0) <
+            timeutils.utcnow().replace(microsecond=0)):
+        last_modified = last_modified.replace(microsecond=0)
+        pecan.response.last_modified = last_modified
+    else:
+        last_modified = None
+
+    if 'If-None-Match' in pecan.request.headers:
+        return etag in pecan.request.if_none_match
+    if_modified_since = pecan.request.if_modified_since
+    if last_modified is not None and if_modified_since is not None:
+        return last_modified <= timeutils.normalize_time(if_modified_since)
+    return False
+
+
+def _set_next_link(limit, marker, marker_name='marker'):
+    """Point the client at the next page as described in RFC 5988.
+
+    Only called when a page is full, in which case there may be more
+    items after it.
+    """
+    query = dict((k, v) for k, v in pecan.request.GET.items()
+                 if k not in ('limit', marker_name))
+    query['limit'] = limit
+    query[marker_name] = marker
+    pecan.response.headers['Link'] = '<%s?%s>; rel="next"' % (
+        pecan.request.path_url, urlparse.urlencode(query))
+
+
+def _dump_resource(resource):
+    """Serialize a resource to JSON.
+
+    The metadata document is copied as stored by the storage driver
+    instead of being decoded and encoded again.
+    """
+    raw_meta = resource.raw_resource_meta
+    if raw_meta is None:
+        return jsonutils.dumps(resource.as_dict())
+    return '{"resource_id": %s, "resource_type": %s, "resource_meta": %s}' % (
+        jsonutils.dumps(resource.resource_id),
+        jsonutils.dumps(resource.resource_type),
+        raw_meta)
+
+
+def _stream_json_list(items):
+    """Serialize an iterable of JSON documents as a list, chunk by chunk."""
+    yield b'['
+    chunk = []
+    sep = ''
+    for item in items:
+        chunk.append(sep + item)
+        sep = ','
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+    yield b']'
+
+
+def _format_event(transition):
+    """Serialize a transition as a server-sent event."""
+    return ('id: %d\nevent: transition\ndata: %s\n\n' % (
+        transition.id, jsonutils.dumps(transition.as_dict()))).encode(
+            'utf-8')
+
+
+def _stream_events(db_conn, hub, subscriber, resource_id, marker):
+    """Send the transitions after marker, then the new ones, as events."""
+    keepalive = cfg.CONF.api.watch_keepalive
+    try:
+        if marker is not None:
+            for transition in db_conn.get_history(resource_id=resource_id,
+                                                  marker=marker):
+                marker = transition.id
+                yield _format_event(transition)
+        while True:
+            try:
+                transition = subscriber.get(keepalive)
+            except watch.Overflow:
+                # NOTE: the client reconnects with the Last-Event-ID it got
+                # and the transitions it missed are read from the database.
+                yield b'event: overflow\ndata: {}\n\n'
+                return
+            if transition is None:
+                yield b': keepalive\n\n'
+            elif marker is None or transition.id > marker:
+                marker = transition.id
+                yield _format_event(transition)
+    finally:
+        hub.unsubscribe(subscriber)
+
 
 class Instance(wtypes.Base):
     resource_id = wtypes.text
@@ -31,9 +177,17 @@ class Instance(wtypes.Base):
         return cls(**(m.as_dict()))
 
 
+class BulkResult(wtypes.Base):
+    created = [Instance]
+    duplicates = [wtypes.text]
+
+
 class ResourcesController(rest.RestController):
     _custom_actions = {
         'history': ['GET'],
+        'changes': ['GET'],
+        'watch': ['GET'],
+        'bulk': ['POST'],
     }
 
     @wsme_pecan.wsexpose(Instance, body=Instance, status_code=201)
@@ -46,17 +200,253 @@ class ResourcesController(rest.RestController):
         pecan.response.status = 201
         return Instance.from_db_model(resource)
 
+    @wsme_pecan.wsexpose(BulkResult, body=[Instance], status_code=201)
+    def bulk(self, data):
+        """Record a batch of resources in a single transaction.
+
+        Resources which already exist are listed in the duplicates field
+        instead of failing the whole request.  The status is 201 if any
+        resource was created, 409 if they all existed already and 200 for
+        an empty batch.
+        """
+        results = pecan.request.db_conn.record_resources_bulk(
+            {'resource_id': d.resource_id,
+             'resource_type': 'instance',
+             'resource_meta': {}} for d in data)
+        created = []
+        duplicates = []
+        for r in results:
+            if isinstance(r, exception.ResourceAlreadyExists):
+                duplicates.append(r.resource)
+            else:
+                created.append(Instance.from_db_model(r))
+        if created:
+            status_code = 201
+        elif duplicates:
+            status_code = 409
+        else:
+            status_code = 200
+        return wsme.api.Response(
+            BulkResult(created=created, duplicates=duplicates),
+            status_code=status_code)
+
     @pecan.expose('json')
-    def get_all(self):
-        return [r.as_dict() for r in pecan.request.db_conn.get_resources()]
+    def get_all(self, **kwargs):
+        """Return a page of resources ordered by resource_id.
+
+        The response carries ETag and Last-Modified headers derived from
+        the collection version, so that a poll with matching
+        If-None-Match or If-Modified-Since headers is answered with a 304
+        without reading the resources.
+
+        The query parameters are taken as keyword arguments: RestController
+        routes a GET to get_all() only if it has no positional argument
+        left to fill from the path.
+
+        :param limit: Maximum number of resources to return, capped by the
+                      api/max_limit option.
+        :param marker: resource_id of the last resource of the previous
+                       page.
+        :param stream: If true, send the whole listing starting at marker
+                       as a chunked JSON list without buffering it.
+        :param resource_type: Only return resources of this type.
+        :param project_id: Only return resources of this project.
+        :param user_id: Only return resources of this user.
+        :param ha_condition: Only return resources in this HA condition.
+        :param start_timestamp: Only return resources created at or after
+                                this ISO 8601 timestamp.
+        :param end_timestamp: Only return resources created before this
+                              ISO 8601 timestamp.
+        """
+        if _not_modified(pecan.request.db_conn.get_resources_version()):
+            pecan.response.status = 304
+            return pecan.response
+
+        limit = kwargs.get('limit')
+        marker = kwargs.get('marker')
+        filters = dict(
+            resource_type=kwargs.get('resource_type'),
+            project_id=kwargs.get('project_id'),
+            user_id=kwargs.get('user_id'),
+            ha_condition=kwargs.get('ha_condition'),
+            start_timestamp=_get_timestamp(kwargs.get('start_timestamp')),
+            end_timestamp=_get_timestamp(kwargs.get('end_timestamp')))
+
+        if strutils.bool_from_string(kwargs.get('stream')):
+            limit = None if limit is None else _get_limit(limit)
+            resources = pecan.request.db_conn.get_resources(
+                limit=limit, marker=marker, **filters)
+            pecan.response.content_type = 'application/json'
+            pecan.response.app_iter = _stream_json_list(
+                _dump_resource(r) for r in resources)
+            return pecan.response
+
+        limit = _get_limit(limit)
+        resources = list(pecan.request.db_conn.get_resources(
+            limit=limit, marker=marker, **filters))
+        if len(resources) == limit:
+            _set_next_link(limit, resources[-1].resource_id)
+        pecan.response.content_type = 'application/json'
+        pecan.response.text = u'[%s]' % u','.join(
+            _dump_resource(r) for r in resources)
+        return pecan.response
+
+    @pecan.expose('json')
+    def get_one(self, resource_id):
+        resource = pecan.request.db_conn.get_resource(resource_id)
+        if resource is None:
+            pecan.abort(404, 'Resource %s not found' % resource_id)
+        return resource.as_dict()
+
+    @pecan.expose('json')
+    def history(self, resource_id=None, start_timestamp=None,
+                end_timestamp=None, limit=None, marker=None):
+        """Return a page of HA condition transitions in recording order.
+
+        :param resource_id: Only return transitions of this resource.
+        :param start_timestamp: Only return transitions recorded at or
+                                after this ISO 8601 timestamp.
+        :param end_timestamp: Only return transitions recorded before this
+                              ISO 8601 timestamp.
+        :param limit: Maximum number of transitions to return, capped by
+                      the api/max_limit option.
+        :param marker: id of the last transition of the previous page.
+        """
+        limit = _get_limit(limit)
+        if marker is not None:
+            try:
+                marker = int(marker)
+            except ValueError:
+                pecan.abort(400, 'Marker must be an integer')
+        transitions = [h.as_dict() for h in
+                       pecan.request.db_conn.get_history(
+                           resource_id=resource_id,
+                           start_timestamp=_get_timestamp(start_timestamp),
+                           end_timestamp=_get_timestamp(end_timestamp),
+                           limit=limit,
+                           marker=marker)]
+        if len(transitions) == limit:
+            _set_next_link(limit, transitions[-1]['id'])
+        return transitions
+
+    @pecan.expose('json')
+    def changes(self, since=0, limit=None):
+        """Return the resources changed after a sequence number.
+
+        Each change carries its sequence number, the seq of the last one
+        is passed as since to the next request to follow the changes.
+        Expired resources are reported once with deleted set, until their
+        tombstone expires too.
+
+        :param since: Sequence number of the last change already seen,
+                      defaults to 0 to get every resource.
+        :param limit: Maximum number of changes to return, capped by the
+                      api/max_limit option.
+        """
+        limit = _get_limit(limit)
+        try:
+            since = int(since)
+        except ValueError:
+            pecan.abort(400, 'Since must be an integer')
+        changes = [c.as_dict() for c in
+                   pecan.request.db_conn.get_changes_since(since, limit)]
+        if len(changes) == limit:
+            _set_next_link(limit, changes[-1]['seq'], 'since')
+        return changes
 
     @pecan.expose('json')
-    def history(self):
-        return {}
+    def watch(self, resource_id=None, marker=None, timeout=None):
+        """Wait for HA condition transitions as they are recorded.
+
+        Clients accepting text/event-stream get the transitions as
+        server-sent events on a connection held open, the id of each event
+        is the id of the transition so that a reconnecting client resumes
+        after its Last-Event-ID.  Other clients long poll: the transitions
+        recorded after marker are returned as soon as there are any, or an
+        empty list after timeout seconds.
+
+        :param resource_id: Only watch the transitions of this resource.
+        :param marker: id of the last transition already seen, defaults to
+                       waiting for the next transition.
+        :param timeout: Number of seconds a long poll waits, capped by the
+                        api/watch_timeout option.
+
+        Only served by the eventlet API server, the single-threaded simple
+        server answers 501 rather than blocking its other clients.
+        """
+        hub = pecan.request.watch_hub
+        if hub is None:
+            pecan.abort(501, 'Watching transitions requires the eventlet '
+                             'API server, see the api/server option')
+        marker = pecan.request.headers.get('Last-Event-ID', marker)
+        if marker is not None:
+            try:
+                marker = int(marker)
+            except ValueError:
+                pecan.abort(400, 'Marker must be an integer')
+        max_timeout = cfg.CONF.api.watch_timeout
+        try:
+            timeout = (max_timeout if timeout is None
+                       else min(float(timeout), max_timeout))
+        except ValueError:
+            pecan.abort(400, 'Timeout must be a number')
+
+        db_conn = pecan.request.db_conn
+        subscriber = hub.subscribe(resource_id)
+        if subscriber is None:
+            pecan.abort(503, 'Too many clients watching transitions')
+
+        if pecan.request.accept.best_match(
+                ['application/json', 'text/event-stream']) == (
+                    'text/event-stream'):
+            pecan.response.content_type = 'text/event-stream'
+            pecan.response.cache_control = 'no-cache'
+            pecan.response.app_iter = _stream_events(
+                db_conn, hub, subscriber, resource_id, marker)
+            return pecan.response
+
+        limit = cfg.CONF.api.max_limit
+        try:
+            if marker is not None:
+                transitions = [h.as_dict() for h in db_conn.get_history(
+                    resource_id=resource_id, marker=marker, limit=limit)]
+                if transitions:
+                    return transitions
+            transitions = []
+            wait = timeout
+            while len(transitions) < limit:
+                try:
+                    transition = subscriber.get(wait)
+                except watch.Overflow:
+                    break
+                if transition is None:
+                    break
+                if marker is None or transition.id > marker:
+                    transitions.append(transition.as_dict())
+                # NOTE: once a transition arrived, only take the ones
+                # already buffered.
+                wait = 0 if transitions else wait
+            return transitions
+        finally:
+            hub.unsubscribe(subscriber)
+
+
+class StatsController(rest.RestController):
+
+    @pecan.expose('json')
+    def get_all(self):
+        """Return the counters of the API process serving the request.
+
+        Restricted to the context_is_admin policy rule.
+        """
+        rbac.enforce_admin(pecan.request)
+        get_stats = getattr(pecan.request.db_conn, 'get_stats', None)
+        return get_stats() if get_stats else {}
 
 
 class V1Controller(object):
     resource = ResourcesController()
+    stats = StatsController()
 
 
 class RootController(object):
@@ -0,0 +1,128 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Push HA condition transitions to the clients watching them."""
+
+import eventlet
+from eventlet import queue
+from oslo.utils import timeutils
+
+from entropy.openstack.common.gettextutils import _LE
+from entropy.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
+
+class Overflow(Exception):
+    """A subscriber fell too far behind and missed transitions."""
+
+
+class Subscriber(object):
+    """A client watching transitions, with a bounded buffer.
+
+    :param resource_id: Only receive the transitions of this resource if
+                        set.
+    :param size: Maximum number of transitions buffered for the client.
+    """
+
+    def __init__(self, resource_id, size):
+        self.resource_id = resource_id
+        self.queue = queue.LightQueue(size)
+        self.overflowed = False
+
+    def push(self, transition):
+        if self.overflowed or (self.resource_id is not None and
+                               transition.resource_id != self.resource_id):
+            return
+        try:
+            self.queue.put_nowait(transition)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Return the next transition, or None after timeout seconds.
+
+        :raises: Overflow once the transitions buffered before the buffer
+                 filled up have been consumed.
+        """
+        if self.overflowed and self.queue.empty():
+            raise Overflow()
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Hub(object):
+    """Fan the transitions recorded in the database out to subscribers.
+
+    Transitions are recorded by the agents, so every API process runs a
+    single green thread polling the history for new ones while it has
+    subscribers, which costs one indexed query per interval however many
+    clients are watching.  The hub never waits for a subscriber: one whose
+    buffer is full is marked overflowed and told to reconnect, it then
+    resumes from the database.
+
+    :param db_conn: The storage connection to poll.
+    :param interval: Number of seconds between two polls.
+    :param buffer_size: Size of the buffer of each subscriber.
+    :param max_subscribers: Maximum number of concurrent subscribers.
+    """
+
+    def __init__(self, db_conn, interval, buffer_size, max_subscribers):
+        self.db_conn = db_conn
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._thread = None
+        self._since = None
+        self._marker = None
+
+    def subscribe(self, resource_id=None):
+        """Return a new Subscriber, or None if there are too many."""
+        if len(self._subscribers) >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(resource_id, self.buffer_size)
+        self._subscribers.add(subscriber)
+        if self._thread is None:
+            self._since = timeutils.utcnow()
+            self._marker = None
+            self._thread = eventlet.spawn(self._run)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    def _poll(self):
+        if self._marker is None:
+            transitions = self.db_conn.get_history(
+                start_timestamp=self._since)
+        else:
+            transitions = self.db_conn.get_history(marker=self._marker)
+        for transition in transitions:
+            self._marker = transition.id
+            for subscriber in list(self._subscribers):
+                subscriber.push(transition)
+
+    def _run(self):
+        try:
+            while self._subscribers:
+                try:
+                    self._poll()
+                except Exception:
+                    LOG.exception(_LE('Error polling HA condition '
+                                      'transitions'))
+                eventlet.sleep(self.interval)
+        finally:
+            self._thread = None
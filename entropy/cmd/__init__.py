@@ -9,4 +9,11 @@
 # distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
-# under the License.
\ No newline at end of file
+# under the License.
+
+import eventlet
+
+# NOTE: the API and agent serve requests and run pollsters on green
+# threads, make the standard library cooperative before anything else
+# gets a chance to use it.
+eventlet.monkey_patch(os=False)
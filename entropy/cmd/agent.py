@@ -19,4 +19,6 @@ from entropy.openstack.common import service as os_service
 
 def main():
     service.prepare_service()
-    os_service.launch(manager.AgentManager('entropy')).wait()
+    os_service.launch(manager.AgentManager(
+        'entropy',
+        group_prefix=cfg.CONF.agent.partitioning_group_prefix)).wait()
@@ -34,10 +34,17 @@ def dbsync():
 
 def expirer():
     service.prepare_service()
+    conn = db.get_connection_from_config(cfg.CONF)
+    # NOTE: the expirer runs periodically, also take the opportunity to
+    # create the upcoming history partitions, even if nothing expires.
+    conn.prepare_history_partitions()
     if cfg.CONF.database.time_to_live > 0:
-        LOG.debug(_("Clearing expired metering data"))
-        storage_conn = storage.get_connection_from_config(cfg.CONF)
-        storage_conn.clear_expired_metering_data(
-            cfg.CONF.database.time_to_live)
+        LOG.debug(_("Clearing expired resources and history"))
+        deleted = conn.clear_expired_data(
+            cfg.CONF.database.time_to_live,
+            batch_size=cfg.CONF.database.expirer_batch_size,
+            interval=cfg.CONF.database.expirer_batch_interval)
+        LOG.info(_("Deleted %(resource)d expired resources and %(history)d "
+                   "history rows") % deleted)
     else:
         LOG.info(_("Nothing to clean, database time to live is disabled"))
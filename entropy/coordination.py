@@ -0,0 +1,273 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import uuid
+
+from oslo.config import cfg
+import six
+import tooz.coordination
+
+from entropy.openstack.common.gettextutils import _LE, _LI
+from entropy.openstack.common import log
+from entropy import utils
+
+LOG = log.getLogger(__name__)
+
+OPTS = [
+    cfg.StrOpt('backend_url',
+               help='The backend URL to use for distributed coordination, '
+                    'e.g. zookeeper://host:2181, or zake:// and '
+                    'file:///path for agents running on a single host. If '
+                    'left empty, agents do not partition the resources and '
+                    'a single agent must be running.'),
+    cfg.FloatOpt('heartbeat',
+                 default=1.0,
+                 help='Number of seconds between heartbeats for distributed '
+                      'coordination.'),
+    cfg.FloatOpt('check_watchers',
+                 default=10.0,
+                 help='Number of seconds between checks to see if group '
+                      'membership has changed.'),
+]
+cfg.CONF.register_opts(OPTS, group='coordination')
+
+
+class PartitionCoordinator(object):
+    """Workload partitioning coordinator.
+
+    This class uses the `tooz` library to manage group membership.
+
+    To ensure that the other agents know this agent is still alive,
+    the `heartbeat` method should be called periodically.
+
+    Coordination errors and reconnects are handled under the hood, so the
+    service using the partition coordinator need not care whether the
+    coordination backend is down. The `extract_my_subset` will simply return
+    an empty iterable in this case.
+
+    The hash ring of a group is cached and updated node by node when its
+    members change, which is noticed by the watchers run by
+    `run_watchers`. The ownership table of the last partitioning is kept
+    too, along with the share of this agent: only new objects and the
+    objects a membership change may move are looked up again, and the
+    objects this agent gained and lost are applied to its share.
+    """
+
+    def __init__(self, my_id=None):
+        self._coordinator = None
+        self._groups = set()
+        self._rings = {}
+        # Groups whose membership changed since their ring was updated
+        self._stale = set()
+        # group_id -> (replicas, ownership table, keys owned by this agent)
+        self._ownership = {}
+        self._my_id = my_id or str(uuid.uuid4())
+        self._started = False
+
+    def start(self):
+        backend_url = cfg.CONF.coordination.backend_url
+        if backend_url:
+            try:
+                self._coordinator = tooz.coordination.get_coordinator(
+                    backend_url, self._my_id)
+                self._coordinator.start()
+                self._started = True
+                LOG.info(_LI('Coordination backend started successfully.'))
+            except tooz.coordination.ToozError:
+                self._started = False
+                LOG.exception(_LE('Error connecting to coordination '
+                                  'backend.'))
+
+    def stop(self):
+        if not self._coordinator:
+            return
+
+        for group in list(self._groups):
+            self.leave_group(group)
+
+        try:
+            self._coordinator.stop()
+        except tooz.coordination.ToozError:
+            LOG.exception(_LE('Error connecting to coordination backend.'))
+        finally:
+            self._coordinator = None
+            self._started = False
+
+    def is_active(self):
+        return self._coordinator is not None
+
+    def heartbeat(self):
+        if self._coordinator:
+            if not self._started:
+                # re-connect
+                self.start()
+            try:
+                self._coordinator.heartbeat()
+            except tooz.coordination.ToozError:
+                LOG.exception(_LE('Error sending a heartbeat to coordination '
+                                  'backend.'))
+
+    def run_watchers(self):
+        if self._coordinator:
+            self._coordinator.run_watchers()
+
+    def join_group(self, group_id):
+        if not self._coordinator or not self._started or not group_id:
+            return
+        while True:
+            try:
+                join_req = self._coordinator.join_group(group_id)
+                join_req.get()
+                LOG.info(_LI('Joined partitioning group %s'), group_id)
+                break
+            except tooz.coordination.MemberAlreadyExist:
+                return
+            except tooz.coordination.GroupNotCreated:
+                create_grp_req = self._coordinator.create_group(group_id)
+                try:
+                    create_grp_req.get()
+                except tooz.coordination.GroupAlreadyExist:
+                    pass
+        self._groups.add(group_id)
+        self._coordinator.watch_join_group(group_id, self._on_membership)
+        self._coordinator.watch_leave_group(group_id, self._on_membership)
+
+    def leave_group(self, group_id):
+        if group_id not in self._groups:
+            return
+        if self._coordinator:
+            self._coordinator.unwatch_join_group(group_id,
+                                                 self._on_membership)
+            self._coordinator.unwatch_leave_group(group_id,
+                                                  self._on_membership)
+            self._coordinator.leave_group(group_id)
+            self._groups.remove(group_id)
+            self._rings.pop(group_id, None)
+            self._stale.discard(group_id)
+            self._ownership.pop(group_id, None)
+            LOG.info(_LI('Left partitioning group %s'), group_id)
+
+    def _on_membership(self, event):
+        LOG.info(_LI('Member %(member)s joined or left group %(group)s, '
+                     'rebalancing'),
+                 {'member': event.member_id, 'group': event.group_id})
+        self._stale.add(event.group_id)
+
+    def _get_members(self, group_id):
+        if not self._coordinator:
+            return [self._my_id]
+
+        while True:
+            get_members_req = self._coordinator.get_members(group_id)
+            try:
+                return get_members_req.get()
+            except tooz.coordination.GroupNotCreated:
+                self.join_group(group_id)
+
+    def _get_ring(self, group_id):
+        """Return the ring of a group and the members which joined or left.
+
+        The members which joined or left since the previous call are added
+        to or removed from the ring, without hashing the points of the
+        others.
+        """
+        ring = self._rings.get(group_id)
+        if ring is None:
+            self._stale.discard(group_id)
+            members = self._get_members(group_id)
+            LOG.debug('Members of group %(group)s: %(members)s',
+                      {'group': group_id, 'members': members})
+            ring = self._rings[group_id] = utils.HashRing(members)
+            # NOTE: the members were unknown, any key may have moved.
+            self._ownership.pop(group_id, None)
+            return ring, set(), set()
+        if group_id not in self._stale:
+            return ring, set(), set()
+        members = set(self._get_members(group_id))
+        self._stale.discard(group_id)
+        nodes = set(ring.nodes)
+        joined, left = members - nodes, nodes - members
+        LOG.debug('Members of group %(group)s: %(members)s',
+                  {'group': group_id, 'members': list(members)})
+        for member in left:
+            ring.remove_node(member)
+        for member in joined:
+            ring.add_node(member)
+        return ring, joined, left
+
+    def _get_ownership(self, group_id, ring, keys, replicas, joined, left):
+        """Return the set of keys of a group owned by this agent.
+
+        Keys already partitioned are only looked up again if a member they
+        were assigned to left, or if members joined, as those may take any
+        key. The keys gained and lost by this agent are then applied to its
+        previous share.
+        """
+        last_replicas, table, mine = self._ownership.get(
+            group_id, (None, {}, set()))
+        if last_replicas != replicas:
+            table, mine = {}, set()
+        if joined:
+            stale = keys
+        else:
+            stale = [k for k in keys if k not in table or
+                     (left and not left.isdisjoint(table[k]))]
+        found = ring.ownership(stale, replicas)
+        gained, lost = utils.HashRing.diff_ownership(
+            dict((k, table[k]) for k in found if k in table), found,
+            self._my_id)
+        table.update(found)
+        if len(table) > len(keys):
+            present = set(keys)
+            for k in [k for k in table if k not in present]:
+                del table[k]
+                lost.add(k)
+        mine -= lost
+        mine |= gained
+        if joined or left:
+            LOG.info(_LI('Partitioning of group %(group)s changed, '
+                         '%(gained)d objects gained and %(lost)d lost'),
+                     {'group': group_id, 'gained': len(gained),
+                      'lost': len(lost)})
+        self._ownership[group_id] = (replicas, table, mine)
+        return mine
+
+    def extract_my_subset(self, group_id, iterable, key=str, replicas=1):
+        """Filters an iterable, returning only objects assigned to us.
+
+        We have a list of objects and get a list of active group members from
+        `tooz`. We then hash all the objects into buckets and return only
+        the ones that hashed into *our* bucket.
+
+        :param group_id: The partitioning group, if None nothing is
+                         filtered out.
+        :param iterable: The objects to partition.
+        :param key: Function returning the string an object is hashed on.
+        :param replicas: Number of group members each object is assigned
+                         to.
+        """
+        if not group_id:
+            return list(iterable)
+        if group_id not in self._groups:
+            self.join_group(group_id)
+        try:
+            ring, joined, left = self._get_ring(group_id)
+            items = list(iterable)
+            keys = [key(v) for v in items]
+            mine = self._get_ownership(group_id, ring, keys, replicas,
+                                       joined, left)
+            return [v for v, k in six.moves.zip(items, keys) if k in mine]
+        except tooz.coordination.ToozError:
+            LOG.exception(_LE('Error getting group membership info from '
+                              'coordination backend.'))
+            return []
@@ -41,6 +41,38 @@ STORAGE_OPTS = [
                default=-1,
                help="Number of seconds that samples are kept "
                "in the database for (<= 0 means forever)."),
+    cfg.IntOpt('expirer_batch_size',
+               default=1000,
+               help="Number of expired rows deleted per transaction by "
+               "the expirer."),
+    cfg.FloatOpt('expirer_batch_interval',
+                 default=0.5,
+                 help="Number of seconds the expirer sleeps between two "
+                 "batches, to let replication and concurrent writers "
+                 "catch up."),
+    cfg.BoolOpt('pool_pre_ping',
+                default=True,
+                help="Check that pooled connections are alive when they are "
+                "checked out, so that connections closed by the server "
+                "after idle_timeout are replaced instead of failing a "
+                "request."),
+    cfg.FloatOpt('slave_lag_window',
+                 default=1.0,
+                 help="Number of seconds after a write during which a "
+                 "process reads from the primary database instead of "
+                 "slave_connection, so that clients read their own writes "
+                 "despite the replication lag."),
+    cfg.StrOpt('json_codec',
+               default='json',
+               help="Library encoding and decoding the stored resource "
+               "metadata, json or ujson. ujson is faster but rounds "
+               "floats to fewer digits and escapes strings differently."),
+    cfg.StrOpt('mysql_timestamp_storage',
+               default='decimal',
+               help="How MySQL stores timestamps, decimal for DECIMAL(20,6) "
+               "seconds or integer for BIGINT microseconds since the epoch. "
+               "integer is more compact and converts faster, entropy-dbsync "
+               "converts the existing rows after a change."),
 ]
 
 cfg.CONF.register_opts(STORAGE_OPTS, group='database')
@@ -69,4 +101,5 @@ def get_connection_from_config(conf):
     LOG.debug(_('looking for %(name)r driver in %(namespace)r') % (
               {'name': engine_name, 'namespace': namespace}))
     mgr = driver.DriverManager(namespace, engine_name)
+    utils.set_json_codec(conf.database.json_codec)
     return mgr.driver(url)
@@ -19,6 +19,8 @@ from oslo.utils import timeutils
 import six
 from six import moves
 
+from entropy import utils
+
 
 class Model(object):
     """Base class for storage API models."""
@@ -52,4 +54,45 @@ class Resource(Model):
     def __init__(self, resource_id, resource_type, resource_meta):
         super(Resource, self).__init__(resource_id=resource_id,
                                        resource_type=resource_type,
-                                       resource_meta=resource_meta)
\ No newline at end of file
+                                       resource_meta=resource_meta)
+
+    @property
+    def resource_meta(self):
+        # NOTE: storage drivers may hand over the metadata as a
+        # utils.LazyJSON, only pay for decoding it if it is used.
+        if isinstance(self._resource_meta, utils.LazyJSON):
+            self._resource_meta = self._resource_meta.decode()
+        return self._resource_meta
+
+    @resource_meta.setter
+    def resource_meta(self, value):
+        self._resource_meta = value
+
+    @property
+    def raw_resource_meta(self):
+        """The metadata JSON document as stored, None once decoded."""
+        if isinstance(self._resource_meta, utils.LazyJSON):
+            return self._resource_meta.raw
+        return None
+
+
+class History(Model):
+    def __init__(self, id, resource_id, previous_ha_condition, ha_condition,
+                 timestamp):
+        super(History, self).__init__(
+            id=id,
+            resource_id=resource_id,
+            previous_ha_condition=previous_ha_condition,
+            ha_condition=ha_condition,
+            timestamp=timestamp)
+
+
+class Change(Model):
+    """A resource recorded, changed or, if deleted is set, deleted.
+
+    The resource of a deletion only has its resource_id set.
+    """
+
+    def __init__(self, seq, resource, deleted=False):
+        super(Change, self).__init__(seq=seq, resource=resource,
+                                     deleted=deleted)
@@ -0,0 +1,198 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Read-through cache in front of a storage connection."""
+
+import collections
+import multiprocessing
+import threading
+import time
+
+import six
+
+
+# Generation counter shared with the processes forked after
+# enable_shared_invalidation() is called, bumped on every write so that
+# the caches of all the processes are flushed and not only the writer's.
+_shared_generation = None
+
+
+def enable_shared_invalidation():
+    """Share write invalidation with the processes forked afterwards."""
+    global _shared_generation
+    if _shared_generation is None:
+        _shared_generation = multiprocessing.Value('L', 0)
+
+
+class LRUCache(object):
+    """A thread-safe LRU mapping whose entries expire after a TTL.
+
+    :param maxsize: Maximum number of entries kept in the cache.
+    :param ttl: Number of seconds an entry stays valid.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return a (found, value) tuple for key."""
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return False, None
+            if expires < time.time():
+                self.misses += 1
+                return False, None
+            # Re-insert the entry to mark it as the most recently used
+            self._data[key] = (expires, value)
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + self.ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+class CachedConnection(object):
+    """Cache resource lookups of a storage connection.
+
+    Results of get_resource() and of bounded get_resources() calls are
+    kept in an LRUCache, which is flushed whenever resources are recorded,
+    updated or expired through this connection or, if enabled, by any
+    other process sharing the invalidation counter.
+
+    Writes made by other services, such as the HA conditions updated by
+    the agents, don't flush the cache.  Listings are therefore cached by
+    collection version, which is read from the database on every call and
+    never cached as it is the source of the ETag, so that they are never
+    stale.  A resource returned by get_resource() may be up to ttl seconds
+    old.
+    Every other method is passed through.
+
+    :param conn: The storage connection to wrap.
+    :param maxsize: Maximum number of cached lookups.
+    :param ttl: Number of seconds a cached lookup stays valid.
+    """
+
+    def __init__(self, conn, maxsize, ttl):
+        self.conn = conn
+        self.cache = LRUCache(maxsize, ttl)
+        self._generation = self._get_generation()
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    @staticmethod
+    def _get_generation():
+        if _shared_generation is None:
+            return 0
+        return _shared_generation.value
+
+    def _check_generation(self):
+        generation = self._get_generation()
+        if generation != self._generation:
+            self.cache.clear()
+            self._generation = generation
+
+    def invalidate(self):
+        """Flush the cache of this process and of the sharing ones."""
+        if _shared_generation is not None:
+            with _shared_generation.get_lock():
+                _shared_generation.value += 1
+        self.cache.clear()
+
+    def get_resource(self, resource_id):
+        self._check_generation()
+        key = ('get_resource', resource_id)
+        found, resource = self.cache.get(key)
+        if not found:
+            resource = self.conn.get_resource(resource_id)
+            self.cache.set(key, resource)
+        return resource
+
+    def get_resources(self, limit=None, **kwargs):
+        # NOTE: unbounded listings are streamed to the client and would
+        # defeat the purpose of streaming if kept in memory.
+        if limit is None:
+            return self.conn.get_resources(**kwargs)
+        self._check_generation()
+        # NOTE: the version is read before the resources, a listing is
+        # never cached under a version more recent than its content.
+        key = ('get_resources', self.conn.get_resources_version()[0],
+               limit) + tuple(sorted(six.iteritems(kwargs)))
+        found, resources = self.cache.get(key)
+        if not found:
+            resources = list(self.conn.get_resources(limit=limit, **kwargs))
+            self.cache.set(key, resources)
+        return iter(resources)
+
+    def record_resources(self, *args, **kwargs):
+        try:
+            return self.conn.record_resources(*args, **kwargs)
+        finally:
+            self.invalidate()
+
+    def record_resources_bulk(self, *args, **kwargs):
+        try:
+            return self.conn.record_resources_bulk(*args, **kwargs)
+        finally:
+            self.invalidate()
+
+    def update_ha_condition(self, *args, **kwargs):
+        try:
+            return self.conn.update_ha_condition(*args, **kwargs)
+        finally:
+            self.invalidate()
+
+    def clear_expired_data(self, *args, **kwargs):
+        try:
+            return self.conn.clear_expired_data(*args, **kwargs)
+        finally:
+            self.invalidate()
+
+    def clear(self):
+        try:
+            return self.conn.clear()
+        finally:
+            self.invalidate()
+
+    def get_stats(self):
+        """Return the cache counters along with the connection ones."""
+        stats = {}
+        if hasattr(self.conn, 'get_stats'):
+            stats.update(self.conn.get_stats())
+        stats['cache'] = self.cache.stats()
+        return stats
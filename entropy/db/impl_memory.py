@@ -0,0 +1,325 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""In-memory storage backend.
+
+Selected with a memory:// database connection URL.  Data lives in the
+process and is lost when it exits, it isn't shared between the API and
+the agents which run as separate processes.  This makes it suited to
+tests and single process benchmarks, and to measuring the overhead of
+the SQL drivers against a baseline.
+"""
+
+import bisect
+import collections
+import datetime
+import threading
+
+import six
+
+from oslo.utils import timeutils
+
+from entropy import exception
+from entropy.db import api_models
+from entropy import utils
+
+
+# Resource columns having an equality index, see get_resources().
+INDEXED_COLUMNS = ('resource_type', 'project_id', 'user_id', 'ha_condition')
+
+
+class Connection(object):
+    """Keep the resources and their history in dicts.
+
+    Resources are indexed by id, by each column of INDEXED_COLUMNS and by
+    change sequence number, and their ids are also kept sorted for keyset
+    pagination, so that lookups cost about as much as with a database
+    index.  Metadata is stored JSON encoded like the SQL driver does, so
+    that callers never share documents with the store.
+    """
+
+    def __init__(self, url):
+        self._lock = threading.RLock()
+        # Last change sequence number, it carries on across clear() so that
+        # a consumer of the change feed never mistakes new changes for seen
+        # ones.
+        self._seq = 0
+        self.clear()
+
+    def upgrade(self):
+        pass
+
+    def prepare_history_partitions(self, days=None):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._resources = {}
+            self._sorted_ids = []
+            self._indexes = dict((column, collections.defaultdict(set))
+                                 for column in INDEXED_COLUMNS)
+            self._history = []
+            self._history_ids = []
+            self._history_by_resource = collections.defaultdict(list)
+            # Last history id, never reused even once the history expired
+            self._history_seq = 0
+            # Append-only (seq, resource_id) log of the changes, entries
+            # superseded by a later change of the resource are skipped.
+            self._change_log = []
+            self._change_seqs = []
+            # Expired resources, by id, reported as deleted by the feed
+            self._tombstones = {}
+            self._last_modified = None
+
+    def _next_seq(self):
+        self._seq += 1
+        return self._seq
+
+    def _log_change(self, row):
+        row['change_seq'] = self._next_seq()
+        self._change_log.append((row['change_seq'], row['resource_id']))
+        self._change_seqs.append(row['change_seq'])
+        if len(self._change_log) > 2 * max(
+                len(self._resources) + len(self._tombstones), 1000):
+            self._compact_change_log()
+
+    def _latest_change(self, resource_id):
+        """Return the row or tombstone holding the latest change."""
+        return (self._resources.get(resource_id) or
+                self._tombstones.get(resource_id))
+
+    def _compact_change_log(self):
+        log = []
+        for seq, resource_id in self._change_log:
+            latest = self._latest_change(resource_id)
+            if latest is not None and latest['change_seq'] == seq:
+                log.append((seq, resource_id))
+        self._change_log = log
+        self._change_seqs = [seq for seq, _ in log]
+
+    def _touch(self, timestamp):
+        if self._last_modified is None or timestamp > self._last_modified:
+            self._last_modified = timestamp
+
+    @staticmethod
+    def _to_model(row):
+        meta = row['resource_metadata']
+        return api_models.Resource(
+            resource_id=row['resource_id'],
+            resource_type=row['resource_type'],
+            resource_meta=None if meta is None else utils.LazyJSON(meta))
+
+    def _insert(self, resource_id, resource_type, resource_meta):
+        now = timeutils.utcnow()
+        row = {'resource_id': resource_id,
+               'resource_type': resource_type,
+               'user_id': None,
+               'project_id': None,
+               'ha_condition': None,
+               'created_at': now,
+               'resource_metadata': (None if resource_meta is None
+                                     else utils.json_dumps(resource_meta))}
+        self._resources[resource_id] = row
+        self._tombstones.pop(resource_id, None)
+        bisect.insort(self._sorted_ids, resource_id)
+        for column in INDEXED_COLUMNS:
+            self._indexes[column][row[column]].add(resource_id)
+        self._log_change(row)
+        self._touch(now)
+        return api_models.Resource(resource_id=resource_id,
+                                   resource_type=resource_type,
+                                   resource_meta=resource_meta)
+
+    def _delete(self, resource_id):
+        row = self._resources.pop(resource_id)
+        del self._sorted_ids[bisect.bisect_left(self._sorted_ids,
+                                                resource_id)]
+        for column in INDEXED_COLUMNS:
+            ids = self._indexes[column][row[column]]
+            ids.discard(resource_id)
+            if not ids:
+                del self._indexes[column][row[column]]
+
+    def record_resources(self, resource_id, resource_type, resource_meta):
+        with self._lock:
+            if resource_id in self._resources:
+                raise exception.ResourceAlreadyExists(resource_id)
+            return self._insert(resource_id, resource_type, resource_meta)
+
+    def record_resources_bulk(self, resources):
+        """Record many resources, see impl_sqlalchemy.Connection."""
+        results = []
+        with self._lock:
+            for r in resources:
+                if r['resource_id'] in self._resources:
+                    results.append(exception.ResourceAlreadyExists(
+                        r['resource_id']))
+                else:
+                    results.append(self._insert(r['resource_id'],
+                                                r['resource_type'],
+                                                r['resource_meta']))
+        return results
+
+    def get_resource(self, resource_id):
+        row = self._resources.get(resource_id)
+        return None if row is None else self._to_model(row)
+
+    def get_resources_version(self):
+        """Return a version, see impl_sqlalchemy.Connection."""
+        with self._lock:
+            return self._seq, self._last_modified
+
+    def update_ha_condition(self, resource_id, ha_condition):
+        with self._lock:
+            row = self._resources.get(resource_id)
+            if row is None:
+                raise exception.ResourceNotFound(resource_id)
+            previous = row['ha_condition']
+            if previous == ha_condition:
+                return None
+            index = self._indexes['ha_condition']
+            index[previous].discard(resource_id)
+            if not index[previous]:
+                del index[previous]
+            index[ha_condition].add(resource_id)
+            row['ha_condition'] = ha_condition
+            self._log_change(row)
+
+            now = timeutils.utcnow()
+            self._history_seq += 1
+            history = api_models.History(
+                id=self._history_seq,
+                resource_id=resource_id,
+                previous_ha_condition=previous,
+                ha_condition=ha_condition,
+                timestamp=now)
+            self._history.append(history)
+            self._history_ids.append(history.id)
+            self._history_by_resource[resource_id].append(history)
+            self._touch(now)
+            return history
+
+    def get_history(self, resource_id=None, start_timestamp=None,
+                    end_timestamp=None, limit=None, marker=None):
+        """Return transitions, see impl_sqlalchemy.Connection."""
+        with self._lock:
+            if resource_id is not None:
+                transitions = [h for h in self._history_by_resource.get(
+                    resource_id, []) if marker is None or h.id > marker]
+            else:
+                start = (0 if marker is None
+                         else bisect.bisect(self._history_ids, marker))
+                transitions = self._history[start:]
+        result = []
+        for h in transitions:
+            if limit is not None and len(result) >= limit:
+                break
+            if start_timestamp and h.timestamp < start_timestamp:
+                continue
+            if end_timestamp and h.timestamp >= end_timestamp:
+                continue
+            result.append(h)
+        return iter(result)
+
+    def get_resources(self, limit=None, marker=None, resource_type=None,
+                      project_id=None, user_id=None, ha_condition=None,
+                      start_timestamp=None, end_timestamp=None):
+        """Return resources, see impl_sqlalchemy.Connection.
+
+        The equality filters are resolved by intersecting their indexes,
+        smallest first.
+        """
+        filters = dict(resource_type=resource_type, project_id=project_id,
+                       user_id=user_id, ha_condition=ha_condition)
+        with self._lock:
+            candidates = None
+            for ids in sorted((self._indexes[column].get(value, set())
+                               for column, value in six.iteritems(filters)
+                               if value is not None), key=len):
+                candidates = (set(ids) if candidates is None
+                              else candidates & ids)
+            ids = (self._sorted_ids if candidates is None
+                   else sorted(candidates))
+            start = 0 if marker is None else bisect.bisect(ids, marker)
+            result = []
+            for resource_id in ids[start:]:
+                if limit is not None and len(result) >= limit:
+                    break
+                row = self._resources[resource_id]
+                if start_timestamp and row['created_at'] < start_timestamp:
+                    continue
+                if end_timestamp and row['created_at'] >= end_timestamp:
+                    continue
+                result.append(self._to_model(row))
+        return iter(result)
+
+    def get_changes_since(self, seq=0, limit=None):
+        """Return changes, see impl_sqlalchemy.Connection."""
+        result = []
+        with self._lock:
+            start = bisect.bisect(self._change_seqs, seq)
+            for change_seq, resource_id in self._change_log[start:]:
+                if limit is not None and len(result) >= limit:
+                    break
+                latest = self._latest_change(resource_id)
+                if latest is None or latest['change_seq'] != change_seq:
+                    continue
+                if resource_id in self._tombstones:
+                    result.append(api_models.Change(
+                        seq=change_seq,
+                        resource=api_models.Resource(
+                            resource_id=resource_id, resource_type=None,
+                            resource_meta=None),
+                        deleted=True))
+                else:
+                    result.append(api_models.Change(
+                        seq=change_seq, resource=self._to_model(latest)))
+        return iter(result)
+
+    def clear_expired_data(self, ttl, batch_size=1000, interval=0):
+        """Delete the resources, tombstones and history older than ttl.
+
+        :returns: A dict with the number of rows deleted per table.
+        """
+        now = timeutils.utcnow()
+        end = now - datetime.timedelta(seconds=ttl)
+        with self._lock:
+            buried = [resource_id for resource_id, tombstone
+                      in six.iteritems(self._tombstones)
+                      if tombstone['deleted_at'] < end]
+            for resource_id in buried:
+                del self._tombstones[resource_id]
+            expired = [resource_id for resource_id, row
+                       in six.iteritems(self._resources)
+                       if row['created_at'] < end]
+            for resource_id in expired:
+                self._delete(resource_id)
+                tombstone = {'resource_id': resource_id, 'deleted_at': now}
+                self._tombstones[resource_id] = tombstone
+                self._log_change(tombstone)
+            if expired:
+                self._touch(now)
+            kept = [h for h in self._history if h.timestamp >= end]
+            deleted = len(self._history) - len(kept)
+            self._history = kept
+            self._history_ids = [h.id for h in kept]
+            self._history_by_resource = collections.defaultdict(list)
+            for h in kept:
+                self._history_by_resource[h.resource_id].append(h)
+        return {'history': deleted, 'resource': len(expired),
+                'resource_tombstone': len(buried)}
+
+    def get_stats(self):
+        return {'memory': {'resources': len(self._resources),
+                           'history': len(self._history),
+                           'change_log': len(self._change_log)}}
@@ -14,7 +14,13 @@
 """SQLAlchemy storage backend."""
 
 from __future__ import absolute_import
+import datetime
+import functools
+import itertools
 import os
+import time
+
+import six
 
 from oslo.db.sqlalchemy import migration
 from oslo.config import cfg
@@ -22,44 +28,478 @@ from oslo.db import exception as dbexc
 from oslo.db.sqlalchemy import migration
 from oslo.db.sqlalchemy import session as db_session
 from oslo.utils import timeutils
-from oslo.db.sqlalchemy import models
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
 from sqlalchemy.ext import declarative
+from sqlalchemy import pool as sa_pool
 from oslo.db.sqlalchemy import session
 from entropy.db.sqlalchemy import models as db_models
 from oslo.db import exception as db_exception
 
 from entropy import exception
 from entropy.db import api_models
+from entropy.openstack.common.gettextutils import _LI
+from entropy.openstack.common import log
+from entropy import utils
+
+
+LOG = log.getLogger(__name__)
 
 
 Base = declarative.declarative_base()
 
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _day(timestamp):
+    """Return the number of days between the epoch and timestamp."""
+    return (timestamp - _EPOCH).days
+
+
+def make_query_from_filter(query, start_timestamp=None, end_timestamp=None,
+                           **filters):
+    """Apply resource filters to a query.
+
+    Only filters with a value are added to the WHERE clause, so that the
+    database can pick the index matching the columns actually used.
+
+    :param query: Query to apply the filters to.
+    :param start_timestamp: Optional earliest creation time (inclusive).
+    :param end_timestamp: Optional latest creation time (exclusive).
+    :param filters: Column name to value mapping of equality filters.
+    """
+    for column, value in sorted(six.iteritems(filters)):
+        if value is not None:
+            query = query.filter(
+                getattr(db_models.Resource, column) == value)
+    if start_timestamp:
+        query = query.filter(
+            db_models.Resource.created_at >= start_timestamp)
+    if end_timestamp:
+        query = query.filter(
+            db_models.Resource.created_at < end_timestamp)
+    return query
+
+
+# oslo.db engine options read from the database option group, the other
+# options of the group are not meant for the engine.
+ENGINE_OPTIONS = ('mysql_sql_mode', 'idle_timeout', 'connection_debug',
+                  'max_pool_size', 'max_overflow', 'pool_timeout',
+                  'sqlite_synchronous', 'connection_trace', 'max_retries',
+                  'retry_interval')
+
+
+def _engine_options(conf):
+    """Return the validated engine options of the configuration.
+
+    :raises: ValueError if the pool options are out of range.
+    """
+    options = dict((name, getattr(conf.database, name))
+                   for name in ENGINE_OPTIONS
+                   if getattr(conf.database, name, None) is not None)
+    if options.get('max_pool_size', 1) < 1:
+        raise ValueError('database/max_pool_size must be at least 1')
+    if options.get('max_overflow', 0) < -1:
+        raise ValueError('database/max_overflow must be -1 (unlimited) '
+                         'or positive')
+    if options.get('pool_timeout', 1) <= 0:
+        raise ValueError('database/pool_timeout must be positive')
+    if options.get('idle_timeout', 1) <= 0:
+        raise ValueError('database/idle_timeout must be positive')
+    return options
+
+
+def _writes(func):
+    """Mark a Connection method as writing to the primary database."""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            # NOTE: the lag window starts once the write is done.
+            self._last_write = time.time()
+    return wrapper
+
+
+class PoolMetrics(object):
+    """Instrument the connection pool of an engine with pool events.
+
+    The listeners are registered once on the engine: the pool which
+    replaces the current one when the engine is disposed inherits them.
+    Checkouts are counted along with the checkouts which left the pool
+    exhausted, after which requests wait for a connection, and the time
+    connections are held between checkout and checkin is measured.
+
+    :param engine: The sqlalchemy engine whose pool to instrument.
+    :param pre_ping: Whether to check connections on checkout, see ping().
+    """
+
+    def __init__(self, engine, pre_ping=False):
+        self.engine = engine
+        self.checkouts = 0
+        self.exhausted = 0
+        self.connects = 0
+        self.disconnects = 0
+        self.hold_time = 0.0
+        self.max_hold_time = 0.0
+        self.held = 0
+        event.listen(engine, 'connect', self._on_connect)
+        if pre_ping:
+            # NOTE: the ping must run before the checkout is counted, as
+            # it makes the pool retry the checkout on a dead connection.
+            event.listen(engine, 'checkout', self.ping)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+
+    @property
+    def pool(self):
+        return self.engine.pool
+
+    def _is_exhausted(self):
+        pool = self.pool
+        if not isinstance(pool, sa_pool.QueuePool):
+            return False
+        max_overflow = getattr(pool, '_max_overflow', -1)
+        return (pool.checkedin() == 0 and max_overflow > -1 and
+                pool.overflow() >= max_overflow)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record,
+                     connection_proxy):
+        self.checkouts += 1
+        if self._is_exhausted():
+            self.exhausted += 1
+        connection_record.info['entropy.checkout'] = time.time()
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        start = connection_record.info.pop('entropy.checkout', None)
+        if start is None:
+            return
+        elapsed = time.time() - start
+        self.held += 1
+        self.hold_time += elapsed
+        self.max_hold_time = max(self.max_hold_time, elapsed)
+
+    def ping(self, dbapi_connection, connection_record, connection_proxy):
+        """Pool checkout listener replacing dead connections."""
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        except Exception:
+            self.disconnects += 1
+            # NOTE: the pool retries the checkout with a new connection.
+            raise sa_exc.DisconnectionError()
+        finally:
+            cursor.close()
+
+    def stats(self):
+        stats = {'checkouts': self.checkouts,
+                 'exhausted': self.exhausted,
+                 'connects': self.connects,
+                 'disconnects': self.disconnects,
+                 'hold_time_avg': (self.hold_time / self.held
+                                   if self.held else 0.0),
+                 'hold_time_max': self.max_hold_time}
+        pool = self.pool
+        if isinstance(pool, sa_pool.QueuePool):
+            stats.update(size=pool.size(),
+                         checked_in=pool.checkedin(),
+                         checked_out=pool.checkedout(),
+                         overflow=pool.overflow())
+        return stats
+
 
 class Connection(object):
+    # Number of rows fetched from the database per round trip when
+    # iterating over large result sets.
+    YIELD_PER = 1000
+    # Maximum number of rows sent in a single multi-row INSERT, keeps the
+    # statement below the database packet and bind parameter limits.
+    BULK_INSERT_SIZE = 500
+    # Number of days ahead of today for which MySQL history partitions are
+    # created by prepare_history_partitions().
+    HISTORY_PARTITIONS_AHEAD = 7
+
     def __init__(self, url):
+        self._slave_connection = cfg.CONF.database.slave_connection
         self._engine_facade = db_session.EngineFacade(
             url,
-            **dict(cfg.CONF.database.items())
+            slave_connection=self._slave_connection,
+            **_engine_options(cfg.CONF)
         )
+        # Time of the last write through this connection, see
+        # _get_read_session().
+        self._last_write = 0
+        self._pool_metrics = {}
+        self._instrument_pool()
+        if self._slave_connection:
+            self._instrument_pool(use_slave=True)
+
+    def _instrument_pool(self, use_slave=False):
+        name = 'db_slave_pool' if use_slave else 'db_pool'
+        if name in self._pool_metrics:
+            # NOTE: the listeners outlive engine.dispose(), registering
+            # them again would run them twice per checkout.
+            return
+        self._pool_metrics[name] = PoolMetrics(
+            self._engine_facade.get_engine(use_slave=use_slave),
+            pre_ping=cfg.CONF.database.pool_pre_ping)
+
+    def _get_read_session(self):
+        """Return a session for the queries which may be served by a slave.
+
+        The listings go to the database/slave_connection replica when one
+        is configured, except during database/slave_lag_window seconds
+        after a write through this connection, so that a client reading
+        right after writing sees its change despite the replication lag.
+        """
+        use_slave = bool(self._slave_connection) and (
+            time.time() - self._last_write >=
+            cfg.CONF.database.slave_lag_window)
+        return self._engine_facade.get_session(use_slave=use_slave)
+
+    def get_stats(self):
+        """Return the counters of the database connection pools."""
+        return dict((name, metrics.stats())
+                    for name, metrics in six.iteritems(self._pool_metrics))
 
     def upgrade(self):
         path = os.path.join(os.path.abspath(os.path.dirname(__file__)),
                             'sqlalchemy', 'migrate_repo')
         migration.db_sync(self._engine_facade.get_engine(), path)
+        self._convert_timestamps()
+        self.prepare_history_partitions()
+
+    def _convert_timestamps(self):
+        """Convert the MySQL timestamp columns to the configured storage.
+
+        Columns are converted in place between DECIMAL(20,6) seconds and
+        BIGINT microseconds when database/mysql_timestamp_storage doesn't
+        match their type, see models.PreciseTimestamp.
+        """
+        engine = self._engine_facade.get_engine()
+        if engine.name != 'mysql':
+            return
+        integer = db_models.PreciseTimestamp.stores_microseconds(
+            engine.dialect)
+        inspector = sqlalchemy.inspect(engine)
+        for table in db_models.Base.metadata.sorted_tables:
+            types = dict((column['name'], column['type'])
+                         for column in inspector.get_columns(table.name))
+            for column in table.columns:
+                if (not isinstance(column.type, db_models.PreciseTimestamp)
+                        or isinstance(types[column.name],
+                                      sqlalchemy.Integer) == integer):
+                    continue
+                LOG.info(_LI('Converting %(table)s.%(column)s to %(storage)s '
+                             'timestamps'),
+                         {'table': table.name, 'column': column.name,
+                          'storage': 'integer' if integer else 'decimal'})
+                null = '' if column.nullable else ' NOT NULL'
+                # NOTE: DECIMAL(20,6) can't hold the value in microseconds,
+                # widen it before scaling.
+                engine.execute('ALTER TABLE %s MODIFY `%s` DECIMAL(26, 6)%s'
+                               % (table.name, column.name, null))
+                engine.execute('UPDATE %s SET `%s` = `%s` %s 1000000'
+                               % (table.name, column.name, column.name,
+                                  '*' if integer else '/'))
+                engine.execute('ALTER TABLE %s MODIFY `%s` %s%s'
+                               % (table.name, column.name,
+                                  'BIGINT' if integer else 'DECIMAL(20, 6)',
+                                  null))
+
+    def prepare_history_partitions(self, days=None):
+        """Create the daily history partitions up to a few days ahead.
+
+        New partitions are split out of the catch-all pmax partition, which
+        stays empty as long as this is called more often than every
+        HISTORY_PARTITIONS_AHEAD days: upgrade() and every run of
+        entropy-expirer call it, which should be scheduled at least daily.
+        The history table is only partitioned on MySQL, this is a no-op
+        with other databases.
 
+        :param days: Number of days ahead of today to prepare partitions
+                     for, defaults to HISTORY_PARTITIONS_AHEAD.
+        """
+        engine = self._engine_facade.get_engine()
+        if engine.name != 'mysql':
+            return
+        if days is None:
+            days = self.HISTORY_PARTITIONS_AHEAD
+        today = _day(timeutils.utcnow())
+        bounds = [int(row[0]) for row in engine.execute(
+            "SELECT PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'history' "
+            "AND PARTITION_DESCRIPTION != 'MAXVALUE'")]
+        # Partition pYYYYMMDD holds the rows of that day, the first one
+        # also holds anything older.
+        partitions = [
+            'PARTITION p%s VALUES LESS THAN (%d)' % (
+                (_EPOCH + datetime.timedelta(days=day)).strftime('%Y%m%d'),
+                day + 1)
+            for day in six.moves.range(max(bounds) if bounds else today,
+                                       today + days + 1)]
+        if partitions:
+            engine.execute(
+                'ALTER TABLE history REORGANIZE PARTITION pmax INTO '
+                '(%s, PARTITION pmax VALUES LESS THAN MAXVALUE)'
+                % ', '.join(partitions))
+
+    def _drop_history_partitions(self, end):
+        """Drop the MySQL history partitions only holding rows before end.
+
+        :returns: The names of the dropped partitions.
+        """
+        engine = self._engine_facade.get_engine()
+        if engine.name != 'mysql':
+            return []
+        names = [row[0] for row in engine.execute(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'history' "
+            "AND PARTITION_DESCRIPTION != 'MAXVALUE' "
+            "AND CAST(PARTITION_DESCRIPTION AS UNSIGNED) <= %s",
+            _day(end))]
+        if names:
+            engine.execute('ALTER TABLE history DROP PARTITION %s'
+                           % ', '.join(names))
+        return names
+
+    def _delete_in_batches(self, model, key, column, end, batch_size,
+                           interval, tombstones=False):
+        """Delete the rows whose column is older than end, batch by batch.
+
+        Each batch looks up at most batch_size primary keys through the
+        index on column and deletes them in its own short transaction, so
+        that locks are held briefly and replicas can keep up.
+
+        :param model: Model of the table to delete rows from.
+        :param key: Primary key column of the table.
+        :param column: Indexed timestamp column compared against end.
+        :param end: Rows older than this timestamp are deleted.
+        :param batch_size: Maximum number of rows deleted per transaction.
+        :param interval: Number of seconds to sleep between batches.
+        :param tombstones: Whether to leave a tombstone of each deleted
+                           resource for the change feed, which also changes
+                           the version of the collection.
+        :returns: The number of deleted rows.
+        """
+        session = self._engine_facade.get_session()
+        table = model.__table__
+        total = 0
+        start = time.time()
+        while True:
+            with session.begin():
+                ids = [row[0] for row in session.query(key).filter(
+                    column < end).order_by(column).limit(batch_size)]
+                if ids:
+                    session.execute(table.delete().where(key.in_(ids)))
+                    if tombstones:
+                        self._record_tombstones(session, ids)
+            total += len(ids)
+            if ids:
+                LOG.info(_LI('Deleted %(total)d expired %(table)s rows '
+                             '(%(rate).1f rows/s)'),
+                         {'total': total, 'table': table.name,
+                          'rate': total / max(time.time() - start, 1e-6)})
+            if len(ids) < batch_size:
+                return total
+            time.sleep(interval)
+
+    def clear_expired_data(self, ttl, batch_size=1000, interval=0):
+        """Delete the resources, tombstones and history older than ttl.
+
+        Expired resources leave a tombstone so that the change feed reports
+        them as deleted.  Expired history partitions are dropped whole on
+        MySQL, remaining rows are deleted in bounded batches using the
+        timestamp indexes.
+
+        :param ttl: Number of seconds rows are kept for.
+        :param batch_size: Maximum number of rows deleted per transaction.
+        :param interval: Number of seconds to sleep between batches.
+        :returns: A dict with the number of rows deleted per table.
+        """
+        end = timeutils.utcnow() - datetime.timedelta(seconds=ttl)
+        partitions = self._drop_history_partitions(end)
+        if partitions:
+            LOG.info(_LI('Dropped expired history partitions %s'),
+                     ', '.join(partitions))
+        deleted = {
+            'history': self._delete_in_batches(
+                db_models.History, db_models.History.id,
+                db_models.History.timestamp, end, batch_size, interval),
+            # NOTE: expire the tombstones first, those left by this run
+            # are kept for a full ttl.
+            'resource_tombstone': self._delete_in_batches(
+                db_models.ResourceTombstone,
+                db_models.ResourceTombstone.resource_id,
+                db_models.ResourceTombstone.deleted_at, end, batch_size,
+                interval),
+        }
+        deleted['resource'] = self._delete_in_batches(
+            db_models.Resource, db_models.Resource.resource_id,
+            db_models.Resource.created_at, end, batch_size, interval,
+            tombstones=True)
+        return deleted
+
+    def _record_tombstones(self, session, resource_ids):
+        """Report deleted resources in the change feed."""
+        table = db_models.ResourceTombstone.__table__
+        # NOTE: a resource recorded again and expired again replaces its
+        # previous tombstone.
+        session.execute(table.delete().where(
+            table.c.resource_id.in_(resource_ids)))
+        seq = self._next_change_seq(session, len(resource_ids))
+        now = timeutils.utcnow()
+        session.execute(table.insert(), [
+            {'resource_id': resource_id, 'change_seq': seq + i,
+             'deleted_at': now}
+            for i, resource_id in enumerate(resource_ids)])
+
+    @_writes
     def clear(self):
         engine = self._engine_facade.get_engine()
-        for table in reversed(models.Base.metadata.sorted_tables):
-            engine.execute(table.delete())
+        for table in reversed(db_models.Base.metadata.sorted_tables):
+            # NOTE: the change sequence carries on so that a consumer of
+            # the change feed never mistakes new changes for seen ones.
+            if table is not db_models.ChangeSequence.__table__:
+                engine.execute(table.delete())
         self._engine_facade._session_maker.close_all()
         engine.dispose()
 
+    @staticmethod
+    def _next_change_seq(session, count=1):
+        """Reserve change sequence numbers in the current transaction.
+
+        :param session: Session of a transaction changing resources.
+        :param count: Number of sequence numbers to reserve.
+        :returns: The first of the count reserved numbers.
+        """
+        table = db_models.ChangeSequence.__table__
+        now = timeutils.utcnow()
+        result = session.execute(table.update().where(
+            table.c.id == 1).values(value=table.c.value + count,
+                                    updated_at=now))
+        if not result.rowcount:
+            # NOTE: the counter row is created by migration 005, it only
+            # misses from databases created from the models.
+            session.execute(table.insert().values(id=1, value=count,
+                                                  updated_at=now))
+            return 1
+        return session.execute(sqlalchemy.select([table.c.value]).where(
+            table.c.id == 1)).scalar() - count + 1
+
+    @_writes
     def record_resources(self, resource_id, resource_type, resource_meta):
         session = self._engine_facade.get_session()
         with session.begin(subtransactions=True):
-            event = db_models.Resource(resource_id=resource_id,
-                                       resource_type=resource_type,
-                                       resource_metadata=resource_meta)
+            event = db_models.Resource(
+                resource_id=resource_id,
+                resource_type=resource_type,
+                resource_metadata=resource_meta,
+                change_seq=self._next_change_seq(session))
             session.add(event)
             try:
                 session.flush()
@@ -68,15 +508,300 @@ class Connection(object):
         return api_models.Resource(resource_id=resource_id,
                                    resource_type=resource_type,
                                    resource_meta=resource_meta)
-    def get_resources(self, **kwargs):
+
+    @_writes
+    def record_resources_bulk(self, resources):
+        """Record many resources in a single transaction.
+
+        Resources that already exist, either in the database or earlier in
+        the same batch, are reported instead of aborting the whole batch.
+
+        :param resources: An iterable of dicts with resource_id,
+                          resource_type and resource_meta keys.
+        :returns: A list with, for each input item in order, either the
+                  recorded api_models.Resource or a
+                  exception.ResourceAlreadyExists instance.
+        """
+        resources = list(resources)
+        results = [None] * len(resources)
         session = self._engine_facade.get_session()
+        table = db_models.Resource.__table__
+        with session.begin(subtransactions=True):
+            for start in six.moves.range(0, len(resources),
+                                         self.BULK_INSERT_SIZE):
+                chunk = resources[start:start + self.BULK_INSERT_SIZE]
+                ids = set(r['resource_id'] for r in chunk)
+                seen = set(row.resource_id for row in session.query(
+                    db_models.Resource.resource_id).filter(
+                        db_models.Resource.resource_id.in_(ids)))
+                rows = []
+                indexes = []
+                for index, r in enumerate(chunk, start):
+                    if r['resource_id'] in seen:
+                        results[index] = exception.ResourceAlreadyExists(
+                            r['resource_id'])
+                        continue
+                    seen.add(r['resource_id'])
+                    rows.append({'resource_id': r['resource_id'],
+                                 'resource_type': r['resource_type'],
+                                 'resource_metadata': r['resource_meta']})
+                    indexes.append(index)
+                    results[index] = api_models.Resource(
+                        resource_id=r['resource_id'],
+                        resource_type=r['resource_type'],
+                        resource_meta=r['resource_meta'])
+                if rows:
+                    seq = self._next_change_seq(session, len(rows))
+                    for row in rows:
+                        row['change_seq'] = seq
+                        seq += 1
+                    try:
+                        with session.begin_nested():
+                            session.execute(table.insert(), rows)
+                    except db_exception.DBDuplicateEntry:
+                        # NOTE: a concurrent writer inserted some of the
+                        # rows since we looked, insert them one by one to
+                        # tell which.
+                        for index, row in zip(indexes, rows):
+                            try:
+                                with session.begin_nested():
+                                    session.execute(table.insert(), row)
+                            except db_exception.DBDuplicateEntry:
+                                results[index] = (
+                                    exception.ResourceAlreadyExists(
+                                        row['resource_id']))
+        return results
+
+    def get_resource(self, resource_id):
+        """Return the api_models.Resource with this id, or None."""
+        session = self._engine_facade.get_session()
+        row = session.query(db_models.Resource).filter_by(
+            resource_id=resource_id).first()
+        if row is None:
+            return None
+        return api_models.Resource(resource_id=row.resource_id,
+                                   resource_type=row.resource_type,
+                                   resource_meta=row.resource_metadata)
+
+    def get_resources_version(self):
+        """Return a version of the resource collection.
+
+        The version is a (change sequence, last modification time) tuple
+        read from the change sequence row, which is bumped whenever
+        resources are recorded, expired or change HA condition.
+        """
+        session = self._get_read_session()
+        row = session.query(db_models.ChangeSequence.value,
+                            db_models.ChangeSequence.updated_at).filter_by(
+                                id=1).first()
+        if row is None:
+            return 0, None
+        return row.value, row.updated_at
+
+    @_writes
+    def update_ha_condition(self, resource_id, ha_condition):
+        """Set the HA condition of a resource and record the transition.
+
+        :param resource_id: Id of the resource.
+        :param ha_condition: The new HA condition of the resource.
+        :returns: The api_models.History of the transition, or None if the
+                  resource already was in this condition.
+        """
+        session = self._engine_facade.get_session()
+        with session.begin(subtransactions=True):
+            resource = session.query(db_models.Resource).filter_by(
+                resource_id=resource_id).with_for_update().first()
+            if resource is None:
+                raise exception.ResourceNotFound(resource_id)
+            previous = resource.ha_condition
+            if previous == ha_condition:
+                return None
+            resource.ha_condition = ha_condition
+            resource.change_seq = self._next_change_seq(session)
+            now = timeutils.utcnow()
+            history = db_models.History(day=_day(now),
+                                        resource_id=resource_id,
+                                        previous_ha_condition=previous,
+                                        ha_condition=ha_condition,
+                                        timestamp=now)
+            session.add(history)
+            session.flush()
+        return api_models.History(id=history.id,
+                                  resource_id=resource_id,
+                                  previous_ha_condition=previous,
+                                  ha_condition=ha_condition,
+                                  timestamp=now)
+
+    def get_history(self, resource_id=None, start_timestamp=None,
+                    end_timestamp=None, limit=None, marker=None):
+        """Return an iterable of api_models.History instances.
+
+        Transitions are returned in the order they were recorded.  Time
+        range filters also bound the day column, so that MySQL only reads
+        the partitions of the days in the range.  Timestamps stored as
+        integer microseconds are converted a page of rows at a time.
+
+        :param resource_id: Optional resource id.
+        :param start_timestamp: Optional earliest transition time
+                                (inclusive).
+        :param end_timestamp: Optional latest transition time (exclusive).
+        :param limit: Maximum number of transitions to return.
+        :param marker: id of the last transition of the previous page, only
+                       transitions recorded after it are returned.
+        """
+        session = self._get_read_session()
+        # NOTE: read the raw microseconds, see utils.us_to_dts().
+        raw = db_models.PreciseTimestamp.stores_microseconds(
+            self._engine_facade.get_engine().dialect)
+        timestamp = db_models.History.timestamp
+        if raw:
+            timestamp = sqlalchemy.type_coerce(timestamp,
+                                               sqlalchemy.BigInteger)
+        query = session.query(db_models.History.id,
+                              db_models.History.resource_id,
+                              db_models.History.previous_ha_condition,
+                              db_models.History.ha_condition,
+                              timestamp.label('timestamp'))
+        if resource_id is not None:
+            query = query.filter(
+                db_models.History.resource_id == resource_id)
+        if start_timestamp:
+            query = query.filter(
+                db_models.History.day >= _day(start_timestamp),
+                db_models.History.timestamp >= start_timestamp)
+        if end_timestamp:
+            query = query.filter(
+                db_models.History.day <= _day(end_timestamp),
+                db_models.History.timestamp < end_timestamp)
+        if marker is not None:
+            query = query.filter(db_models.History.id > marker)
+        query = query.order_by(db_models.History.id)
+        if limit is not None:
+            query = query.limit(limit)
+        rows = iter(query.yield_per(self.YIELD_PER))
+        while True:
+            page = list(itertools.islice(rows, self.YIELD_PER))
+            if not page:
+                break
+            timestamps = [row.timestamp for row in page]
+            if raw:
+                timestamps = utils.us_to_dts(timestamps)
+            for row, timestamp in zip(page, timestamps):
+                yield api_models.History(
+                    id=row.id,
+                    resource_id=row.resource_id,
+                    previous_ha_condition=row.previous_ha_condition,
+                    ha_condition=row.ha_condition,
+                    timestamp=timestamp)
+
+    def get_resources(self, limit=None, marker=None, resource_type=None,
+                      project_id=None, user_id=None, ha_condition=None,
+                      start_timestamp=None, end_timestamp=None):
+        """Return an iterable of api_models.Resource instances.
+
+        Resources are returned ordered by resource_id so that callers can
+        page through the table using keyset pagination.
+
+        :param limit: Maximum number of resources to return.
+        :param marker: resource_id of the last resource of the previous
+                       page, only resources sorting after it are returned.
+        :param resource_type: Optional resource type.
+        :param project_id: Optional project id.
+        :param user_id: Optional user id.
+        :param ha_condition: Optional HA condition.
+        :param start_timestamp: Optional earliest creation time (inclusive).
+        :param end_timestamp: Optional latest creation time (exclusive).
+        """
+        session = self._get_read_session()
         query = session.query(db_models.Resource.resource_id,
                               db_models.Resource.resource_type,
                               db_models.Resource.user_id,
                               db_models.Resource.project_id,
                               db_models.Resource.ha_condition,
-                              db_models.Resource.resource_metadata)
-        for row in query.all():
-            yield api_models.Resource(resource_id=row.resource_id,
-                                      resource_type=row.resource_type,
-                                      resource_meta=row.resource_metadata)
+                              # NOTE: fetch the raw JSON, the metadata is
+                              # only decoded if the caller uses it.
+                              sqlalchemy.type_coerce(
+                                  db_models.Resource.resource_metadata,
+                                  sqlalchemy.String).label(
+                                      'resource_metadata'))
+        query = make_query_from_filter(query,
+                                       resource_type=resource_type,
+                                       project_id=project_id,
+                                       user_id=user_id,
+                                       ha_condition=ha_condition,
+                                       start_timestamp=start_timestamp,
+                                       end_timestamp=end_timestamp)
+        if marker is not None:
+            query = query.filter(db_models.Resource.resource_id > marker)
+        query = query.order_by(db_models.Resource.resource_id)
+        if limit is not None:
+            query = query.limit(limit)
+        # NOTE: yield_per() streams the result set from the server in
+        # chunks instead of materializing every row in memory up front.
+        for row in query.yield_per(self.YIELD_PER):
+            meta = row.resource_metadata
+            yield api_models.Resource(
+                resource_id=row.resource_id,
+                resource_type=row.resource_type,
+                resource_meta=None if meta is None else utils.LazyJSON(meta))
+
+    def get_changes_since(self, seq=0, limit=None):
+        """Return an iterable of api_models.Change instances.
+
+        Resources which were recorded, changed HA condition or expired
+        after a sequence number are returned in sequence order, each one
+        with the number of its latest change.  Following the sequence lets
+        callers track the resource table in O(changes) instead of listing
+        it.  Expired resources are reported as deleted until their
+        tombstone expires in turn, a caller lagging further behind than the
+        time to live has to start over from 0.
+
+        :param seq: Sequence number of the last change already seen, 0 to
+                    get every resource.
+        :param limit: Maximum number of changes to return.
+        """
+        resource = db_models.Resource.__table__
+        tombstone = db_models.ResourceTombstone.__table__
+        changed = sqlalchemy.select([
+            resource.c.change_seq.label('change_seq'),
+            resource.c.resource_id.label('resource_id'),
+            resource.c.resource_type.label('resource_type'),
+            sqlalchemy.type_coerce(resource.c.resource_metadata,
+                                   sqlalchemy.String).label(
+                                       'resource_metadata'),
+            sqlalchemy.literal_column('0').label('deleted'),
+        ]).where(resource.c.change_seq > seq)
+        deleted = sqlalchemy.select([
+            tombstone.c.change_seq.label('change_seq'),
+            tombstone.c.resource_id.label('resource_id'),
+            sqlalchemy.null().label('resource_type'),
+            sqlalchemy.null().label('resource_metadata'),
+            sqlalchemy.literal_column('1').label('deleted'),
+        ]).where(tombstone.c.change_seq > seq)
+        if limit is not None:
+            # NOTE: bound both sides, each one reads its change_seq index.
+            changed = changed.order_by(resource.c.change_seq).limit(limit)
+            deleted = deleted.order_by(tombstone.c.change_seq).limit(limit)
+        query = sqlalchemy.union_all(
+            changed.alias().select(), deleted.alias().select()).order_by(
+                sqlalchemy.literal_column('change_seq'))
+        if limit is not None:
+            query = query.limit(limit)
+        session = self._get_read_session()
+        for row in session.execute(query):
+            if row.deleted:
+                yield api_models.Change(
+                    seq=row.change_seq,
+                    resource=api_models.Resource(resource_id=row.resource_id,
+                                                 resource_type=None,
+                                                 resource_meta=None),
+                    deleted=True)
+                continue
+            meta = row.resource_metadata
+            yield api_models.Change(
+                seq=row.change_seq,
+                resource=api_models.Resource(
+                    resource_id=row.resource_id,
+                    resource_type=row.resource_type,
+                    resource_meta=(None if meta is None
+                                   else utils.LazyJSON(meta))))
@@ -0,0 +1,60 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from sqlalchemy import BigInteger
+from sqlalchemy import Column
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import String
+from sqlalchemy import Table
+from entropy.db.sqlalchemy import models as db_models
+
+
+def upgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+
+    history = Table(
+        'history', meta,
+        Column('id', BigInteger().with_variant(Integer, 'sqlite'),
+               primary_key=True),
+        Column('day', Integer, nullable=False),
+        Column('resource_id', String(255), nullable=False),
+        Column('previous_ha_condition', String(255)),
+        Column('ha_condition', String(255)),
+        Column('timestamp', db_models.PreciseTimestamp(), nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    history.create()
+    Index('ix_history_resource_id_id',
+          history.c.resource_id, history.c.id).create(bind=migrate_engine)
+    Index('ix_history_timestamp',
+          history.c.timestamp).create(bind=migrate_engine)
+
+    if migrate_engine.name == 'mysql':
+        # NOTE: MySQL requires the partitioning column to be part of every
+        # unique key. Daily partitions are split out of pmax ahead of time
+        # by Connection.prepare_history_partitions().
+        migrate_engine.execute(
+            'ALTER TABLE history '
+            'DROP PRIMARY KEY, ADD PRIMARY KEY (id, day) '
+            'PARTITION BY RANGE (day) '
+            '(PARTITION pmax VALUES LESS THAN MAXVALUE)')
+
+
+def downgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    history = Table('history', meta, autoload=True)
+    history.drop()
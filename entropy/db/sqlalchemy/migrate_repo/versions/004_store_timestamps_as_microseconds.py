@@ -0,0 +1,56 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Let MySQL store timestamps as BIGINT microseconds.
+
+The storage follows the database/mysql_timestamp_storage option rather
+than the schema version, so the columns are converted by
+Connection.upgrade() after the migrations, which also happens whenever the
+option changes.  The downgrade restores the DECIMAL(20,6) columns older
+versions expect.
+"""
+
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import Table
+
+
+COLUMNS = (('resource', 'created_at', False), ('history', 'timestamp', True))
+
+
+def _is_integer(migrate_engine, table, column):
+    meta = MetaData(bind=migrate_engine)
+    return isinstance(Table(table, meta, autoload=True).c[column].type,
+                      Integer)
+
+
+def upgrade(migrate_engine):
+    pass
+
+
+def downgrade(migrate_engine):
+    if migrate_engine.name != 'mysql':
+        return
+    for table, column, not_null in COLUMNS:
+        if not _is_integer(migrate_engine, table, column):
+            continue
+        null = ' NOT NULL' if not_null else ''
+        # NOTE: DECIMAL(20,6) can't hold the value in microseconds, widen
+        # it before scaling.
+        migrate_engine.execute('ALTER TABLE %s MODIFY `%s` DECIMAL(26, 6)%s'
+                               % (table, column, null))
+        migrate_engine.execute('UPDATE %s SET `%s` = `%s` / 1000000'
+                               % (table, column, column))
+        migrate_engine.execute('ALTER TABLE %s MODIFY `%s` DECIMAL(20, 6)%s'
+                               % (table, column, null))
@@ -0,0 +1,75 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Number resource changes with a monotonically increasing sequence.
+
+Existing resources are numbered in resource_id order and the counter
+starts after them.
+"""
+
+from sqlalchemy import BigInteger
+from sqlalchemy import Column
+from sqlalchemy import func
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import select
+from sqlalchemy import Table
+
+
+INDEX_NAME = 'ix_resource_change_seq'
+
+
+def upgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    resource = Table('resource', meta, autoload=True)
+    resource.create_column(Column('change_seq', BigInteger))
+
+    if migrate_engine.name == 'mysql':
+        with migrate_engine.begin() as conn:
+            conn.execute('SET @seq := 0')
+            conn.execute('UPDATE resource SET change_seq = (@seq := @seq + 1) '
+                         'ORDER BY resource_id')
+    else:
+        ids = [row[0] for row in migrate_engine.execute(
+            select([resource.c.resource_id]).order_by(
+                resource.c.resource_id))]
+        for seq, resource_id in enumerate(ids, 1):
+            migrate_engine.execute(resource.update().where(
+                resource.c.resource_id == resource_id).values(
+                    change_seq=seq))
+    Index(INDEX_NAME, resource.c.change_seq,
+          unique=True).create(bind=migrate_engine)
+
+    change_sequence = Table(
+        'change_sequence', meta,
+        Column('id', Integer, primary_key=True, autoincrement=False),
+        Column('value', BigInteger, nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    change_sequence.create()
+    last = migrate_engine.execute(
+        select([func.max(resource.c.change_seq)])).scalar()
+    migrate_engine.execute(change_sequence.insert().values(
+        id=1, value=last or 0))
+
+
+def downgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    Table('change_sequence', meta, autoload=True).drop()
+    resource = Table('resource', meta, autoload=True)
+    Index(INDEX_NAME, resource.c.change_seq,
+          unique=True).drop(bind=migrate_engine)
+    resource.drop_column('change_seq')
@@ -0,0 +1,40 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Record the time of the last resource change with the change sequence.
+
+The existing counter row is stamped with the time of the migration, as
+the time of the last deletion is unknown.
+"""
+
+from oslo.utils import timeutils
+from sqlalchemy import Column
+from sqlalchemy import MetaData
+from sqlalchemy import Table
+
+from entropy.db.sqlalchemy import models as db_models
+
+
+def upgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    change_sequence = Table('change_sequence', meta, autoload=True)
+    change_sequence.create_column(Column('updated_at',
+                                         db_models.PreciseTimestamp()))
+    migrate_engine.execute(change_sequence.update().values(
+        updated_at=timeutils.utcnow()))
+
+
+def downgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    Table('change_sequence', meta, autoload=True).drop_column('updated_at')
@@ -0,0 +1,46 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Report the resources deleted by the expirer in the change feed."""
+
+from sqlalchemy import BigInteger
+from sqlalchemy import Column
+from sqlalchemy import Index
+from sqlalchemy import MetaData
+from sqlalchemy import String
+from sqlalchemy import Table
+
+from entropy.db.sqlalchemy import models as db_models
+
+
+def upgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    tombstone = Table(
+        'resource_tombstone', meta,
+        Column('resource_id', String(255), primary_key=True),
+        Column('change_seq', BigInteger, nullable=False),
+        Column('deleted_at', db_models.PreciseTimestamp(), nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    tombstone.create()
+    Index('ix_resource_tombstone_change_seq', tombstone.c.change_seq,
+          unique=True).create(bind=migrate_engine)
+    Index('ix_resource_tombstone_deleted_at',
+          tombstone.c.deleted_at).create(bind=migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    Table('resource_tombstone', meta, autoload=True).drop()
@@ -13,7 +13,6 @@
 
 from __future__ import absolute_import
 import sqlalchemy
-import json
 import six
 
 from oslo.db.sqlalchemy import migration
@@ -25,7 +24,7 @@ from oslo.utils import timeutils
 from oslo.db.sqlalchemy import models
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.types import TypeDecorator
-from sqlalchemy import Float, Boolean, Text, DateTime
+from sqlalchemy import Float, Boolean, Text, DateTime, BigInteger
 from sqlalchemy.dialects.mysql import DECIMAL
 from oslo.utils import timeutils
 from entropy import utils
@@ -50,28 +49,51 @@ Base = declarative_base()
 
 
 class JSONEncodedDict(TypeDecorator):
-    """Represents an immutable structure as a json-encoded string."""
+    """Represents an immutable structure as a json-encoded string.
+
+    Documents are encoded with the library selected by
+    utils.set_json_codec().
+    """
 
     impl = sqlalchemy.String
 
     def process_bind_param(self, value, dialect):
         if value is not None:
-            value = json.dumps(value)
+            value = utils.json_dumps(value)
         return value
 
     def process_result_value(self, value, dialect):
         if value is not None:
-            value = json.loads(value)
+            value = utils.json_loads(value)
         return value
 
 
 class PreciseTimestamp(TypeDecorator):
-    """Represents a timestamp precise to the microsecond."""
+    """Represents a timestamp precise to the microsecond.
+
+    MySQL stores it as DECIMAL(20,6) seconds or, depending on the
+    database/mysql_timestamp_storage option, as an integer number of
+    microseconds since the epoch, which is compact, indexes well and
+    converts without going through Decimal.
+    """
 
     impl = DateTime
 
+    @staticmethod
+    def stores_microseconds(dialect):
+        """Whether values are stored as integer microseconds."""
+        if dialect.name != 'mysql':
+            return False
+        storage = cfg.CONF.database.mysql_timestamp_storage
+        if storage not in ('decimal', 'integer'):
+            raise ValueError('database/mysql_timestamp_storage must be '
+                             'decimal or integer, not %s' % storage)
+        return storage == 'integer'
+
     def load_dialect_impl(self, dialect):
-        if dialect.name == 'mysql':
+        if self.stores_microseconds(dialect):
+            return dialect.type_descriptor(BigInteger())
+        elif dialect.name == 'mysql':
             return dialect.type_descriptor(DECIMAL(precision=20,
                                                    scale=6,
                                                    asdecimal=True))
@@ -80,6 +102,8 @@ class PreciseTimestamp(TypeDecorator):
     def process_bind_param(self, value, dialect):
         if value is None:
             return value
+        elif self.stores_microseconds(dialect):
+            return utils.dt_to_us(value)
         elif dialect.name == 'mysql':
             return utils.dt_to_decimal(value)
         return value
@@ -87,6 +111,8 @@ class PreciseTimestamp(TypeDecorator):
     def process_result_value(self, value, dialect):
         if value is None:
             return value
+        elif self.stores_microseconds(dialect):
+            return utils.us_to_dt(value)
         elif dialect.name == 'mysql':
             return utils.decimal_to_dt(value)
         return value
@@ -94,6 +120,13 @@ class PreciseTimestamp(TypeDecorator):
 
 class Resource(Base, entropyBase):
     __tablename__ = 'resource'
+    __table_args__ = (
+        sqlalchemy.Index('ix_resource_ha_condition_resource_type',
+                         'ha_condition', 'resource_type'),
+        sqlalchemy.Index('ix_resource_change_seq', 'change_seq',
+                         unique=True),
+        entropyBase.__table_args__,
+    )
 
     resource_id = sqlalchemy.Column(sqlalchemy.String(255), primary_key=True)
     resource_type = sqlalchemy.Column(sqlalchemy.String(255), nullable=False)
@@ -103,8 +136,69 @@ class Resource(Base, entropyBase):
     created_at = sqlalchemy.Column(PreciseTimestamp,
                                    default=lambda: timeutils.utcnow())
     resource_metadata = sqlalchemy.Column(JSONEncodedDict)
+    # Sequence number of the last change of the resource, see
+    # ChangeSequence.
+    change_seq = sqlalchemy.Column(sqlalchemy.BigInteger)
+
+
+class ChangeSequence(Base, entropyBase):
+    """The single row counter numbering resource changes.
+
+    Writers increment it in the transaction changing a resource, which
+    keeps the row locked until commit, so that sequence numbers become
+    visible in increasing order and a reader following the sequence never
+    misses a change committed late.
+    """
+
+    __tablename__ = 'change_sequence'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True,
+                           autoincrement=False)
+    value = sqlalchemy.Column(sqlalchemy.BigInteger, nullable=False)
+    # Time of the last change, deletions included.
+    updated_at = sqlalchemy.Column(PreciseTimestamp)
+
+
+class ResourceTombstone(Base, entropyBase):
+    """A resource deleted by the expirer, as reported by the change feed.
+
+    The tombstone takes a change sequence number like any other change, and
+    is deleted in turn once older than the time to live.
+    """
+
+    __tablename__ = 'resource_tombstone'
+    __table_args__ = (
+        sqlalchemy.Index('ix_resource_tombstone_change_seq', 'change_seq',
+                         unique=True),
+        sqlalchemy.Index('ix_resource_tombstone_deleted_at', 'deleted_at'),
+        entropyBase.__table_args__,
+    )
+
+    resource_id = sqlalchemy.Column(sqlalchemy.String(255), primary_key=True)
+    change_seq = sqlalchemy.Column(sqlalchemy.BigInteger, nullable=False)
+    deleted_at = sqlalchemy.Column(PreciseTimestamp, nullable=False)
 
 
 class History(Base, entropyBase):
+    """An append-only log of the HA condition transitions of resources.
+
+    Rows carry the day they were recorded on, counted from the epoch, so
+    that the table can be partitioned by day on MySQL and history queries
+    on a time range only read the partitions covering it.
+    """
+
     __tablename__ = 'history'
-    id = sqlalchemy.Column(sqlalchemy.String(255), primary_key=True)
+    __table_args__ = (
+        sqlalchemy.Index('ix_history_resource_id_id', 'resource_id', 'id'),
+        sqlalchemy.Index('ix_history_timestamp', 'timestamp'),
+        entropyBase.__table_args__,
+    )
+
+    id = sqlalchemy.Column(
+        sqlalchemy.BigInteger().with_variant(sqlalchemy.Integer, 'sqlite'),
+        primary_key=True)
+    day = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    resource_id = sqlalchemy.Column(sqlalchemy.String(255), nullable=False)
+    previous_ha_condition = sqlalchemy.Column(sqlalchemy.String(255))
+    ha_condition = sqlalchemy.Column(sqlalchemy.String(255))
+    timestamp = sqlalchemy.Column(PreciseTimestamp, nullable=False)
@@ -17,4 +17,12 @@ class ResourceAlreadyExists(Exception):
     def __init__(self, resource):
         super(ResourceAlreadyExists, self).__init__(
             "Resource %s already exists" % resource)
-        self.resource = resource
\ No newline at end of file
+        self.resource = resource
+
+
+class ResourceNotFound(Exception):
+    """Error raised when a resource does not exist."""
+    def __init__(self, resource):
+        super(ResourceNotFound, self).__init__(
+            "Resource %s not found" % resource)
+        self.resource = resource
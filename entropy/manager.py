@@ -11,18 +11,88 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-from entropy.openstack.common import service as os_service
-from entropy.openstack.common import log
+import random
+
+import eventlet
+from oslo.config import cfg
+import six
 from stevedore import extension
-import time
+
+from entropy import coordination
+from entropy import db
+from entropy import exception
+from entropy.openstack.common.gettextutils import _LE, _LW
+from entropy.openstack.common import log
+from entropy.openstack.common import service as os_service
+from entropy.openstack.common import threadgroup
 
 LOG = log.getLogger(__name__)
 
+OPTS = [
+    cfg.IntOpt('interval',
+               default=60,
+               help='Number of seconds between two refreshes of the '
+                    'resources monitored by an agent.'),
+    cfg.StrOpt('partitioning_group_prefix',
+               help='Work-load partitioning group prefix. Use only if you '
+                    'want to run multiple groups of agents monitoring '
+                    'disjoint sets of resources.'),
+    cfg.IntOpt('replicas',
+               default=1,
+               help='Number of agents of the partitioning group monitoring '
+                    'each resource, so that a resource stays monitored '
+                    'while one of its agents fails.'),
+    cfg.IntOpt('poll_interval',
+               default=10,
+               help='Default number of seconds between two checks of a '
+                    'resource by a pollster.'),
+    cfg.FloatOpt('poll_timeout',
+                 default=5.0,
+                 help='Number of seconds after which a check of a resource '
+                      'by a pollster is abandoned.'),
+    cfg.IntOpt('poll_threads',
+               default=100,
+               help='Maximum number of resource checks running '
+                    'concurrently per pollster on an agent, further checks '
+                    'are skipped until the next round.'),
+]
+cfg.CONF.register_opts(OPTS, group='agent')
+
 
 class AgentManager(os_service.Service):
+    """Monitor the share of the resources assigned to this agent.
+
+    Agents join a tooz group and split the resources between the live
+    members with a hash ring on the resource ids, so that every resource
+    is monitored by agent/replicas agents and adding agents spreads the
+    load.
+    The pollster plugins of the namespace check these resources each one
+    on its own schedule and bounded pool of green threads, so that a slow
+    backend never delays the checks of the other pollsters.
+    """
 
     def __init__(self, namespace, default_discovery=None, group_prefix=None):
         super(AgentManager, self).__init__()
+        self.namespace = namespace
+        self.default_discovery = default_discovery or []
+        self.group_prefix = group_prefix
+        self.partition_coordinator = coordination.PartitionCoordinator()
+        self.db_conn = None
+        self.resources = []
+        # All the resources by id, kept up to date with the change feed
+        self._known_resources = {}
+        self._change_seq = 0
+        self.pollsters = []
+        # Thread groups running the checks, by pollster name
+        self.poll_tgs = {}
+        # (pollster, resource_id) pairs whose check is still running
+        self._inflight = set()
+
+    @property
+    def group_id(self):
+        if self.group_prefix:
+            return '%s-%s' % (self.group_prefix, self.namespace)
+        return self.namespace
 
     @staticmethod
     def _extensions(category, agent_ns=None):
@@ -33,13 +103,108 @@ class AgentManager(os_service.Service):
             invoke_on_load=True,
         )
 
-    def start(self):
-        self._test_db()
-        while True:
-            LOG.error('just test!!!')
-            time.sleep(5)
+    def refresh_resources(self):
+        """Update the list of resources assigned to this agent.
+
+        Only the resources changed since the previous refresh are read
+        from the database, expired ones are forgotten.
+        """
+        for change in self.db_conn.get_changes_since(self._change_seq):
+            if change.deleted:
+                self._known_resources.pop(change.resource.resource_id, None)
+            else:
+                self._known_resources[change.resource.resource_id] = (
+                    change.resource)
+            self._change_seq = change.seq
+        self.resources = self.partition_coordinator.extract_my_subset(
+            self.group_id, six.itervalues(self._known_resources),
+            key=lambda r: r.resource_id, replicas=cfg.CONF.agent.replicas)
+        LOG.debug('Monitoring %d resources', len(self.resources))
 
+    def poll_resource(self, pollster, resource):
+        """Run a pollster on a resource and record the HA condition."""
+        key = (pollster.name, resource.resource_id)
+        timeout = eventlet.Timeout(cfg.CONF.agent.poll_timeout)
+        try:
+            condition = pollster.obj.poll(self, resource)
+            if condition is not None:
+                self.db_conn.update_ha_condition(resource.resource_id,
+                                                 condition)
+        except eventlet.Timeout as e:
+            if e is not timeout:
+                raise
+            LOG.warning(_LW('Pollster %(name)s timed out checking '
+                            'resource %(resource)s'),
+                        {'name': pollster.name,
+                         'resource': resource.resource_id})
+        except exception.ResourceNotFound:
+            LOG.debug('Resource %s disappeared while being checked',
+                      resource.resource_id)
+            self._known_resources.pop(resource.resource_id, None)
+        except Exception:
+            LOG.exception(_LE('Pollster %(name)s failed checking resource '
+                              '%(resource)s'),
+                          {'name': pollster.name,
+                           'resource': resource.resource_id})
+        finally:
+            timeout.cancel()
+            self._inflight.discard(key)
 
+    def poll(self, pollster):
+        """Check the resources assigned to this agent with a pollster.
+
+        Checks are run on the bounded thread group of the pollster and not
+        waited for. A resource whose previous check by the same pollster is
+        still running is skipped, and so are the resources left once the
+        thread group is full, so that a slow backend never piles up checks
+        nor blocks the timers.
+        """
+        tg = self.poll_tgs[pollster.name]
+        skipped = busy = 0
+        for resource in self.resources:
+            key = (pollster.name, resource.resource_id)
+            if key in self._inflight:
+                skipped += 1
+                continue
+            if not tg.pool.free():
+                busy += 1
+                continue
+            self._inflight.add(key)
+            tg.add_thread(self.poll_resource, pollster, resource)
+        if skipped or busy:
+            LOG.warning(_LW('Pollster %(name)s skipped %(skipped)d resources '
+                            'still being checked and %(busy)d resources for '
+                            'lack of free threads'),
+                        {'name': pollster.name, 'skipped': skipped,
+                         'busy': busy})
+
+    def start(self):
+        self.db_conn = db.get_connection_from_config(cfg.CONF)
+        self.partition_coordinator.start()
+        self.partition_coordinator.join_group(self.group_id)
 
+        if self.partition_coordinator.is_active():
+            self.tg.add_timer(cfg.CONF.coordination.heartbeat,
+                              self.partition_coordinator.heartbeat)
+            self.tg.add_timer(cfg.CONF.coordination.check_watchers,
+                              self.partition_coordinator.run_watchers)
+        self.refresh_resources()
+        self.tg.add_timer(cfg.CONF.agent.interval, self.refresh_resources,
+                          cfg.CONF.agent.interval)
 
+        self.pollsters = list(self._extensions('poll', self.namespace))
+        for pollster in self.pollsters:
+            self.poll_tgs[pollster.name] = threadgroup.ThreadGroup(
+                cfg.CONF.agent.poll_threads)
+            interval = (getattr(pollster.obj, 'interval', None) or
+                        cfg.CONF.agent.poll_interval)
+            # NOTE: start each pollster at a random point of its interval
+            # so that pollsters and agents don't all hit backends at once.
+            self.tg.add_timer(interval, self.poll,
+                              random.uniform(0, interval), pollster)
 
+    def stop(self):
+        for tg in self.poll_tgs.values():
+            tg.stop()
+        self.partition_coordinator.stop()
+        super(AgentManager, self).stop()
@@ -27,6 +27,7 @@ It also allows setting of formatting information through conf.
 
 """
 
+import collections
 import inspect
 import itertools
 import logging
@@ -35,12 +36,20 @@ import logging.handlers
 import os
 import socket
 import sys
+import threading
+import time
 import traceback
+import weakref
 
 from oslo.config import cfg
 import six
 from six import moves
 
+try:
+    from eventlet import patcher as eventlet_patcher
+except ImportError:
+    eventlet_patcher = None
+
 _PY26 = sys.version_info[0:2] == (2, 6)
 
 from entropy.openstack.common.gettextutils import _
@@ -169,6 +178,41 @@ log_opts = [
                default='[instance: %(uuid)s] ',
                help='The format for an instance UUID that is passed with the '
                     'log message.'),
+    cfg.BoolOpt('use_async_logging',
+                default=False,
+                help='Format and write log records from a background thread '
+                     'in batches, so that logging never blocks the code '
+                     'emitting records.'),
+    cfg.IntOpt('async_log_queue_size',
+               default=10000,
+               help='Maximum number of log records waiting to be written '
+                    'when use_async_logging is enabled, further records '
+                    'are dropped.'),
+    cfg.IntOpt('async_log_batch_size',
+               default=100,
+               help='Maximum number of log records written at once when '
+                    'use_async_logging is enabled.'),
+    cfg.IntOpt('async_log_sample_rate',
+               default=10,
+               help='Once the queue of log records is half full, only one '
+                    'in this many records below WARNING is kept.'),
+    cfg.IntOpt('rate_limit_interval',
+               default=0,
+               help='Interval in seconds over which at most '
+                    'rate_limit_burst records are logged for each logger '
+                    'and message, 0 disables rate limiting.'),
+    cfg.IntOpt('rate_limit_burst',
+               default=100,
+               help='Maximum number of records logged for each logger and '
+                    'message per rate_limit_interval.'),
+    cfg.IntOpt('rate_limit_sample_rate',
+               default=0,
+               help='Keep one in this many of the records exceeding the '
+                    'rate limit, 0 suppresses them all.'),
+    cfg.StrOpt('rate_limit_except_level',
+               default='CRITICAL',
+               help='Records of this level and above are never rate '
+                    'limited, an empty value limits all levels.'),
 ]
 
 CONF = cfg.CONF
@@ -206,6 +250,38 @@ def _dictify_context(context):
     return context
 
 
+# Dicts of the request contexts, computed once per context by
+# _get_context_dict() instead of once per record.
+_context_dicts = weakref.WeakKeyDictionary()
+
+
+def _get_context_dict(context):
+    if isinstance(context, dict):
+        return context
+    try:
+        d = _context_dicts.get(context)
+        if d is None:
+            d = _context_dicts[context] = _dictify_context(context)
+        return d
+    except TypeError:
+        # Neither hashable nor weakly referenceable.
+        return _dictify_context(context)
+
+
+# Bumped by reset_cached_config() to invalidate the configuration cached by
+# the formatters.
+_config_generation = 0
+
+
+def reset_cached_config():
+    """Make formatters read the logging options again.
+
+    Called after the configuration files are reloaded.
+    """
+    global _config_generation
+    _config_generation += 1
+
+
 def _get_binary_name():
     return os.path.basename(inspect.stack()[-1][1])
 
@@ -317,7 +393,7 @@ class ContextAdapter(BaseLoggerAdapter):
         if not context:
             context = getattr(local.store, 'context', None)
         if context:
-            extra.update(_dictify_context(context))
+            extra.update(_get_context_dict(context))
 
         instance = kwargs.pop('instance', None)
         instance_uuid = (extra.get('instance_uuid') or
@@ -437,6 +513,7 @@ def set_defaults(logging_context_format_string=None,
         cfg.set_defaults(
             log_opts,
             logging_context_format_string=logging_context_format_string)
+        reset_cached_config()
 
 
 def _find_facility_from_conf():
@@ -480,10 +557,302 @@ class RFCSysLogHandler(logging.handlers.SysLogHandler):
         return msg
 
 
+def _native_module(name):
+    """Return a standard library module as it was before monkey patching."""
+    if (eventlet_patcher is not None and
+            eventlet_patcher.is_monkey_patched('thread')):
+        return eventlet_patcher.original(name)
+    return importutils.import_module(name)
+
+
+class AsyncHandler(logging.Handler):
+    """Hand log records over to a background thread writing them.
+
+    emit() only stores the context of the caller on the record and queues
+    it, the worker thread formats the records and writes them to the
+    wrapped handlers by batches, with a single write and flush per batch
+    for stream and file handlers.
+
+    The worker is an operating system thread even in processes monkey
+    patched by eventlet, so that formatting and blocking writes never
+    stall the green threads of the caller.  The wrapped handlers are only
+    used by the worker and get native locks for that reason.
+
+    Under overload records are shed instead of blocking the caller: once
+    the queue is half full only one in sample_rate records below WARNING
+    is kept, and records are dropped while it is full.  The number of shed
+    records is logged by the worker once it catches up.
+
+    :param handlers: The handlers the records are written to.
+    :param queue_size: Maximum number of records waiting to be written.
+    :param batch_size: Maximum number of records written at once.
+    :param sample_rate: Keep one in this many records below WARNING once
+                        the queue is half full.
+    """
+
+    def __init__(self, handlers, queue_size=10000, batch_size=100,
+                 sample_rate=10):
+        logging.Handler.__init__(self)
+        self.handlers = handlers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.sample_rate = max(sample_rate, 1)
+        self.queued = 0
+        self.sampled = 0
+        self.dropped = 0
+        self._sample_count = 0
+        self._shed_reported = 0
+        self._pid = None
+        self._queue_module = None
+        self._queue = None
+        self._thread = None
+
+    def _start(self):
+        # NOTE: the worker thread doesn't survive a fork, the children
+        # start their own on their first record.
+        self._pid = os.getpid()
+        native_threading = _native_module('threading')
+        self._queue_module = _native_module('Queue' if six.PY2 else 'queue')
+        for handler in self.handlers:
+            handler.lock = native_threading.RLock()
+        self._queue = self._queue_module.Queue(self.queue_size)
+        self._thread = native_threading.Thread(target=self._run,
+                                               args=(self._queue,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            # The worker doesn't see the caller's context, store it on the
+            # record as ContextFormatter would. Formatting the message
+            # also makes the record independent of mutable arguments.
+            context = getattr(local.store, 'context', None)
+            if context:
+                for k, v in _dictify_context(context).items():
+                    setattr(record, k, v)
+            record.msg = record.getMessage()
+            record.args = None
+        except Exception:
+            self.handleError(record)
+            return
+
+        if (record.levelno < logging.WARNING and
+                self._queue.qsize() >= self.queue_size // 2):
+            self._sample_count += 1
+            if self._sample_count % self.sample_rate:
+                self.sampled += 1
+                return
+        try:
+            self._queue.put_nowait(record)
+            self.queued += 1
+        except self._queue_module.Full:
+            self.dropped += 1
+
+    def _shed_record(self):
+        shed = self.sampled + self.dropped
+        if shed == self._shed_reported:
+            return None
+        self._shed_reported = shed
+        return logging.makeLogRecord({
+            'name': __name__,
+            'levelno': logging.WARNING,
+            'levelname': logging.getLevelName(logging.WARNING),
+            'msg': _('Logging overloaded, %(sampled)d records sampled out '
+                     'and %(dropped)d dropped so far') % {
+                         'sampled': self.sampled, 'dropped': self.dropped},
+        })
+
+    @staticmethod
+    def _can_batch(handler):
+        # NOTE: WatchedFileHandler only checks whether its file was
+        # rotated in emit() on Python 2.
+        return isinstance(handler, logging.StreamHandler) and (
+            hasattr(handler, 'reopenIfNeeded') or
+            not isinstance(handler, logging.handlers.WatchedFileHandler))
+
+    def _write(self, handler, records):
+        records = [r for r in records if r.levelno >= handler.level]
+        if not self._can_batch(handler):
+            for record in records:
+                handler.handle(record)
+            return
+        lines = []
+        for record in records:
+            if not handler.filter(record):
+                continue
+            try:
+                lines.append(handler.format(record) + '\n')
+            except Exception:
+                handler.handleError(record)
+        if not lines:
+            return
+        handler.acquire()
+        try:
+            if hasattr(handler, 'reopenIfNeeded'):
+                handler.reopenIfNeeded()
+            handler.stream.write(''.join(lines))
+            handler.flush()
+        except Exception:
+            handler.handleError(records[-1])
+        finally:
+            handler.release()
+
+    def _run(self, queue):
+        while True:
+            records = [queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(queue.get_nowait())
+                except self._queue_module.Empty:
+                    break
+            stop = None in records
+            records = [r for r in records if r is not None]
+            shed = self._shed_record() if queue.empty() else None
+            if shed is not None:
+                records.append(shed)
+            for handler in self.handlers:
+                self._write(handler, records)
+            if stop:
+                return
+
+    def get_stats(self):
+        return {'queued': self.queued,
+                'sampled': self.sampled,
+                'dropped': self.dropped,
+                'pending': self._queue.qsize() if self._queue else 0}
+
+    def close(self):
+        """Write the queued records and stop the worker thread."""
+        if self._pid == os.getpid() and self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(5)
+            self._thread = None
+        self._pid = None
+        for handler in self.handlers:
+            handler.close()
+        logging.Handler.close(self)
+
+
+class RateLimitFilter(logging.Filter):
+    """Rate limit the records of each logger and message.
+
+    Records are grouped by logger name and message template, before
+    interpolation of their arguments, and every group has a token bucket
+    allowing burst records per interval.  Records exceeding the limit are
+    suppressed, except one in sample_rate if set, and the number suppressed
+    is appended to the next record of the group logged.
+
+    An instance may filter several handlers, a record is only counted once.
+
+    :param interval: Number of seconds over which burst records are allowed.
+    :param burst: Maximum number of records per interval and group.
+    :param sample_rate: Keep one in this many records exceeding the limit,
+                        0 suppresses them all.
+    :param except_level: Records of this level and above are not limited.
+    :param max_groups: Maximum number of groups tracked, the idle ones and
+                       then the least recently used ones are forgotten
+                       beyond it.
+    """
+
+    def __init__(self, interval, burst, sample_rate=0,
+                 except_level=logging.CRITICAL, max_groups=1000):
+        logging.Filter.__init__(self)
+        self.interval = interval
+        self.burst = max(burst, 1)
+        self.sample_rate = sample_rate
+        self.except_level = except_level
+        self.max_groups = max_groups
+        self.suppressed = 0
+        # [tokens, last refill time, suppressed since last logged] by
+        # group, least recently used first.
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        """Make room for a new group.
+
+        Idle groups are forgotten from the least recently used on, until a
+        busy one is met, then the least recently used groups if there are
+        still too many.  The suppressed count of an evicted busy group is
+        lost, the busiest groups keep theirs.
+        """
+        buckets = self._buckets
+        while buckets:
+            key = next(iter(buckets))
+            bucket = buckets[key]
+            # NOTE: a bucket refilled to its burst and with no suppressed
+            # count is the same as a missing one.
+            if (bucket[2] or bucket[0] + (now - bucket[1]) * self.burst /
+                    self.interval < self.burst):
+                break
+            del buckets[key]
+        while len(buckets) >= self.max_groups:
+            buckets.popitem(last=False)
+
+    def _allow(self, record):
+        if (self.except_level is not None and
+                record.levelno >= self.except_level):
+            return True
+        key = (record.name, record.msg)
+        try:
+            hash(key)
+        except TypeError:
+            return True
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                if len(self._buckets) >= self.max_groups:
+                    self._purge(now)
+                bucket = [self.burst, now, 0]
+            # Re-insert the bucket to mark it as the most recently used
+            self._buckets[key] = bucket
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) *
+                            self.burst / self.interval)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+            elif (not self.sample_rate or
+                  (bucket[2] + 1) % self.sample_rate):
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = _('%(message)s (suppressed %(count)d similar '
+                           'messages)') % {'message': record.getMessage(),
+                                           'count': suppressed}
+            record.args = None
+        return True
+
+    def filter(self, record):
+        allowed = record.__dict__.get('_rate_limit_allowed')
+        if allowed is None:
+            allowed = record._rate_limit_allowed = self._allow(record)
+        return allowed
+
+
+def _create_rate_limit_filter():
+    except_level = None
+    if CONF.rate_limit_except_level:
+        except_level = logging.getLevelName(
+            CONF.rate_limit_except_level.upper())
+        if not isinstance(except_level, int):
+            raise TypeError(_('rate_limit_except_level must be a logging '
+                              'level name, not %s') %
+                            CONF.rate_limit_except_level)
+    return RateLimitFilter(CONF.rate_limit_interval, CONF.rate_limit_burst,
+                           CONF.rate_limit_sample_rate, except_level)
+
+
 def _setup_logging_from_conf(project, version):
     log_root = getLogger(None).logger
-    for handler in log_root.handlers:
+    for handler in list(log_root.handlers):
         log_root.removeHandler(handler)
+        if isinstance(handler, AsyncHandler):
+            handler.close()
 
     logpath = _get_log_file_path()
     if logpath:
@@ -557,6 +926,22 @@ def _setup_logging_from_conf(project, version):
             log_root.error('Unable to add syslog handler. Verify that syslog'
                            'is running.')
 
+    if CONF.use_async_logging:
+        handlers = list(log_root.handlers)
+        for handler in handlers:
+            log_root.removeHandler(handler)
+        log_root.addHandler(AsyncHandler(handlers,
+                                         CONF.async_log_queue_size,
+                                         CONF.async_log_batch_size,
+                                         CONF.async_log_sample_rate))
+
+    # NOTE: with asynchronous logging the records are rate limited before
+    # being queued.
+    if CONF.rate_limit_interval > 0:
+        rate_limit = _create_rate_limit_filter()
+        for handler in log_root.handlers:
+            handler.addFilter(rate_limit)
+
 
 _loggers = {}
 
@@ -620,9 +1005,32 @@ class ContextFormatter(logging.Formatter):
 
         self.project = kwargs.pop('project', 'unknown')
         self.version = kwargs.pop('version', 'unknown')
+        # Format styles by (has request id, is debug), see _get_style().
+        self._styles = {}
+        self._generation = _config_generation
 
         logging.Formatter.__init__(self, *args, **kwargs)
 
+    def _get_style(self, has_request_id, debug):
+        if self._generation != _config_generation:
+            self._styles = {}
+            self._generation = _config_generation
+        key = (has_request_id, debug)
+        style = self._styles.get(key)
+        if style is None:
+            if has_request_id:
+                fmt = CONF.logging_context_format_string
+            else:
+                fmt = CONF.logging_default_format_string
+            if debug and CONF.logging_debug_format_suffix:
+                fmt += " " + CONF.logging_debug_format_suffix
+            if sys.version_info < (3, 2):
+                style = fmt
+            else:
+                style = logging.PercentStyle(fmt)
+            self._styles[key] = style
+        return style
+
     def format(self, record):
         """Uses contextstring if request_id is set, otherwise default."""
 
@@ -639,9 +1047,7 @@ class ContextFormatter(logging.Formatter):
         # store request info
         context = getattr(local.store, 'context', None)
         if context:
-            d = _dictify_context(context)
-            for k, v in d.items():
-                setattr(record, k, v)
+            record.__dict__.update(_get_context_dict(context))
 
         # NOTE(sdague): default the fancier formatting params
         # to an empty string so we don't throw an exception if
@@ -650,20 +1056,13 @@ class ContextFormatter(logging.Formatter):
             if key not in record.__dict__:
                 record.__dict__[key] = ''
 
-        if record.__dict__.get('request_id'):
-            fmt = CONF.logging_context_format_string
-        else:
-            fmt = CONF.logging_default_format_string
-
-        if (record.levelno == logging.DEBUG and
-                CONF.logging_debug_format_suffix):
-            fmt += " " + CONF.logging_debug_format_suffix
-
+        style = self._get_style(bool(record.__dict__.get('request_id')),
+                                record.levelno == logging.DEBUG)
         if sys.version_info < (3, 2):
-            self._fmt = fmt
+            self._fmt = style
         else:
-            self._style = logging.PercentStyle(fmt)
-            self._fmt = self._style._fmt
+            self._style = style
+            self._fmt = style._fmt
         # Cache this on the record, Logger will respect our formatted copy
         if record.exc_info:
             record.exc_text = self.formatException(record.exc_info, record)
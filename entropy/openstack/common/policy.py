@@ -77,7 +77,10 @@ as it allows particular rules to be explicitly disabled.
 
 import abc
 import ast
+import collections
 import re
+import threading
+import time
 
 from oslo.config import cfg
 import six
@@ -98,6 +101,16 @@ policy_opts = [
                default='default',
                help=_('Default rule. Enforced when a requested rule is not '
                       'found.')),
+    cfg.IntOpt('policy_recheck_interval',
+               default=1,
+               help=_('Number of seconds during which the policy file is not '
+                      'checked for changes again, 0 checks it on every '
+                      'enforcement.')),
+    cfg.IntOpt('policy_cache_size',
+               default=1024,
+               help=_('Maximum number of authorization decisions cached, by '
+                      'rule and values of the credentials and target '
+                      'fields the rule depends on. 0 disables the cache.')),
 ]
 
 CONF = cfg.CONF
@@ -116,7 +129,11 @@ class PolicyNotAuthorized(Exception):
 
 
 class Rules(dict):
-    """A store for rules. Handles the default_rule setting directly."""
+    """A store for rules. Handles the default_rule setting directly.
+
+    Rules are compiled on their first use, see compiled(), and the compiled
+    rules are discarded whenever the store is modified.
+    """
 
     @classmethod
     def load_json(cls, data, default_rule=None):
@@ -132,7 +149,74 @@ class Rules(dict):
         """Initialize the Rules store."""
 
         super(Rules, self).__init__(rules or {})
-        self.default_rule = default_rule
+        self._default_rule = default_rule
+        # Bumped on every modification, see Enforcer._check().
+        self.generation = 0
+        self._compiled = {}
+
+    def _changed(self):
+        self.generation += 1
+        self._compiled = {}
+
+    @property
+    def default_rule(self):
+        return self._default_rule
+
+    @default_rule.setter
+    def default_rule(self, value):
+        self._default_rule = value
+        self._changed()
+
+    def __setitem__(self, key, value):
+        super(Rules, self).__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super(Rules, self).__delitem__(key)
+        self._changed()
+
+    def clear(self):
+        super(Rules, self).clear()
+        self._changed()
+
+    def pop(self, *args):
+        self._changed()
+        return super(Rules, self).pop(*args)
+
+    def popitem(self):
+        self._changed()
+        return super(Rules, self).popitem()
+
+    def setdefault(self, key, default=None):
+        self._changed()
+        return super(Rules, self).setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        super(Rules, self).update(*args, **kwargs)
+        self._changed()
+
+    def compiled(self, key, _resolving=()):
+        """Return the compiled form of a rule.
+
+        :returns: A (func, fields, checks) tuple. func takes the same
+                  arguments as a Check and returns the same result as the
+                  rule, fields is a (target fields, credentials fields)
+                  tuple of the fields it depends on, or None if its result
+                  may depend on anything else, and checks is the number of
+                  checks the rule is made of.
+        :raises: KeyError if the rule doesn't exist.
+        """
+        try:
+            return self._compiled[key]
+        except KeyError:
+            pass
+        if key in _resolving:
+            # NOTE: the rule refers to itself, its fields are unknown until
+            # it is compiled.
+            return None
+        compiled = _compile_check(self[key], self, _resolving + (key,))
+        self._compiled[key] = compiled
+        return compiled
 
     def __missing__(self, key):
         """Implements the default rule handling."""
@@ -184,6 +268,11 @@ class Enforcer(object):
     :param default_rule: Default rule to use, CONF.default_rule will
                          be used if none is specified.
     :param use_conf: Whether to load rules from cache or config file.
+
+    The policy file is checked for changes at most once per
+    CONF.policy_recheck_interval, and the decisions of the rules which only
+    depend on some fields of the credentials and target are kept in a
+    cache of CONF.policy_cache_size entries.
     """
 
     def __init__(self, policy_file=None, rules=None,
@@ -194,6 +283,8 @@ class Enforcer(object):
         self.policy_path = None
         self.policy_file = policy_file or CONF.policy_file
         self.use_conf = use_conf
+        self._next_recheck = 0
+        self._decisions = _DecisionCache(CONF.policy_cache_size)
 
     def set_rules(self, rules, overwrite=True, use_conf=False):
         """Create a new Rules object based on the provided dict of rules.
@@ -219,11 +310,14 @@ class Enforcer(object):
         fileutils.delete_cached_file(self.policy_path)
         self.default_rule = None
         self.policy_path = None
+        self._next_recheck = 0
 
     def load_rules(self, force_reload=False):
         """Loads policy_path's rules.
 
-        Policy file is cached and will be reloaded if modified.
+        Policy file is cached and will be reloaded if modified, it is
+        checked for modifications at most once per
+        CONF.policy_recheck_interval.
 
         :param force_reload: Whether to overwrite current rules.
         """
@@ -235,11 +329,16 @@ class Enforcer(object):
             if not self.policy_path:
                 self.policy_path = self._get_policy_path()
 
+            now = time.time()
+            if not force_reload and self.rules and now < self._next_recheck:
+                return
+            self._next_recheck = now + CONF.policy_recheck_interval
+
             reloaded, data = fileutils.read_cached_file(
                 self.policy_path, force_reload=force_reload)
             if reloaded or not self.rules:
                 rules = Rules.load_json(data, self.default_rule)
-                self.set_rules(rules)
+                self.set_rules(rules, use_conf=True)
                 LOG.debug("Rules successfully reloaded")
 
     def _get_policy_path(self):
@@ -295,7 +394,7 @@ class Enforcer(object):
         else:
             try:
                 # Evaluate the rule
-                result = self.rules[rule](target, creds, self)
+                result = self._check(rule, target, creds)
             except KeyError:
                 LOG.debug("Rule [%s] doesn't exist" % rule)
                 # If the rule doesn't exist, fail closed
@@ -310,6 +409,81 @@ class Enforcer(object):
 
         return result
 
+    def _check(self, rule, target, creds):
+        """Evaluate the compiled rule, through the decision cache."""
+        rules = self.rules
+        func, fields, checks = rules.compiled(rule)
+        if (fields is None or checks < _MIN_CACHED_CHECKS or
+                not self._decisions.maxsize):
+            return func(target, creds, self)
+
+        self._decisions.validate(rules)
+        try:
+            key = (rule, _field_values(target, fields[0]),
+                   _field_values(creds, fields[1]))
+            found, result = self._decisions.get(key)
+        except TypeError:
+            # Unhashable field values
+            return func(target, creds, self)
+        if not found:
+            result = func(target, creds, self)
+            self._decisions.set(key, result)
+        return result
+
+    def get_cache_stats(self):
+        return self._decisions.stats()
+
+
+class _DecisionCache(object):
+    """A thread-safe LRU mapping of authorization decisions.
+
+    The decisions are flushed when the rules they were made with change.
+
+    :param maxsize: Maximum number of decisions kept in the cache.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._rules = None
+        self._generation = None
+        self.hits = 0
+        self.misses = 0
+
+    def validate(self, rules):
+        if rules is not self._rules or rules.generation != self._generation:
+            with self._lock:
+                self._data.clear()
+                self._rules = rules
+                self._generation = rules.generation
+
+    def get(self, key):
+        """Return a (found, value) tuple for key."""
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return False, None
+            # Re-insert the entry to mark it as the most recently used
+            self._data[key] = value
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats(self):
+        return {'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses}
+
 
 @six.add_metaclass(abc.ABCMeta)
 class BaseCheck(object):
@@ -893,3 +1067,165 @@ class GenericCheck(Check):
             except KeyError:
                 return False
         return match == six.text_type(leftval)
+
+
+# Marks the fields missing from the credentials or target in the keys of
+# the decision cache.
+_MISSING = object()
+
+# Rules made of fewer checks are evaluated faster than their decision is
+# looked up in the cache.
+_MIN_CACHED_CHECKS = 8
+
+_format_field_re = re.compile(r'%\(([^)]*)\)')
+
+
+def _format_fields(match):
+    """Return the target fields a GenericCheck match is formatted with.
+
+    Returns None if the match is formatted with the whole target.
+    """
+    match = match.replace('%%', '')
+    if '%' in _format_field_re.sub('', match):
+        return None
+    return frozenset(_format_field_re.findall(match))
+
+
+def _field_values(mapping, fields):
+    values = []
+    for field in fields:
+        try:
+            value = mapping[field]
+        except KeyError:
+            values.append(_MISSING)
+            continue
+        # NOTE: the type is part of the key as values comparing equal may
+        # format differently, e.g. True and 1.
+        cls = value.__class__
+        if cls is list or cls is tuple:
+            value = tuple([(v.__class__, v) for v in value])
+        values.append((cls, value))
+    return tuple(values)
+
+
+def _combine(compiled):
+    """Return the fields and number of checks of several compiled checks."""
+    checks = sum(c[2] for c in compiled)
+    if any(c[1] is None for c in compiled):
+        return None, checks
+    return ((tuple(sorted(set().union(*[c[1][0] for c in compiled]))),
+             tuple(sorted(set().union(*[c[1][1] for c in compiled])))),
+            checks)
+
+
+def _flatten(check, cls):
+    """Yield the operands of nested checks of class cls."""
+    if type(check) is cls:
+        for rule in check.rules:
+            for operand in _flatten(rule, cls):
+                yield operand
+    else:
+        yield check
+
+
+def _compile_check(check, rules, resolving=()):
+    """Compile a Check tree, see Rules.compiled().
+
+    The known checks are turned into closures: nested "and" and "or"
+    checks are flattened, rule references are resolved through the
+    compiled rules and matches are prepared once.  Other checks are
+    called as they are and their fields are unknown.
+    """
+    no_fields = ((), ())
+
+    if type(check) is TrueCheck:
+        return (lambda target, creds, enforcer: True), no_fields, 1
+    elif type(check) is FalseCheck:
+        return (lambda target, creds, enforcer: False), no_fields, 1
+
+    elif type(check) is NotCheck:
+        func, fields, checks = _compile_check(check.rule, rules, resolving)
+        return (lambda target, creds, enforcer:
+                not func(target, creds, enforcer)), fields, checks + 1
+
+    elif type(check) is AndCheck:
+        compiled = [_compile_check(c, rules, resolving)
+                    for c in _flatten(check, AndCheck)]
+        funcs = tuple(c[0] for c in compiled)
+
+        def and_check(target, creds, enforcer):
+            for func in funcs:
+                if not func(target, creds, enforcer):
+                    return False
+            return True
+        return (and_check,) + _combine(compiled)
+
+    elif type(check) is OrCheck:
+        compiled = [_compile_check(c, rules, resolving)
+                    for c in _flatten(check, OrCheck)]
+        funcs = tuple(c[0] for c in compiled)
+
+        def or_check(target, creds, enforcer):
+            for func in funcs:
+                if func(target, creds, enforcer):
+                    return True
+            return False
+        return (or_check,) + _combine(compiled)
+
+    elif type(check) is RuleCheck:
+        name = check.match
+        try:
+            referenced = rules.compiled(name, resolving)
+        except KeyError:
+            fields, checks = no_fields, 1
+        else:
+            if referenced is None:
+                fields, checks = None, 1
+            else:
+                fields, checks = referenced[1], referenced[2] + 1
+
+        def rule_check(target, creds, enforcer):
+            try:
+                return enforcer.rules.compiled(name)[0](target, creds,
+                                                        enforcer)
+            except KeyError:
+                # We don't have any matching rule; fail closed
+                return False
+        return rule_check, fields, checks
+
+    elif type(check) is RoleCheck:
+        role = check.match.lower()
+        return (lambda target, creds, enforcer:
+                role in [x.lower() for x in creds['roles']]), \
+            ((), ('roles',)), 1
+
+    elif type(check) is GenericCheck:
+        kind = check.kind
+        match = check.match
+        try:
+            leftval = six.text_type(ast.literal_eval(kind))
+        except ValueError:
+            leftval = None
+        except Exception:
+            return check, None, 1
+        target_fields = _format_fields(match)
+        if target_fields is None:
+            fields = None
+        else:
+            fields = (tuple(sorted(target_fields)),
+                      () if leftval is not None else (kind,))
+
+        def generic_check(target, creds, enforcer):
+            try:
+                value = match % target
+            except KeyError:
+                return False
+            if leftval is not None:
+                return value == leftval
+            try:
+                return value == six.text_type(creds[kind])
+            except KeyError:
+                return False
+        return generic_check, fields, 1
+
+    return check, None, 1
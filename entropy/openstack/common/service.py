@@ -142,6 +142,7 @@ class Launcher(object):
 
         """
         cfg.CONF.reload_config_files()
+        logging.reset_cached_config()
         self.services.restart()
 
 
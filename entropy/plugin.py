@@ -0,0 +1,41 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Base class for plugins."""
+
+import abc
+
+import six
+
+
+@six.add_metaclass(abc.ABCMeta)
+class PollsterBase(object):
+    """Base class for plugins checking the HA condition of resources.
+
+    Pollsters are loaded from the entropy.poll.<namespace> entry points of
+    the agent namespace.
+    """
+
+    # Number of seconds between two checks of a resource, None means the
+    # agent/poll_interval option.
+    interval = None
+
+    @abc.abstractmethod
+    def poll(self, manager, resource):
+        """Check a resource.
+
+        :param manager: The AgentManager running the pollster.
+        :param resource: The api_models.Resource to check.
+        :returns: The HA condition of the resource, or None to leave it
+                  unchanged.
+        """
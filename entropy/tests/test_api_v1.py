@@ -0,0 +1,168 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+
+import fixtures
+from oslo.config import fixture as config_fixture
+from oslo.utils import timeutils
+from oslotest import base
+import webtest
+
+from entropy.api import app
+from entropy.db import impl_memory
+
+
+class TestResources(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestResources, self).setUp()
+        self.CONF = self.useFixture(config_fixture.Config()).conf
+        self.conn = impl_memory.Connection('memory://')
+        self.useFixture(fixtures.MonkeyPatch(
+            'entropy.api.app.get_db_connection', lambda: self.conn))
+        self.app = webtest.TestApp(app.setup_app())
+
+    def _record(self, *resource_ids, **kwargs):
+        for resource_id in resource_ids:
+            self.conn.record_resources(
+                resource_id, kwargs.get('resource_type', 'instance'),
+                {'name': resource_id})
+
+    def _ids(self, response):
+        return [r['resource_id'] for r in response.json]
+
+    def test_list(self):
+        self._record('r2', 'r1', 'r3')
+        response = self.app.get('/v1/resource')
+        self.assertEqual(['r1', 'r2', 'r3'], self._ids(response))
+        self.assertEqual({'resource_id': 'r1', 'resource_type': 'instance',
+                          'resource_meta': {'name': 'r1'}},
+                         response.json[0])
+        self.assertNotIn('Link', response.headers)
+
+    def test_list_empty(self):
+        self.assertEqual([], self.app.get('/v1/resource').json)
+
+    def test_limit_and_marker(self):
+        self._record('r1', 'r2', 'r3')
+        response = self.app.get('/v1/resource', params={'limit': 2})
+        self.assertEqual(['r1', 'r2'], self._ids(response))
+        link = response.headers['Link']
+        self.assertIn('marker=r2', link)
+        self.assertTrue(link.endswith('; rel="next"'))
+
+        response = self.app.get('/v1/resource',
+                                params={'limit': 2, 'marker': 'r2'})
+        self.assertEqual(['r3'], self._ids(response))
+        self.assertNotIn('Link', response.headers)
+
+    def test_limit_capped_by_max_limit(self):
+        self.CONF.set_override('max_limit', 1, group='api')
+        self._record('r1', 'r2')
+        response = self.app.get('/v1/resource', params={'limit': 10})
+        self.assertEqual(['r1'], self._ids(response))
+        self.assertIn('limit=1', response.headers['Link'])
+
+    def test_bad_limit(self):
+        for limit in ('x', '0', '-1'):
+            response = self.app.get('/v1/resource', params={'limit': limit},
+                                    expect_errors=True)
+            self.assertEqual(400, response.status_int, limit)
+
+    def test_filters(self):
+        self._record('r1', 'r3')
+        self._record('r2', resource_type='volume')
+        response = self.app.get('/v1/resource',
+                                params={'resource_type': 'volume'})
+        self.assertEqual(['r2'], self._ids(response))
+        response = self.app.get('/v1/resource',
+                                params={'start_timestamp':
+                                        '2000-01-01T00:00:00'})
+        self.assertEqual(['r1', 'r2', 'r3'], self._ids(response))
+        response = self.app.get('/v1/resource',
+                                params={'end_timestamp':
+                                        '2000-01-01T00:00:00'})
+        self.assertEqual([], response.json)
+
+    def test_bad_timestamp(self):
+        for name in ('start_timestamp', 'end_timestamp'):
+            response = self.app.get('/v1/resource', params={name: 'foo'},
+                                    expect_errors=True)
+            self.assertEqual(400, response.status_int, name)
+
+    def test_stream(self):
+        self._record('r1', 'r2', 'r3')
+        response = self.app.get('/v1/resource',
+                                params={'stream': 'true', 'marker': 'r1'})
+        self.assertEqual('application/json', response.content_type)
+        self.assertEqual(['r2', 'r3'], self._ids(response))
+        self.assertNotIn('Link', response.headers)
+
+    def test_etag(self):
+        self._record('r1')
+        response = self.app.get('/v1/resource')
+        etag = response.headers['ETag']
+        response = self.app.get('/v1/resource',
+                                headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_int)
+        self.assertEqual(b'', response.body)
+
+        # The ETag depends on the query
+        response = self.app.get('/v1/resource', params={'limit': 1},
+                                headers={'If-None-Match': etag})
+        self.assertEqual(200, response.status_int)
+
+        self._record('r2')
+        response = self.app.get('/v1/resource',
+                                headers={'If-None-Match': etag})
+        self.assertEqual(200, response.status_int)
+        self.assertNotEqual(etag, response.headers['ETag'])
+        self.assertEqual(['r1', 'r2'], self._ids(response))
+
+    def test_etag_changes_on_condition_update(self):
+        self._record('r1')
+        etag = self.app.get('/v1/resource').headers['ETag']
+        self.conn.update_ha_condition('r1', 'down')
+        response = self.app.get('/v1/resource',
+                                headers={'If-None-Match': etag})
+        self.assertEqual(200, response.status_int)
+
+    def test_if_modified_since(self):
+        timeutils.set_time_override(datetime.datetime(2015, 1, 1, 12))
+        self.addCleanup(timeutils.clear_time_override)
+        self._record('r1')
+        # Not sent until the second of the last change is over
+        response = self.app.get('/v1/resource')
+        self.assertNotIn('Last-Modified', response.headers)
+
+        timeutils.advance_time_seconds(2)
+        response = self.app.get('/v1/resource')
+        last_modified = response.headers['Last-Modified']
+        self.assertEqual('Thu, 01 Jan 2015 12:00:00 GMT', last_modified)
+        response = self.app.get('/v1/resource',
+                                headers={'If-Modified-Since': last_modified})
+        self.assertEqual(304, response.status_int)
+
+        self._record('r2')
+        timeutils.advance_time_seconds(2)
+        response = self.app.get('/v1/resource',
+                                headers={'If-Modified-Since': last_modified})
+        self.assertEqual(200, response.status_int)
+
+    def test_get_one(self):
+        self._record('r1')
+        self.assertEqual('r1',
+                         self.app.get('/v1/resource/r1').json['resource_id'])
+        response = self.app.get('/v1/resource/r2', expect_errors=True)
+        self.assertEqual(404, response.status_int)
@@ -0,0 +1,149 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import fixtures
+from oslotest import base
+
+from entropy.db import cache
+from entropy.db import impl_memory
+
+
+class FakeTime(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class TestLRUCache(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestLRUCache, self).setUp()
+        self.clock = FakeTime()
+        self.useFixture(fixtures.MonkeyPatch('entropy.db.cache.time',
+                                             self.clock))
+        self.cache = cache.LRUCache(maxsize=2, ttl=5)
+
+    def test_hit_and_miss(self):
+        self.assertEqual((False, None), self.cache.get('a'))
+        self.cache.set('a', 1)
+        self.assertEqual((True, 1), self.cache.get('a'))
+        self.assertEqual({'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1,
+                          'evictions': 0}, self.cache.stats())
+
+    def test_cached_none(self):
+        self.cache.set('a', None)
+        self.assertEqual((True, None), self.cache.get('a'))
+
+    def test_ttl(self):
+        self.cache.set('a', 1)
+        self.clock.now += 5
+        self.assertEqual((True, 1), self.cache.get('a'))
+        self.clock.now += 0.1
+        self.assertEqual((False, None), self.cache.get('a'))
+        self.assertEqual(0, self.cache.stats()['size'])
+
+    def test_lru_eviction(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        # Makes b the least recently used entry
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual((False, None), self.cache.get('b'))
+        self.assertEqual((True, 1), self.cache.get('a'))
+        self.assertEqual((True, 3), self.cache.get('c'))
+        self.assertEqual(1, self.cache.stats()['evictions'])
+
+
+class TestCachedConnection(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestCachedConnection, self).setUp()
+        self.clock = FakeTime()
+        self.useFixture(fixtures.MonkeyPatch('entropy.db.cache.time',
+                                             self.clock))
+        self.useFixture(fixtures.MonkeyPatch(
+            'entropy.db.cache._shared_generation', None))
+        # Stands for the database, written to by other services too
+        self.db = impl_memory.Connection('memory://')
+        self.conn = cache.CachedConnection(self.db, maxsize=10, ttl=5)
+        self.conn.record_resources('r1', 'instance', {})
+
+    def _ids(self, **kwargs):
+        return [r.resource_id
+                for r in self.conn.get_resources(limit=10, **kwargs)]
+
+    def test_get_resource_cached(self):
+        self.assertEqual('r1', self.conn.get_resource('r1').resource_id)
+        self.assertIsNone(self.conn.get_resource('r2'))
+        self.db.record_resources('r2', 'instance', {})
+        # Written by another service, served from the cache until the TTL
+        self.assertIsNone(self.conn.get_resource('r2'))
+        self.clock.now += 6
+        self.assertEqual('r2', self.conn.get_resource('r2').resource_id)
+
+    def test_listing_cached(self):
+        self.assertEqual(['r1'], self._ids())
+        hits = self.conn.cache.stats()['hits']
+        self.assertEqual(['r1'], self._ids())
+        self.assertEqual(hits + 1, self.conn.cache.stats()['hits'])
+        # Different filters are different entries
+        self.assertEqual([], self._ids(resource_type='volume'))
+
+    def test_version_not_cached(self):
+        version = self.conn.get_resources_version()
+        self.db.record_resources('r2', 'instance', {})
+        self.assertNotEqual(version, self.conn.get_resources_version())
+
+    def test_listing_follows_other_writers(self):
+        self.assertEqual(['r1'], self._ids())
+        self.assertEqual([], self._ids(ha_condition='down'))
+        self.db.record_resources('r2', 'instance', {})
+        self.db.update_ha_condition('r1', 'down')
+        self.assertEqual(['r1', 'r2'], self._ids())
+        self.assertEqual(['r1'], self._ids(ha_condition='down'))
+
+    def test_writes_invalidate(self):
+        self.assertIsNone(self.conn.get_resource('r2'))
+        self.conn.record_resources('r2', 'instance', {})
+        self.assertEqual('r2', self.conn.get_resource('r2').resource_id)
+
+        self.conn.record_resources_bulk([{'resource_id': 'r3',
+                                          'resource_type': 'instance',
+                                          'resource_meta': {}}])
+        self.assertEqual('r3', self.conn.get_resource('r3').resource_id)
+
+        self.conn.update_ha_condition('r1', 'down')
+        self.assertEqual(0, self.conn.cache.stats()['size'])
+
+        self.conn.get_resource('r1')
+        self.conn.clear_expired_data(-60)
+        self.assertIsNone(self.conn.get_resource('r1'))
+
+    def test_shared_invalidation(self):
+        generation = cache.multiprocessing.Value('L', 0)
+        self.useFixture(fixtures.MonkeyPatch(
+            'entropy.db.cache._shared_generation', generation))
+        other = cache.CachedConnection(self.db, maxsize=10, ttl=5)
+        self.assertIsNone(other.get_resource('r2'))
+        # A write through another process' connection
+        self.conn.record_resources('r2', 'instance', {})
+        self.assertEqual(1, generation.value)
+        self.assertEqual('r2', other.get_resource('r2').resource_id)
+
+    def test_unbounded_listing_not_cached(self):
+        self.assertEqual(['r1'], [r.resource_id
+                                  for r in self.conn.get_resources()])
+        self.assertEqual(0, self.conn.cache.stats()['size'])
@@ -0,0 +1,94 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from oslotest import base
+
+from entropy.db import impl_memory
+from entropy.tests import test_impl_sqlalchemy
+
+
+class ChangeFeedTests(object):
+    """Change feed behaviour shared by the storage drivers."""
+
+    def _changes(self, seq=0, limit=None):
+        return [(c.seq, c.resource.resource_id, c.deleted)
+                for c in self.conn.get_changes_since(seq, limit)]
+
+    def test_latest_change_per_resource(self):
+        self.conn.record_resources('r1', 'server', {'a': 1})
+        self.conn.record_resources('r2', 'server', {})
+        self.conn.update_ha_condition('r1', 'up')
+        self.assertEqual([(2, 'r2', False), (3, 'r1', False)],
+                         self._changes())
+        self.assertEqual([(3, 'r1', False)], self._changes(2))
+        change = list(self.conn.get_changes_since(2))[0]
+        self.assertEqual({'a': 1}, change.resource.resource_meta)
+
+    def test_expired_resources_reported_deleted(self):
+        self.conn.record_resources('r1', 'server', {})
+        self.conn.record_resources('r2', 'server', {})
+        deleted = self.conn.clear_expired_data(-60)
+        self.assertEqual(2, deleted['resource'])
+        self.assertEqual(0, deleted['resource_tombstone'])
+        self.conn.record_resources('r3', 'server', {})
+        self.assertEqual([(3, 'r1', True), (4, 'r2', True),
+                          (5, 'r3', False)], self._changes(2))
+        self.assertEqual([(3, 'r1', True), (4, 'r2', True)],
+                         self._changes(2, limit=2))
+        self.assertEqual([(4, 'r2', True), (5, 'r3', False)],
+                         self._changes(3, limit=2))
+        change = list(self.conn.get_changes_since(2, 1))[0]
+        self.assertIsNone(change.resource.resource_type)
+        self.assertEqual(5, self.conn.get_resources_version()[0])
+
+    def test_tombstones_expire(self):
+        self.conn.record_resources('r1', 'server', {})
+        self.conn.clear_expired_data(-60)
+        self.assertEqual(1, self.conn.clear_expired_data(-60)[
+            'resource_tombstone'])
+        self.assertEqual([], self._changes())
+
+    def test_recorded_again_after_expiry(self):
+        self.conn.record_resources('r1', 'server', {})
+        self.conn.clear_expired_data(-60)
+        self.conn.record_resources('r1', 'server', {'a': 1})
+        self.assertEqual((3, 'r1', False), self._changes()[-1])
+
+    def test_sequence_carries_on_after_clear(self):
+        self.conn.record_resources('r1', 'server', {})
+        self.conn.record_resources('r2', 'server', {})
+        self.conn.clear()
+        self.assertEqual([], self._changes())
+        self.conn.record_resources('r3', 'server', {})
+        self.assertEqual([(3, 'r3', False)], self._changes(2))
+
+
+class TestMemoryChanges(ChangeFeedTests, base.BaseTestCase):
+
+    def setUp(self):
+        super(TestMemoryChanges, self).setUp()
+        self.conn = impl_memory.Connection('memory://')
+
+    def test_compaction_keeps_tombstones(self):
+        self.conn.record_resources('r1', 'server', {})
+        self.conn.record_resources('r2', 'server', {})
+        self.conn.clear_expired_data(-60)
+        self.conn.record_resources('r2', 'server', {})
+        self.conn._compact_change_log()
+        self.assertEqual([(3, 'r1', True), (5, 'r2', False)],
+                         self._changes())
+
+
+class TestSQLiteChanges(ChangeFeedTests,
+                        test_impl_sqlalchemy.SQLiteTestCase):
+    pass
@@ -0,0 +1,101 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+
+from oslotest import base
+
+from entropy import coordination
+from entropy import utils
+
+Event = collections.namedtuple('Event', ['group_id', 'member_id'])
+
+
+class TestExtractMySubset(base.BaseTestCase):
+
+    GROUP = 'entropy-test'
+
+    def setUp(self):
+        super(TestExtractMySubset, self).setUp()
+        self.members = ['me', 'other']
+        self.coordinator = coordination.PartitionCoordinator('me')
+        self.coordinator._get_members = lambda group_id: list(self.members)
+        self.keys = ['key-%d' % i for i in range(500)]
+
+    def _extract(self, keys=None, replicas=1):
+        return self.coordinator.extract_my_subset(
+            self.GROUP, keys or self.keys, replicas=replicas)
+
+    def _expected(self, keys=None, replicas=1):
+        ring = utils.HashRing(self.members)
+        return [k for k in keys or self.keys
+                if 'me' in ring.get_nodes(k, replicas)]
+
+    def _change_members(self, members):
+        self.members = members
+        self.coordinator._on_membership(Event(self.GROUP, 'other'))
+
+    def _spy_lookups(self):
+        ring = self.coordinator._rings[self.GROUP]
+        ownership = ring.ownership
+        looked_up = []
+
+        def spy(keys, replicas=1):
+            looked_up.extend(keys)
+            return ownership(keys, replicas)
+        ring.ownership = spy
+        return looked_up
+
+    def test_unchanged_members_only_look_up_new_keys(self):
+        self.assertEqual(self._expected(), self._extract())
+        looked_up = self._spy_lookups()
+        keys = self.keys + ['new-%d' % i for i in range(10)]
+        self.assertEqual(self._expected(keys), self._extract(keys))
+        self.assertEqual(keys[-10:], looked_up)
+
+    def test_member_left_only_moves_its_keys(self):
+        self.members = ['me', 'other', 'third']
+        self._extract(replicas=2)
+        ring = self.coordinator._rings[self.GROUP]
+        owned = set(k for k in self.keys
+                    if 'third' in ring.get_nodes(k, 2))
+        looked_up = self._spy_lookups()
+        self._change_members(['me', 'other'])
+        self.assertEqual(self._expected(replicas=2),
+                         self._extract(replicas=2))
+        self.assertEqual(owned, set(looked_up))
+        self.assertEqual(len(owned), len(looked_up))
+        self.assertIs(ring, self.coordinator._rings[self.GROUP])
+
+    def test_member_joined(self):
+        self._extract()
+        ring = self.coordinator._rings[self.GROUP]
+        self._change_members(['me', 'other', 'third'])
+        self.assertEqual(self._expected(), self._extract())
+        self.assertIs(ring, self.coordinator._rings[self.GROUP])
+        self.assertEqual(sorted(self.members), sorted(ring.nodes))
+
+    def test_forgets_removed_keys(self):
+        self._extract()
+        keys = self.keys[:100]
+        self.assertEqual(self._expected(keys), self._extract(keys))
+        self.assertEqual(set(self._expected(keys)),
+                         self.coordinator._ownership[self.GROUP][2])
+        self.assertEqual(self._expected(), self._extract())
+
+    def test_replicas_changed(self):
+        self.assertEqual(self._expected(), self._extract())
+        self.assertEqual(self._expected(replicas=2),
+                         self._extract(replicas=2))
+        self._change_members(['me', 'other', 'third'])
+        self.assertEqual(self._expected(), self._extract())
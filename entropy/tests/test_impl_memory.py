@@ -0,0 +1,103 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from oslotest import base
+
+from entropy.db import impl_memory
+from entropy import exception
+
+
+class TestHistory(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestHistory, self).setUp()
+        self.conn = impl_memory.Connection('memory://')
+        self.conn.record_resources('r1', 'server', {})
+
+    def _ids(self, **kwargs):
+        return [h.id for h in self.conn.get_history(**kwargs)]
+
+    def test_unchanged_condition_not_recorded(self):
+        self.assertIsNotNone(self.conn.update_ha_condition('r1', 'up'))
+        self.assertIsNone(self.conn.update_ha_condition('r1', 'up'))
+        self.assertEqual([1], self._ids())
+
+    def test_pagination(self):
+        self.conn.record_resources('r2', 'server', {})
+        for condition in ('up', 'down', 'up'):
+            self.conn.update_ha_condition('r1', condition)
+            self.conn.update_ha_condition('r2', condition)
+        self.assertEqual([1, 2], self._ids(limit=2))
+        self.assertEqual([3, 4], self._ids(limit=2, marker=2))
+        self.assertEqual([5, 6], self._ids(marker=4))
+        self.assertEqual([4, 6], self._ids(resource_id='r2', marker=2))
+
+    def test_ids_not_reused_after_expiry(self):
+        self.conn.update_ha_condition('r1', 'up')
+        self.conn.update_ha_condition('r1', 'down')
+        self.assertEqual({'history': 2, 'resource': 1,
+                          'resource_tombstone': 0},
+                         self.conn.clear_expired_data(-60))
+        self.assertEqual([], self._ids())
+
+        self.conn.record_resources('r1', 'server', {})
+        self.conn.update_ha_condition('r1', 'up')
+        self.assertEqual([3], self._ids())
+        self.assertEqual([3], self._ids(marker=2))
+
+
+class RecordResourcesBulkTests(object):
+    """record_resources_bulk() behaviour shared by the storage drivers."""
+
+    def _bulk(self, *ids):
+        return self.conn.record_resources_bulk(
+            {'resource_id': resource_id, 'resource_type': 'server',
+             'resource_meta': {'id': resource_id}} for resource_id in ids)
+
+    def _check(self, expected, results):
+        self.assertEqual(len(expected), len(results))
+        for resource_id, result in zip(expected, results):
+            if resource_id is None:
+                self.assertIsInstance(result,
+                                      exception.ResourceAlreadyExists)
+            else:
+                self.assertEqual(resource_id, result.resource_id)
+                self.assertEqual({'id': resource_id}, result.resource_meta)
+
+    def _stored(self):
+        return sorted(r.resource_id for r in self.conn.get_resources())
+
+    def test_mixed_duplicates_and_new(self):
+        self.conn.record_resources('r1', 'server', {'id': 'r1'})
+        self._check(['r0', None, 'r2', None],
+                    self._bulk('r0', 'r1', 'r2', 'r2'))
+        self.assertEqual(['r0', 'r1', 'r2'], self._stored())
+        self.assertEqual([2, 3], [c.seq for c in
+                                  self.conn.get_changes_since(1)])
+
+    def test_all_duplicates(self):
+        self.conn.record_resources('r1', 'server', {'id': 'r1'})
+        version = self.conn.get_resources_version()[0]
+        self._check([None, None], self._bulk('r1', 'r1'))
+        self.assertEqual(['r1'], self._stored())
+        self.assertEqual(version, self.conn.get_resources_version()[0])
+
+    def test_empty(self):
+        self.assertEqual([], self._bulk())
+
+
+class TestRecordResourcesBulk(RecordResourcesBulkTests, base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRecordResourcesBulk, self).setUp()
+        self.conn = impl_memory.Connection('memory://')
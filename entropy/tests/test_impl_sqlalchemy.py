@@ -0,0 +1,104 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+import os
+
+import fixtures
+from oslo.utils import timeutils
+from oslotest import base
+
+from entropy.db import impl_sqlalchemy
+from entropy.db.sqlalchemy import models as db_models
+from entropy.tests import test_impl_memory
+
+
+class SQLiteTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(SQLiteTestCase, self).setUp()
+        path = self.useFixture(fixtures.TempDir()).path
+        self.url = 'sqlite:///%s' % os.path.join(path, 'entropy.db')
+        self.conn = impl_sqlalchemy.Connection(self.url)
+        self.conn.upgrade()
+
+
+class TestHistory(SQLiteTestCase):
+
+    def setUp(self):
+        super(TestHistory, self).setUp()
+        self.conn.record_resources('r1', 'server', {})
+        self.start = datetime.datetime(2014, 6, 1, 12, 0, 0, 123456)
+        for i, condition in enumerate(('up', 'down', 'up')):
+            timeutils.set_time_override(
+                self.start + datetime.timedelta(hours=i))
+            self.conn.update_ha_condition('r1', condition)
+        timeutils.clear_time_override()
+        # Pages smaller than the result set
+        self.conn.YIELD_PER = 2
+
+    def test_timestamps(self):
+        self.assertEqual(
+            [(1, None, 'up', self.start),
+             (2, 'up', 'down', self.start + datetime.timedelta(hours=1)),
+             (3, 'down', 'up', self.start + datetime.timedelta(hours=2))],
+            [(h.id, h.previous_ha_condition, h.ha_condition, h.timestamp)
+             for h in self.conn.get_history(resource_id='r1')])
+
+    def test_filters(self):
+        ids = [h.id for h in self.conn.get_history(
+            start_timestamp=self.start + datetime.timedelta(hours=1),
+            end_timestamp=self.start + datetime.timedelta(hours=2))]
+        self.assertEqual([2], ids)
+        ids = [h.id for h in self.conn.get_history(limit=2, marker=1)]
+        self.assertEqual([2, 3], ids)
+
+
+class TestRecordResourcesBulk(test_impl_memory.RecordResourcesBulkTests,
+                              SQLiteTestCase):
+
+    def _race(self, *ids):
+        """Insert ids between the look-up and the insert of the batch.
+
+        The rows are inserted in the transaction of the batch, as a
+        concurrent writer committing first would have.
+        """
+        next_change_seq = self.conn._next_change_seq
+        table = db_models.Resource.__table__
+
+        def racing_next_change_seq(session, count=1):
+            for resource_id in ids:
+                session.execute(table.insert(), {
+                    'resource_id': resource_id, 'resource_type': 'server',
+                    'resource_metadata': {'id': resource_id},
+                    'change_seq': next_change_seq(session)})
+            return next_change_seq(session, count)
+
+        self.conn._next_change_seq = racing_next_change_seq
+
+    def test_concurrent_duplicates(self):
+        self._race('r1')
+        self._check(['r0', None, 'r2'], self._bulk('r0', 'r1', 'r2'))
+        self.assertEqual(['r0', 'r1', 'r2'], self._stored())
+
+    def test_concurrent_duplicates_only(self):
+        self._race('r0', 'r1')
+        self._check([None, None], self._bulk('r0', 'r1'))
+        self.assertEqual(['r0', 'r1'], self._stored())
+
+    def test_several_chunks(self):
+        self.conn.BULK_INSERT_SIZE = 2
+        self.conn.record_resources('r3', 'server', {'id': 'r3'})
+        self._check(['r0', 'r1', 'r2', None, 'r4'],
+                    self._bulk('r0', 'r1', 'r2', 'r3', 'r4'))
+        self.assertEqual(['r0', 'r1', 'r2', 'r3', 'r4'], self._stored())
@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import datetime
+
+from oslotest import base
+
+from entropy.openstack.common import jsonutils
+
+
+class TestToPrimitive(base.BaseTestCase):
+
+    def test_primitive_containers_are_copied(self):
+        value = {'a': 1, 'b': [1, 'x', None, {'c': 2.5}], 'd': True}
+        result = jsonutils.to_primitive(value)
+        self.assertEqual(value, result)
+        self.assertIsNot(value, result)
+        self.assertIsNot(value['b'], result['b'])
+        self.assertIsNot(value['b'][3], result['b'][3])
+        result['b'][3]['c'] = 0
+        result['b'].append(2)
+        self.assertEqual({'c': 2.5}, value['b'][3])
+        self.assertEqual(4, len(value['b']))
+
+    def test_primitive_list_is_copied(self):
+        value = [1, [2, [3]]]
+        result = jsonutils.to_primitive(value)
+        self.assertEqual(value, result)
+        self.assertIsNot(value, result)
+        self.assertIsNot(value[1][1], result[1][1])
+
+    def test_nested_datetime_falls_back(self):
+        when = datetime.datetime(2014, 6, 1, 12, 30, 15)
+        value = {'a': 1, 'b': [1, {'when': when}]}
+        result = jsonutils.to_primitive(value)
+        self.assertEqual({'a': 1, 'b': [1, {'when': '2014-06-01T12:30:15'
+                                                    '.000000'}]}, result)
+        self.assertEqual(when, value['b'][1]['when'])
+        self.assertEqual(when, jsonutils.to_primitive(
+            value, convert_datetime=False)['b'][1]['when'])
+
+    def test_nested_tuple_and_subclass_fall_back(self):
+        value = {'t': (1, 2), 'o': collections.OrderedDict([('k', [3])])}
+        result = jsonutils.to_primitive(value)
+        self.assertEqual({'t': [1, 2], 'o': {'k': [3]}}, result)
+        self.assertIs(dict, type(result['o']))
+
+    def test_nested_instance(self):
+
+        class Thing(object):
+            def __init__(self):
+                self.x = [1]
+
+        self.assertEqual({'t': {'x': [1]}}, jsonutils.to_primitive(
+            {'t': Thing()}, convert_instances=True))
+
+    def test_simple_values(self):
+        for value in (1, 1.5, 'x', u'y', None, True):
+            self.assertIs(value, jsonutils.to_primitive(value))
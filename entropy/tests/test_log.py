@@ -0,0 +1,226 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import logging
+import threading
+
+import fixtures
+from oslotest import base
+import testtools
+
+from entropy.openstack.common import context
+from entropy.openstack.common import log
+
+
+class GatedStream(object):
+    """A stream recording its writes, the first one waits for a gate."""
+
+    def __init__(self):
+        self.writes = []
+        self.gate = threading.Event()
+        self.writing = threading.Event()
+
+    def write(self, data):
+        self.writing.set()
+        self.gate.wait(5)
+        self.writes.append(data)
+
+    def flush(self):
+        pass
+
+
+def _record(msg, level=logging.INFO):
+    return logging.LogRecord('entropy.test', level, __file__, 1, msg, None,
+                             None)
+
+
+class TestAsyncHandler(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestAsyncHandler, self).setUp()
+        self.stream = GatedStream()
+        stream_handler = logging.StreamHandler(self.stream)
+        stream_handler.setFormatter(logging.Formatter('%(message)s'))
+        self.handlers = [stream_handler]
+
+    def _handler(self, **kwargs):
+        handler = log.AsyncHandler(self.handlers, **kwargs)
+        self.addCleanup(self.stream.gate.set)
+        return handler
+
+    def _block_worker(self, handler):
+        # The worker holds the first record until the gate opens
+        handler.handle(_record('first'))
+        self.assertTrue(self.stream.writing.wait(5))
+
+    def test_batches(self):
+        handler = self._handler(batch_size=3)
+        self._block_worker(handler)
+        for i in range(5):
+            handler.handle(_record('r%d' % i))
+        self.stream.gate.set()
+        handler.close()
+        self.assertEqual(['first\n', 'r0\nr1\nr2\n', 'r3\nr4\n'],
+                         self.stream.writes)
+
+    def test_drop_when_full(self):
+        handler = self._handler(queue_size=2, sample_rate=1)
+        self._block_worker(handler)
+        for i in range(4):
+            handler.handle(_record('r%d' % i, logging.WARNING))
+        stats = handler.get_stats()
+        self.assertEqual(2, stats['dropped'])
+        self.assertEqual(2, stats['pending'])
+        self.stream.gate.set()
+        handler.close()
+        lines = ''.join(self.stream.writes).splitlines()
+        self.assertEqual(['first', 'r0', 'r1'], lines[:3])
+        self.assertEqual('Logging overloaded, 0 records sampled out and 2 '
+                         'dropped so far', lines[3])
+
+    def test_sample_when_half_full(self):
+        handler = self._handler(queue_size=4, sample_rate=2)
+        self._block_worker(handler)
+        for i in range(4):
+            handler.handle(_record('info%d' % i))
+        handler.handle(_record('warning', logging.WARNING))
+        self.assertEqual(1, handler.get_stats()['sampled'])
+        self.stream.gate.set()
+        handler.close()
+        lines = ''.join(self.stream.writes).splitlines()
+        self.assertEqual(['first', 'info0', 'info1', 'info3', 'warning'],
+                         lines[:5])
+
+    def test_close_flushes(self):
+        self.stream.gate.set()
+        handler = self._handler()
+        for i in range(50):
+            handler.handle(_record('r%d' % i))
+        thread = handler._thread
+        handler.close()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(['r%d' % i for i in range(50)],
+                         ''.join(self.stream.writes).splitlines())
+
+    def test_context_stored_on_record(self):
+        self.stream.gate.set()
+        self.handlers[0].setFormatter(
+            logging.Formatter('%(request_id)s %(message)s'))
+        handler = self._handler()
+        ctxt = context.RequestContext(request_id='req-1')
+        log.local.store.context = ctxt
+        self.addCleanup(delattr, log.local.store, 'context')
+        handler.handle(_record('hello %s'))
+        handler.close()
+        self.assertEqual(['req-1 hello %s\n'], self.stream.writes)
+
+    @testtools.skipIf(log.eventlet_patcher is None, 'eventlet is missing')
+    def test_native_worker_when_monkey_patched(self):
+        self.stream.gate.set()
+        self.useFixture(fixtures.MonkeyPatch(
+            'entropy.openstack.common.log.eventlet_patcher.'
+            'is_monkey_patched', lambda module: True))
+        handler = self._handler()
+        handler.handle(_record('hello'))
+        native_threading = log.eventlet_patcher.original('threading')
+        self.assertIsInstance(handler._thread, native_threading.Thread)
+        handler.close()
+        self.assertEqual(['hello\n'], self.stream.writes)
+
+
+class FakeTime(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class TestRateLimitFilter(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRateLimitFilter, self).setUp()
+        self.clock = FakeTime()
+        self.useFixture(fixtures.MonkeyPatch(
+            'entropy.openstack.common.log.time', self.clock))
+
+    def _log(self, rate_limit, msg, name='entropy.test',
+             level=logging.INFO):
+        record = logging.LogRecord(name, level, __file__, 1, msg, None, None)
+        if rate_limit.filter(record):
+            return record.getMessage()
+        return None
+
+    def test_suppression_and_summary(self):
+        rate_limit = log.RateLimitFilter(interval=10, burst=2)
+        logged = [self._log(rate_limit, 'boom') for i in range(5)]
+        self.assertEqual(['boom', 'boom', None, None, None], logged)
+        self.assertEqual(3, rate_limit.suppressed)
+        self.assertEqual('other', self._log(rate_limit, 'other'))
+        self.clock.now += 5
+        self.assertEqual('boom (suppressed 3 similar messages)',
+                         self._log(rate_limit, 'boom'))
+        self.assertIsNone(self._log(rate_limit, 'boom'))
+
+    def test_window_rollover(self):
+        rate_limit = log.RateLimitFilter(interval=10, burst=2)
+        for i in range(3):
+            self._log(rate_limit, 'boom')
+        self.clock.now += 10
+        self.assertEqual(['boom (suppressed 1 similar messages)', 'boom',
+                          None],
+                         [self._log(rate_limit, 'boom') for i in range(3)])
+
+    def test_sampling(self):
+        rate_limit = log.RateLimitFilter(interval=10, burst=1,
+                                         sample_rate=3)
+        logged = [self._log(rate_limit, 'boom') for i in range(7)]
+        self.assertEqual(['boom', None, None,
+                          'boom (suppressed 2 similar messages)', None,
+                          None, 'boom (suppressed 2 similar messages)'],
+                         logged)
+
+    def test_except_level(self):
+        rate_limit = log.RateLimitFilter(interval=10, burst=1)
+        for i in range(3):
+            self.assertEqual('boom', self._log(rate_limit, 'boom',
+                                               level=logging.CRITICAL))
+        self.assertEqual(0, rate_limit.suppressed)
+
+    def test_max_groups_forgets_idle_groups(self):
+        rate_limit = log.RateLimitFilter(interval=10, burst=1, max_groups=3)
+        self._log(rate_limit, 'idle')
+        self.clock.now += 10
+        for msg in ('busy', 'busy', 'old', 'old'):
+            self._log(rate_limit, msg)
+        # The idle group makes room for the new one, the others keep their
+        # suppressed count
+        self.assertEqual('new', self._log(rate_limit, 'new'))
+        self.clock.now += 10
+        self.assertEqual('busy (suppressed 1 similar messages)',
+                         self._log(rate_limit, 'busy'))
+        self.assertEqual('old (suppressed 1 similar messages)',
+                         self._log(rate_limit, 'old'))
+
+    def test_max_groups_keeps_recently_used(self):
+        rate_limit = log.RateLimitFilter(interval=10, burst=1, max_groups=2)
+        for msg in ('a', 'a', 'b', 'b'):
+            self._log(rate_limit, msg)
+        # a is used again, so that b is the least recently used
+        self._log(rate_limit, 'a')
+        self._log(rate_limit, 'c')
+        self.clock.now += 10
+        self.assertEqual('a (suppressed 2 similar messages)',
+                         self._log(rate_limit, 'a'))
+        self.assertEqual('b', self._log(rate_limit, 'b'))
@@ -0,0 +1,131 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+
+import eventlet
+from oslo.config import fixture as config_fixture
+from oslotest import base
+
+from entropy.db import impl_memory
+from entropy import exception
+from entropy import manager
+from entropy.openstack.common import threadgroup
+
+Extension = collections.namedtuple('Extension', ['name', 'obj'])
+
+
+class TestRefreshResources(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRefreshResources, self).setUp()
+        # Without a coordination backend the agent owns every resource
+        self.agent = manager.AgentManager('entropy-test')
+        self.agent.db_conn = impl_memory.Connection('memory://')
+
+    def _ids(self):
+        return sorted(r.resource_id for r in self.agent.resources)
+
+    def test_follows_changes(self):
+        self.agent.db_conn.record_resources('r1', 'server', {})
+        self.agent.refresh_resources()
+        self.assertEqual(['r1'], self._ids())
+        self.agent.db_conn.record_resources('r2', 'server', {})
+        self.agent.refresh_resources()
+        self.assertEqual(['r1', 'r2'], self._ids())
+        self.assertEqual(2, self.agent._change_seq)
+
+    def test_forgets_expired_resources(self):
+        self.agent.db_conn.record_resources('r1', 'server', {})
+        self.agent.refresh_resources()
+        self.agent.db_conn.clear_expired_data(-60)
+        self.agent.db_conn.record_resources('r2', 'server', {})
+        self.agent.refresh_resources()
+        self.assertEqual(['r2'], self._ids())
+        self.assertEqual(['r2'], list(self.agent._known_resources))
+
+
+class FakePollster(object):
+    def __init__(self, poll):
+        self._poll = poll
+        self.polled = []
+
+    def poll(self, agent, resource):
+        self.polled.append(resource.resource_id)
+        return self._poll(resource)
+
+
+class TestPoll(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestPoll, self).setUp()
+        self.conf = self.useFixture(config_fixture.Config()).conf
+        self.agent = manager.AgentManager('entropy-test')
+        self.agent.db_conn = impl_memory.Connection('memory://')
+        for resource_id in ('r1', 'r2', 'r3'):
+            self.agent.db_conn.record_resources(resource_id, 'server', {})
+        self.agent.refresh_resources()
+
+    def _poll(self, poll, threads=10):
+        pollster = Extension('fake', FakePollster(poll))
+        tg = self.agent.poll_tgs['fake'] = threadgroup.ThreadGroup(threads)
+        self.addCleanup(tg.stop)
+        self.agent.poll(pollster)
+        return pollster, tg
+
+    def _down(self):
+        return sorted(r.resource_id for r in
+                      self.agent.db_conn.get_resources(ha_condition='down'))
+
+    def test_records_condition(self):
+        pollster, tg = self._poll(lambda r: 'down' if r.resource_id == 'r2'
+                                  else None)
+        tg.wait()
+        self.assertEqual(['r1', 'r2', 'r3'], sorted(pollster.obj.polled))
+        self.assertEqual(['r2'], self._down())
+        self.assertEqual(set(), self.agent._inflight)
+
+    def test_timeout(self):
+        self.conf.set_override('poll_timeout', 0.01, group='agent')
+        pollster, tg = self._poll(lambda r: eventlet.sleep(1) or 'down')
+        tg.wait()
+        self.assertEqual(3, len(pollster.obj.polled))
+        self.assertEqual([], self._down())
+        self.assertEqual(set(), self.agent._inflight)
+
+    def test_resource_not_found_is_forgotten(self):
+        def poll(resource):
+            if resource.resource_id == 'r2':
+                raise exception.ResourceNotFound(resource.resource_id)
+            return 'up'
+        pollster, tg = self._poll(poll)
+        tg.wait()
+        self.assertEqual(['r1', 'r3'],
+                         sorted(self.agent._known_resources))
+        self.assertEqual(set(), self.agent._inflight)
+
+    def test_skips_resources_still_being_checked(self):
+        pollster, tg = self._poll(lambda r: eventlet.sleep(0.05))
+        eventlet.sleep(0)
+        self.agent.poll(pollster)
+        tg.wait()
+        self.assertEqual(['r1', 'r2', 'r3'], sorted(pollster.obj.polled))
+        self.agent.poll(pollster)
+        tg.wait()
+        self.assertEqual(6, len(pollster.obj.polled))
+
+    def test_skips_resources_when_pool_is_full(self):
+        pollster, tg = self._poll(lambda r: eventlet.sleep(0.01), threads=2)
+        tg.wait()
+        self.assertEqual(2, len(pollster.obj.polled))
+        self.assertEqual(set(), self.agent._inflight)
@@ -0,0 +1,75 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+import decimal
+
+from oslo.config import fixture as fixture_config
+from oslotest import base
+import sqlalchemy
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects import sqlite
+
+from entropy.db.sqlalchemy import models
+
+
+class TestPreciseTimestamp(base.BaseTestCase):
+
+    TIMESTAMP = datetime.datetime(2014, 6, 1, 12, 30, 15, 123456)
+
+    def setUp(self):
+        super(TestPreciseTimestamp, self).setUp()
+        self.conf = self.useFixture(fixture_config.Config()).conf
+        self.type = models.PreciseTimestamp()
+
+    def _round_trip(self, dialect):
+        stored = self.type.process_bind_param(self.TIMESTAMP, dialect)
+        self.assertEqual(self.TIMESTAMP,
+                         self.type.process_result_value(stored, dialect))
+        return stored
+
+    def test_mysql_decimal(self):
+        dialect = mysql.dialect()
+        self.assertIsInstance(self.type.load_dialect_impl(dialect),
+                              sqlalchemy.Numeric)
+        self.assertEqual(decimal.Decimal('1401625815.123456'),
+                         self._round_trip(dialect))
+
+    def test_mysql_integer(self):
+        self.conf.set_override('mysql_timestamp_storage', 'integer',
+                               group='database')
+        dialect = mysql.dialect()
+        self.assertIsInstance(self.type.load_dialect_impl(dialect),
+                              sqlalchemy.BigInteger)
+        self.assertEqual(1401625815123456, self._round_trip(dialect))
+
+    def test_other_databases_ignore_storage(self):
+        self.conf.set_override('mysql_timestamp_storage', 'integer',
+                               group='database')
+        dialect = sqlite.dialect()
+        self.assertIsInstance(self.type.load_dialect_impl(dialect),
+                              sqlalchemy.DateTime)
+        self.assertEqual(self.TIMESTAMP, self._round_trip(dialect))
+
+    def test_unknown_storage(self):
+        self.conf.set_override('mysql_timestamp_storage', 'float',
+                               group='database')
+        self.assertRaises(ValueError, self.type.load_dialect_impl,
+                          mysql.dialect())
+
+    def test_none(self):
+        self.conf.set_override('mysql_timestamp_storage', 'integer',
+                               group='database')
+        dialect = mysql.dialect()
+        self.assertIsNone(self.type.process_bind_param(None, dialect))
+        self.assertIsNone(self.type.process_result_value(None, dialect))
@@ -0,0 +1,204 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import itertools
+import os
+import time
+
+import fixtures
+from oslo.config import fixture as config_fixture
+from oslotest import base
+
+from entropy.openstack.common import jsonutils
+from entropy.openstack.common import policy
+
+
+RULES = {
+    'default': 'role:default',
+    'admin': 'role:admin',
+    'owner': 'project_id:%(project_id)s',
+    'admin_or_owner': 'rule:admin or rule:owner',
+    'not_owner': 'not rule:owner',
+    'member_owner': 'role:Member and project_id:%(project_id)s',
+    'literal': "'enabled':%(status)s",
+    'true_literal': 'True:%(enabled)s',
+    'whole_target': 'user_id:%s',
+    'missing_reference': 'rule:undefined',
+    'always': '@',
+    'never': '!',
+    'nested': 'rule:admin_or_owner and not (role:banned or rule:not_owner)',
+    # Made of enough checks to go through the decision cache
+    'big': '(role:a or role:b or role:Member) and '
+           '(project_id:%(project_id)s or user_id:%(user_id)s) and '
+           'not role:banned and (rule:admin or rule:owner or role:reader)',
+}
+
+CREDS = [dict(c, roles=roles) for roles, c in itertools.product(
+    ([], ['admin'], ['member', 'A'], ['banned', 'a'], ['DEFAULT'],
+     ['Member', 'reader']),
+    ({}, {'project_id': 'p1', 'user_id': 'u1'},
+     {'project_id': 'p2', 'user_id': 'u1'}))]
+
+TARGETS = [{},
+           {'project_id': 'p1', 'user_id': 'u1', 'status': 'enabled',
+            'enabled': True},
+           {'project_id': 'p2', 'user_id': 'u2', 'status': 'disabled',
+            'enabled': 1},
+           {'project_id': 'p1', 'user_id': 'u2', 'enabled': 'True'}]
+
+
+def _load(rules, default_rule='default'):
+    return policy.Rules.load_json(jsonutils.dumps(rules), default_rule)
+
+
+class TestCompiledRules(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestCompiledRules, self).setUp()
+        self.useFixture(config_fixture.Config())
+        self.enforcer = policy.Enforcer(default_rule='default',
+                                        use_conf=False)
+        self.enforcer.set_rules(_load(RULES))
+
+    def test_compiled_matches_check_tree(self):
+        rules = self.enforcer.rules
+        for name in list(RULES) + ['undefined']:
+            for target, creds in itertools.product(TARGETS, CREDS):
+                expected = rules[name](target, creds, self.enforcer)
+                compiled = rules.compiled(name)[0]
+                self.assertEqual(expected,
+                                 compiled(target, creds, self.enforcer),
+                                 (name, target, creds))
+                # Twice, the second time through the decision cache
+                for _ in range(2):
+                    self.assertEqual(
+                        expected,
+                        self.enforcer.enforce(name, target, creds),
+                        (name, target, creds))
+
+    def test_missing_rule_uses_default_rule(self):
+        self.assertTrue(self.enforcer.enforce('undefined', {},
+                                              {'roles': ['default']}))
+        self.assertFalse(self.enforcer.enforce('undefined', {},
+                                               {'roles': ['admin']}))
+
+    def test_missing_rule_and_default_rule(self):
+        rules = dict(RULES)
+        del rules['default']
+        self.enforcer.set_rules(_load(rules))
+        self.assertFalse(self.enforcer.enforce('undefined', {},
+                                               {'roles': ['default']}))
+
+    def test_fields(self):
+        rules = self.enforcer.rules
+        self.assertEqual(((), ('roles',)), rules.compiled('admin')[1])
+        self.assertEqual((('project_id',), ('project_id',)),
+                         rules.compiled('owner')[1])
+        self.assertEqual((('project_id',), ('project_id', 'roles')),
+                         rules.compiled('admin_or_owner')[1])
+        self.assertEqual((('status',), ()), rules.compiled('literal')[1])
+        self.assertIsNone(rules.compiled('whole_target')[1])
+
+    def test_recursive_rule(self):
+        self.enforcer.set_rules(_load({'loop': 'role:admin or rule:loop'}))
+        self.assertTrue(self.enforcer.enforce('loop', {},
+                                              {'roles': ['admin']}))
+        self.assertIsNone(self.enforcer.rules.compiled('loop')[1])
+
+
+class TestDecisionCache(base.BaseTestCase):
+
+    target = {'project_id': 'p1', 'user_id': 'u1'}
+    creds = {'roles': ['Member'], 'project_id': 'p1', 'user_id': 'u1'}
+
+    def setUp(self):
+        super(TestDecisionCache, self).setUp()
+        self.conf = self.useFixture(config_fixture.Config()).conf
+        self.conf.set_override('policy_recheck_interval', 0)
+        self.enforcer = policy.Enforcer(default_rule='default',
+                                        use_conf=False)
+        self.enforcer.set_rules(_load(RULES))
+
+    def _enforce(self):
+        return self.enforcer.enforce('big', self.target, self.creds)
+
+    def _assert_cached(self):
+        self.assertTrue(self._enforce())
+        hits = self.enforcer.get_cache_stats()['hits']
+        self.assertTrue(self._enforce())
+        self.assertEqual(hits + 1, self.enforcer.get_cache_stats()['hits'])
+
+    def _denied_rules(self):
+        rules = dict(RULES)
+        rules['owner'] = '!'
+        return _load(rules)
+
+    def test_set_rules_invalidates(self):
+        self._assert_cached()
+        self.enforcer.set_rules(self._denied_rules())
+        self.assertFalse(self._enforce())
+
+    def test_update_rules_invalidates(self):
+        self._assert_cached()
+        self.enforcer.set_rules({'owner': policy.parse_rule('!')},
+                                overwrite=False)
+        self.assertFalse(self._enforce())
+
+    def test_referenced_rule_change_invalidates(self):
+        self._assert_cached()
+        self.enforcer.rules['owner'] = policy.parse_rule('!')
+        self.assertFalse(self._enforce())
+
+    def test_clear_invalidates(self):
+        self._assert_cached()
+        self.enforcer.clear()
+        self.assertFalse(self._enforce())
+        self.enforcer.set_rules(self._denied_rules())
+        self.assertFalse(self._enforce())
+
+    def test_file_reload_invalidates(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'policy.json')
+        with open(path, 'w') as f:
+            f.write(jsonutils.dumps(RULES))
+        self.conf([], project='entropy')
+        self.conf.set_override('policy_file', path)
+        self.enforcer = policy.Enforcer()
+        self.addCleanup(self.enforcer.clear)
+        self._assert_cached()
+
+        rules = dict(RULES)
+        rules['owner'] = '!'
+        with open(path, 'w') as f:
+            f.write(jsonutils.dumps(rules))
+        # Make sure the modification time changes
+        mtime = time.time() + 10
+        os.utime(path, (mtime, mtime))
+        self.assertFalse(self._enforce())
+
+    def test_cache_disabled(self):
+        self.conf.set_override('policy_cache_size', 0)
+        self.enforcer = policy.Enforcer(use_conf=False)
+        self.enforcer.set_rules(_load(RULES))
+        self.assertTrue(self._enforce())
+        self.assertTrue(self._enforce())
+        self.assertEqual(0, self.enforcer.get_cache_stats()['size'])
+
+    def test_lru_eviction(self):
+        self.conf.set_override('policy_cache_size', 2)
+        self.enforcer = policy.Enforcer(use_conf=False)
+        self.enforcer.set_rules(_load(RULES))
+        for user_id in ('u1', 'u2', 'u3'):
+            self.enforcer.enforce('big', self.target,
+                                  dict(self.creds, user_id=user_id))
+        self.assertEqual(2, self.enforcer.get_cache_stats()['size'])
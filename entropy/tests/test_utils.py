@@ -0,0 +1,218 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+import datetime
+import decimal
+
+import fixtures
+from oslotest import base
+
+from entropy import utils
+
+
+class TestHashRing(base.BaseTestCase):
+
+    def test_reject_non_positive_weight(self):
+        self.assertRaises(ValueError, utils.HashRing, {'a': 1, 'b': 0})
+        self.assertRaises(ValueError, utils.HashRing, {'a': 1, 'b': -1})
+        ring = utils.HashRing(['a'])
+        self.assertRaises(ValueError, ring.add_node, 'b', 0)
+        self.assertEqual(['a'], ring.nodes)
+
+    def test_reject_duplicate_node(self):
+        self.assertRaises(ValueError, utils.HashRing, ['a', 'a'])
+        ring = utils.HashRing(['a'])
+        self.assertRaises(ValueError, ring.add_node, 'a')
+
+    def test_get_nodes_skips_nodes_without_points(self):
+        # A weight this low rounds down to no point on the ring
+        ring = utils.HashRing({'a': 1, 'b': 0.001}, replicas=10)
+        self.assertEqual(('a',), ring.get_nodes('x', 2))
+        self.assertEqual({'x': ('a',)}, ring.ownership(['x'], replicas=2))
+
+    def test_get_nodes_more_replicas_than_nodes(self):
+        ring = utils.HashRing(['a', 'b'])
+        self.assertEqual(set(['a', 'b']), set(ring.get_nodes('x', 3)))
+
+    def test_get_nodes_more_replicas_than_nodes_after_removal(self):
+        ring = utils.HashRing({'a': 1, 'b': 5, 'c': 0.001}, replicas=10)
+        ring.remove_node('a')
+        for i in range(50):
+            self.assertEqual(('b',), ring.get_nodes('key-%d' % i, 1000))
+
+    def test_ownership_matches_get_nodes(self):
+        ring = utils.HashRing({'a': 1, 'b': 2, 'c': 1, 'd': 0.5})
+        keys = ['key-%d' % i for i in range(500)]
+        for replicas in (1, 2, 3, 4, 10):
+            self.assertEqual(
+                dict((key, ring.get_nodes(key, replicas)) for key in keys),
+                ring.ownership(keys, replicas))
+
+    def test_lookups_keep_no_state(self):
+        # Memory must not grow with the weights times the replicas looked
+        # up, successors are found by walking the ring
+        ring = utils.HashRing({'a': 1, 'b': 50})
+        state = copy.deepcopy(vars(ring))
+        ring.get_nodes('x', 2)
+        ring.ownership(['key-%d' % i for i in range(100)], replicas=2)
+        self.assertEqual(state, vars(ring))
+
+    def test_weights_share_keys(self):
+        ring = utils.HashRing({'a': 1, 'b': 3})
+        keys = ['key-%d' % i for i in range(4000)]
+        owners = ring.get_nodes_bulk(keys)
+        share = owners.count('b') / float(len(keys))
+        self.assertTrue(0.65 < share < 0.85, share)
+
+    def test_get_nodes_bulk_matches_get_node(self):
+        ring = utils.HashRing(['a', 'b', 'c'])
+        keys = ['key-%d' % i for i in range(500)]
+        self.assertEqual([ring.get_node(key) for key in keys],
+                         ring.get_nodes_bulk(keys))
+
+    def test_get_nodes_distinct_primary_first(self):
+        ring = utils.HashRing(['a', 'b', 'c', 'd'])
+        for i in range(100):
+            key = 'key-%d' % i
+            nodes = ring.get_nodes(key, 3)
+            self.assertEqual(3, len(set(nodes)))
+            self.assertEqual(ring.get_node(key), nodes[0])
+
+    def test_get_nodes_empty_ring(self):
+        ring = utils.HashRing([])
+        self.assertIsNone(ring.get_node('x'))
+        self.assertEqual((), ring.get_nodes('x', 2))
+        self.assertEqual([None], ring.get_nodes_bulk(['x']))
+
+    def test_add_remove_node_only_moves_its_keys(self):
+        ring = utils.HashRing(['a', 'b', 'c'])
+        keys = ['key-%d' % i for i in range(1000)]
+        before = ring.ownership(keys)
+        ring.add_node('d')
+        after = ring.ownership(keys)
+        for key in keys:
+            if after[key] != before[key]:
+                self.assertEqual(('d',), after[key])
+        ring.remove_node('d')
+        self.assertEqual(before, ring.ownership(keys))
+        self.assertRaises(ValueError, ring.remove_node, 'd')
+
+    def test_incremental_membership_matches_rebuild(self):
+        keys = ['key-%d' % i for i in range(1000)]
+        ring = utils.HashRing({'a': 1, 'b': 2})
+        ring.add_node('c', 0.5)
+        ring.add_node('d')
+        ring.remove_node('b')
+        ring.add_node('b', 2)
+        expected = utils.HashRing({'a': 1, 'b': 2, 'c': 0.5, 'd': 1})
+        self.assertEqual(sorted(expected.nodes), sorted(ring.nodes))
+        self.assertEqual(expected.ownership(keys, 2),
+                         ring.ownership(keys, 2))
+        ring.remove_node('d')
+        self.assertEqual(
+            utils.HashRing({'a': 1, 'b': 2, 'c': 0.5}).ownership(keys, 2),
+            ring.ownership(keys, 2))
+
+    def test_add_node_only_hashes_its_points(self):
+        ring = utils.HashRing(['a', 'b'], replicas=10)
+        hashed = []
+        ring._hash_function = lambda data: hashed.append(data) or len(hashed)
+        ring.add_node('c', 2)
+        self.assertEqual(20, len(hashed))
+        self.assertEqual(40, len(ring._keys))
+        ring.remove_node('a')
+        self.assertEqual(20, len(hashed))
+        self.assertEqual(30, len(ring._keys))
+        self.assertEqual(list(ring._keys), sorted(ring._keys))
+
+    def _check_bulk_matches_bisect(self, ring):
+        keys = ['key-%d' % i for i in range(2000)]
+        expected = [ring.get_node(key) for key in keys]
+        self.assertEqual(expected, ring.get_nodes_bulk(keys))
+        with_numpy = ring.ownership(keys, 2)
+        self.useFixture(fixtures.MonkeyPatch('entropy.utils.numpy', None))
+        self.assertEqual(expected, ring.get_nodes_bulk(keys))
+        self.assertEqual(with_numpy, ring.ownership(keys, 2))
+
+    def test_bulk_matches_bisect(self):
+        self._check_bulk_matches_bisect(utils.HashRing(['a', 'b', 'c']))
+
+    def test_bulk_matches_bisect_wrapping_around(self):
+        # A few crc32 points leave many keys past the last one
+        ring = utils.HashRing(['a', 'b'], replicas=2, hash_function='crc32')
+        self._check_bulk_matches_bisect(ring)
+        last = ring._keys[-1]
+        self.assertTrue(any(ring._hash('key-%d' % i) >= last
+                            for i in range(2000)))
+
+    def test_diff_ownership(self):
+        old = {'k1': ('a', 'b'), 'k2': ('b', 'c'), 'k3': ('a',)}
+        new = {'k1': ('b', 'c'), 'k2': ('a', 'b'), 'k4': ('a',)}
+        self.assertEqual((set(['k2', 'k4']), set(['k1', 'k3'])),
+                         utils.HashRing.diff_ownership(old, new, 'a'))
+        self.assertEqual((set(), set()),
+                         utils.HashRing.diff_ownership(old, new, 'b'))
+        self.assertEqual((set(['k1']), set(['k2'])),
+                         utils.HashRing.diff_ownership(old, new, 'c'))
+
+    def test_diff_ownership_after_add_node(self):
+        ring = utils.HashRing(['a', 'b'])
+        keys = ['key-%d' % i for i in range(500)]
+        old = ring.ownership(keys)
+        ring.add_node('c')
+        new = ring.ownership(keys)
+        moved = set(k for k in keys if new[k] == ('c',))
+        self.assertEqual((moved, set()),
+                         utils.HashRing.diff_ownership(old, new, 'c'))
+        lost = set()
+        for node in ('a', 'b'):
+            gained, node_lost = utils.HashRing.diff_ownership(old, new, node)
+            self.assertEqual(set(), gained)
+            lost |= node_lost
+        self.assertEqual(moved, lost)
+
+
+class TestTimestamps(base.BaseTestCase):
+
+    TIMESTAMPS = [datetime.datetime(1970, 1, 1),
+                  datetime.datetime(1969, 12, 31, 23, 59, 59, 999999),
+                  datetime.datetime(2014, 6, 1, 12, 30, 15, 123456)]
+    MICROSECONDS = [0, -1, 1401625815123456]
+
+    def test_round_trip(self):
+        self.assertEqual(self.MICROSECONDS,
+                         [utils.dt_to_us(t) for t in self.TIMESTAMPS])
+        self.assertEqual(self.TIMESTAMPS,
+                         [utils.us_to_dt(us) for us in self.MICROSECONDS])
+        self.assertIsNone(utils.dt_to_us(None))
+        self.assertIsNone(utils.us_to_dt(None))
+
+    def test_decimal_round_trip(self):
+        for timestamp in self.TIMESTAMPS:
+            self.assertEqual(timestamp, utils.decimal_to_dt(
+                utils.dt_to_decimal(timestamp)))
+        self.assertEqual(decimal.Decimal('1401625815.123456'),
+                         utils.dt_to_decimal(self.TIMESTAMPS[2]))
+
+    def _check_bulk(self):
+        self.assertEqual(self.MICROSECONDS, utils.dts_to_us(self.TIMESTAMPS))
+        self.assertEqual(self.TIMESTAMPS, utils.us_to_dts(self.MICROSECONDS))
+        self.assertEqual([], utils.dts_to_us([]))
+        self.assertEqual([], utils.us_to_dts([]))
+
+    def test_bulk(self):
+        self._check_bulk()
+
+    def test_bulk_without_numpy(self):
+        self.useFixture(fixtures.MonkeyPatch('entropy.utils.numpy', None))
+        self._check_bulk()
@@ -0,0 +1,68 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+
+from oslo.utils import timeutils
+from oslotest import base
+
+from entropy.api import watch
+from entropy.db import impl_memory
+
+
+class TestHub(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestHub, self).setUp()
+        self.conn = impl_memory.Connection('memory://')
+        self.conn.record_resources('r1', 'server', {})
+        self.hub = watch.Hub(self.conn, interval=1, buffer_size=10,
+                             max_subscribers=10)
+        # Poll by hand rather than from the hub's green thread
+        self.hub._since = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        self.subscriber = watch.Subscriber(None, 10)
+        self.hub._subscribers.add(self.subscriber)
+
+    def _received(self):
+        ids = []
+        while not self.subscriber.queue.empty():
+            ids.append(self.subscriber.get(0).id)
+        return ids
+
+    def test_marker_follows_transitions(self):
+        self.conn.update_ha_condition('r1', 'up')
+        self.hub._poll()
+        self.assertEqual([1], self._received())
+        self.conn.update_ha_condition('r1', 'down')
+        self.hub._poll()
+        self.hub._poll()
+        self.assertEqual([2], self._received())
+
+    def test_transitions_after_expiry_are_delivered(self):
+        self.conn.update_ha_condition('r1', 'up')
+        self.hub._poll()
+        self.conn.clear_expired_data(-60)
+        self.conn.record_resources('r1', 'server', {})
+        self.conn.update_ha_condition('r1', 'down')
+        self.hub._poll()
+        self.assertEqual([1, 2], self._received())
+
+    def test_filter_by_resource(self):
+        self.conn.record_resources('r2', 'server', {})
+        subscriber = watch.Subscriber('r2', 10)
+        self.hub._subscribers.add(subscriber)
+        self.conn.update_ha_condition('r1', 'up')
+        self.conn.update_ha_condition('r2', 'up')
+        self.hub._poll()
+        self.assertEqual('r2', subscriber.get(0).resource_id)
+        self.assertTrue(subscriber.queue.empty())
@@ -12,16 +12,19 @@
 
 """Utilities and helper functions."""
 
+import array
 import bisect
-import calendar
 import copy
 import datetime
 import decimal
 import hashlib
+import json
 import multiprocessing
 import struct
+import zlib
 
 from oslo.config import cfg
+from oslo.utils import importutils
 from oslo.utils import timeutils
 from oslo.utils import units
 import six
@@ -78,6 +81,100 @@ def restore_nesting(d, separator=':'):
     return d
 
 
+# JSON libraries which may store documents, see set_json_codec().
+JSON_CODECS = ('json', 'ujson')
+
+_json_codec = json
+
+
+def set_json_codec(name='json'):
+    """Use the JSON library name to store documents.
+
+    ujson encodes and decodes the small documents we store several times
+    faster than json, but it rounds floats to fewer digits and escapes
+    strings differently, so it is only used when asked for.
+
+    :param name: One of JSON_CODECS.
+    :returns: The selected module.
+    :raises: ValueError if name is unknown, ImportError if the library is
+             not installed.
+    """
+    global _json_codec
+    if name not in JSON_CODECS:
+        raise ValueError('Unknown JSON library %s, expected one of %s'
+                         % (name, ', '.join(JSON_CODECS)))
+    _json_codec = importutils.import_module(name)
+    return _json_codec
+
+
+def json_dumps(value):
+    return _json_codec.dumps(value)
+
+
+def json_loads(value):
+    return _json_codec.loads(value)
+
+
+class LazyJSON(object):
+    """A JSON document which is only decoded when its value is needed."""
+
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def decode(self):
+        return json_loads(self.raw)
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+numpy = importutils.try_import('numpy')
+
+
+def dt_to_us(utc):
+    """Datetime to integer microseconds since the epoch."""
+    if utc is None:
+        return None
+    delta = utc - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * units.M + delta.microseconds
+
+
+def us_to_dt(us):
+    """Return a datetime from integer microseconds since the epoch."""
+    if us is None:
+        return None
+    return _EPOCH + datetime.timedelta(microseconds=us)
+
+
+def dts_to_us(utcs):
+    """Convert a sequence of datetimes to microseconds since the epoch.
+
+    Uses numpy when available to convert the whole sequence at once.
+    None values are not supported.
+    """
+    if numpy is not None:
+        return numpy.array(utcs, dtype='datetime64[us]').astype(
+            'int64').tolist()
+    epoch = _EPOCH
+    return [((d.days * 86400 + d.seconds) * units.M + d.microseconds)
+            for d in (utc - epoch for utc in utcs)]
+
+
+def us_to_dts(uss):
+    """Convert a sequence of microseconds since the epoch to datetimes.
+
+    Uses numpy when available to convert the whole sequence at once.
+    None values are not supported.
+    """
+    if numpy is not None:
+        return numpy.array(uss, dtype='int64').astype(
+            'datetime64[us]').tolist()
+    epoch = _EPOCH
+    timedelta = datetime.timedelta
+    return [epoch + timedelta(microseconds=us) for us in uss]
+
+
 def dt_to_decimal(utc):
     """Datetime to Decimal.
 
@@ -87,10 +184,9 @@ def dt_to_decimal(utc):
     if utc is None:
         return None
 
-    decimal.getcontext().prec = 30
-    return (decimal.Decimal(str(calendar.timegm(utc.utctimetuple()))) +
-            (decimal.Decimal(str(utc.microsecond)) /
-            decimal.Decimal("1000000.0")))
+    # NOTE: build the value from its exact integer representation, this
+    # neither depends on nor alters the decimal context.
+    return decimal.Decimal(dt_to_us(utc)).scaleb(-6)
 
 
 def decimal_to_dt(dec):
@@ -98,10 +194,8 @@ def decimal_to_dt(dec):
     if dec is None:
         return None
 
-    integer = int(dec)
-    micro = (dec - decimal.Decimal(integer)) * decimal.Decimal(units.M)
-    daittyme = datetime.datetime.utcfromtimestamp(integer)
-    return daittyme.replace(microsecond=int(round(micro)))
+    return us_to_dt(int(dec.scaleb(6).to_integral_value(
+        rounding=decimal.ROUND_HALF_EVEN)))
 
 
 def sanitize_timestamp(timestamp):
@@ -193,31 +287,212 @@ def uniq(dupes, attrs):
     return deduped
 
 
-class HashRing(object):
+def _md5_hash(key):
+    return struct.unpack_from('>I', hashlib.md5(key).digest())[0]
 
-    def __init__(self, nodes, replicas=100):
-        self._ring = dict()
-        self._sorted_keys = []
 
-        for node in nodes:
-            for r in six.moves.range(replicas):
-                hashed_key = self._hash('%s-%s' % (node, r))
-                self._ring[hashed_key] = node
-                self._sorted_keys.append(hashed_key)
-        self._sorted_keys.sort()
+def _crc32_hash(key):
+    return zlib.crc32(key) & 0xffffffff
 
-    @staticmethod
-    def _hash(key):
-        return struct.unpack_from('>I',
-                                  hashlib.md5(str(key).encode()).digest())[0]
+
+# Type code of the arrays holding 32 bits hashes and node indexes.
+_ARRAY_TYPECODE = 'I' if array.array('I').itemsize >= 4 else 'L'
+
+
+class HashRing(object):
+    """A consistent hash ring with weighted nodes.
+
+    Every node is placed on the ring at replicas * weight points, and a key
+    belongs to the node owning the first point following the hash of the
+    key.  The points are kept in a sorted array alongside the index of
+    their node, so that adding or removing a node only hashes the points of
+    that node and only moves the keys it gains or loses.
+
+    :param nodes: Node names, or a dict mapping node names to weights.
+    :param replicas: Number of points of a node of weight 1.
+    :param hash_function: Name of the hash placing points and keys on the
+                          ring, 'md5' or the cheaper 'crc32'.
+    """
+
+    HASH_FUNCTIONS = {'md5': _md5_hash, 'crc32': _crc32_hash}
+
+    def __init__(self, nodes, replicas=100, hash_function='md5'):
+        self.replicas = replicas
+        self._hash_function = self.HASH_FUNCTIONS[hash_function]
+        self._weights = {}
+        # Node names by index, removed nodes leave a None slot behind so
+        # that the indexes of the remaining ones don't change.
+        self._node_names = []
+        self._keys = array.array(_ARRAY_TYPECODE)
+        self._owners = array.array(_ARRAY_TYPECODE)
+        # Number of distinct nodes owning points
+        self._owner_count = 0
+        if isinstance(nodes, dict):
+            self._add_nodes(six.iteritems(nodes))
+        else:
+            self._add_nodes((node, 1) for node in nodes)
+
+    @property
+    def nodes(self):
+        return list(self._weights)
+
+    def _hash(self, key):
+        return self._hash_function(six.text_type(key).encode('utf-8'))
+
+    def _add_nodes(self, nodes):
+        nodes = list(nodes)
+        seen = set(self._weights)
+        for node, weight in nodes:
+            if node in seen:
+                raise ValueError('Node %s is already in the ring' % node)
+            if not weight > 0:
+                raise ValueError('Weight of node %s must be positive, got %s'
+                                 % (node, weight))
+            seen.add(node)
+        points = []
+        for node, weight in nodes:
+            index = len(self._node_names)
+            self._node_names.append(node)
+            self._weights[node] = weight
+            points.extend((self._hash('%s-%s' % (node, r)), index)
+                          for r in six.moves.range(
+                              int(round(self.replicas * weight))))
+        if not points:
+            return
+        points.extend(six.moves.zip(self._keys, self._owners))
+        points.sort()
+        self._keys = array.array(_ARRAY_TYPECODE, (p[0] for p in points))
+        self._owners = array.array(_ARRAY_TYPECODE, (p[1] for p in points))
+        self._owner_count = len(set(self._owners))
+
+    def add_node(self, node, weight=1):
+        """Add a node to the ring, only hashing the points of that node."""
+        self._add_nodes([(node, weight)])
+
+    def remove_node(self, node):
+        """Remove a node from the ring, without hashing any point."""
+        if node not in self._weights:
+            raise ValueError('Node %s is not in the ring' % node)
+        del self._weights[node]
+        index = self._node_names.index(node)
+        self._node_names[index] = None
+        keep = [i for i, owner in enumerate(self._owners) if owner != index]
+        self._keys = array.array(_ARRAY_TYPECODE,
+                                 (self._keys[i] for i in keep))
+        self._owners = array.array(_ARRAY_TYPECODE,
+                                   (self._owners[i] for i in keep))
+        self._owner_count = len(set(self._owners))
 
     def _get_position_on_ring(self, key):
         hashed_key = self._hash(key)
-        position = bisect.bisect(self._sorted_keys, hashed_key)
-        return position if position < len(self._sorted_keys) else 0
+        position = bisect.bisect(self._keys, hashed_key)
+        return position if position < len(self._keys) else 0
+
+    def _get_positions_on_ring(self, keys):
+        hashes = [self._hash(key) for key in keys]
+        size = len(self._keys)
+        if numpy is not None:
+            positions = numpy.searchsorted(numpy.asarray(self._keys),
+                                           hashes, side='right')
+            positions[positions == size] = 0
+            return positions.tolist()
+        ring_keys = self._keys
+        bisect_right = bisect.bisect
+        positions = []
+        for hashed_key in hashes:
+            pos = bisect_right(ring_keys, hashed_key)
+            positions.append(pos if pos < size else 0)
+        return positions
+
+    def _get_successors(self, pos, replicas):
+        """Return the distinct nodes owning the points from pos on.
+
+        The ring is walked from the point until replicas distinct nodes are
+        met, which usually takes a few steps.  Only the nodes owning points
+        are counted, a node whose weight is too low to get any point is
+        never returned.
+        """
+        names = self._node_names
+        owners = self._owners
+        if replicas == 1:
+            return (names[owners[pos]],)
+        count = min(replicas, self._owner_count)
+        size = len(owners)
+        nodes = []
+        # At most one full pass of the ring
+        for _ in six.moves.range(size):
+            node = names[owners[pos]]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == count:
+                    break
+            pos = pos + 1 if pos + 1 < size else 0
+        return tuple(nodes)
 
     def get_node(self, key):
-        if not self._ring:
+        if not self._keys:
             return None
         pos = self._get_position_on_ring(key)
-        return self._ring[self._sorted_keys[pos]]
+        return self._node_names[self._owners[pos]]
+
+    def get_nodes(self, key, replicas=1):
+        """Return the distinct nodes owning a key, primary node first.
+
+        Fewer than replicas nodes are returned if the ring doesn't have
+        that many nodes owning points.
+        """
+        if not self._keys:
+            return ()
+        return self._get_successors(self._get_position_on_ring(key),
+                                    replicas)
+
+    def get_nodes_bulk(self, keys):
+        """Return the node of each key of a sequence, in the same order.
+
+        The ring lookups are vectorized with numpy when it is available,
+        which makes assigning large numbers of keys at once much cheaper
+        than calling get_node() for each of them.
+        """
+        if not self._keys:
+            return [None] * len(keys)
+        names = self._node_names
+        owners = self._owners
+        return [names[owners[pos]]
+                for pos in self._get_positions_on_ring(keys)]
+
+    def ownership(self, keys, replicas=1):
+        """Return a table mapping every key to the tuple of its nodes.
+
+        The nodes following a point are only looked up once per call, as
+        keys outnumber points.
+        """
+        keys = list(keys)
+        if not self._keys:
+            return dict((key, ()) for key in keys)
+        successors = {}
+        table = {}
+        for key, pos in six.moves.zip(keys,
+                                      self._get_positions_on_ring(keys)):
+            nodes = successors.get(pos)
+            if nodes is None:
+                nodes = successors[pos] = self._get_successors(pos,
+                                                               replicas)
+            table[key] = nodes
+        return table
+
+    @staticmethod
+    def diff_ownership(old, new, node):
+        """Compare two ownership tables from the point of view of a node.
+
+        :returns: The set of keys the node gained and the set of keys it
+                  lost, including keys which appeared or disappeared.
+        """
+        gained = set()
+        lost = set()
+        for key, nodes in six.iteritems(new):
+            if node in nodes and node not in old.get(key, ()):
+                gained.add(key)
+        for key, nodes in six.iteritems(old):
+            if node in nodes and node not in new.get(key, ()):
+                lost.add(key)
+        return gained, lost
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure the cost and the balance of the agents hash ring.
+
+Usage: bench_hashring.py [--nodes N] [--keys N] [--replicas N]
+
+For every hash function, reports the time to build a ring of N nodes, the
+throughput of per-key and bulk lookups, the time to add and remove a node
+and the share of the keys moved by these changes, which ideally is
+1 / (N + 1).
+"""
+
+from entropy import utils
+
+import benchutils
+
+
+def _moved(before, after):
+    return sum(1 for b, a in zip(before, after) if b != a) / float(len(before))
+
+
+def main():
+    parser = benchutils.parser(__doc__)
+    parser.add_argument('--nodes', type=int, default=10,
+                        help='Number of nodes of the ring.')
+    parser.add_argument('--keys', type=int, default=100000,
+                        help='Number of keys looked up.')
+    parser.add_argument('--replicas', type=int, default=100,
+                        help='Number of points of each node.')
+    args = benchutils.parse_args(parser)
+
+    nodes = ['agent-%d' % i for i in range(args.nodes)]
+    keys = ['resource-%d' % i for i in range(args.keys)]
+    print('numpy: %s' % ('yes' if utils.numpy is not None else 'no'))
+    for hash_function in sorted(utils.HashRing.HASH_FUNCTIONS):
+        ring, build = benchutils.timed(utils.HashRing, nodes,
+                                       args.replicas, hash_function)
+        _, single = benchutils.timed(
+            lambda: [ring.get_node(k) for k in keys])
+        before, bulk = benchutils.timed(ring.get_nodes_bulk, keys)
+        _, add = benchutils.timed(ring.add_node, 'agent-new')
+        added = ring.get_nodes_bulk(keys)
+        _, remove = benchutils.timed(ring.remove_node, 'agent-new')
+        removed = ring.get_nodes_bulk(keys)
+        assert removed == before, hash_function
+
+        print('%s:' % hash_function)
+        print('  build        %8.4fs' % build)
+        print('  get_node     %8.4fs %12.1f keys/s' % (single,
+                                                       args.keys / single))
+        print('  bulk         %8.4fs %12.1f keys/s' % (bulk, args.keys / bulk))
+        print('  add_node     %8.4fs %7.2f%% keys moved (ideal %.2f%%)' % (
+            add, _moved(before, added) * 100, 100.0 / (args.nodes + 1)))
+        print('  remove_node  %8.4fs %7.2f%% keys moved' % (
+            remove, _moved(added, removed) * 100))
+
+
+if __name__ == '__main__':
+    main()
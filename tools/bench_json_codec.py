@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure the per-row cost of encoding and decoding resource metadata.
+
+Usage: bench_json_codec.py [--rows N]
+
+Every JSON library of utils.JSON_CODECS which is installed is measured,
+along with the cost of handing rows over as utils.LazyJSON documents
+which are never decoded.
+"""
+
+from oslo.utils import importutils
+
+from entropy import utils
+
+import benchutils
+
+
+def _metadata(keys):
+    return dict(('key-%d' % i, {'host': 'compute-%d' % i,
+                                'flavor': 'm1.small',
+                                'tags': ['ha', 'prod'],
+                                'vcpus': i % 8})
+                for i in range(keys))
+
+
+SIZES = (('small', _metadata(2)),
+         ('medium', _metadata(20)),
+         ('large', _metadata(200)))
+
+
+def _per_row_us(stmt, rows):
+    return benchutils.best(stmt, number=rows)[1] * 1e6
+
+
+def main():
+    parser = benchutils.parser(__doc__)
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='Number of rows encoded and decoded per run.')
+    args = benchutils.parse_args(parser)
+
+    print('%-8s %-8s %8s %12s %12s' % ('codec', 'size', 'bytes',
+                                       'encode us', 'decode us'))
+    for name in utils.JSON_CODECS:
+        if importutils.try_import(name) is None:
+            continue
+        utils.set_json_codec(name)
+        for size, meta in SIZES:
+            raw = utils.json_dumps(meta)
+            encode = _per_row_us(lambda: utils.json_dumps(meta), args.rows)
+            decode = _per_row_us(lambda: utils.json_loads(raw), args.rows)
+            print('%-8s %-8s %8d %12.2f %12.2f' % (name, size, len(raw),
+                                                   encode, decode))
+    utils.set_json_codec()
+
+    for size, meta in SIZES:
+        raw = utils.json_dumps(meta)
+        lazy = _per_row_us(lambda: utils.LazyJSON(raw), args.rows)
+        print('%-8s %-8s %8d %12s %12.2f' % ('lazy', size, len(raw), '-',
+                                             lazy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compare jsonutils serialization of large payloads with raw json.
+
+Usage: bench_jsonutils.py [--resources N]
+
+Serializes a listing of N resources, once made of primitives only and
+once carrying a datetime per resource, with json.dumps(), with
+jsonutils.dumps() and with jsonutils.to_primitive() followed by
+json.dumps(), and prints each time relative to json.dumps().
+"""
+
+import datetime
+import json
+
+from entropy.openstack.common import jsonutils
+
+import benchutils
+
+
+def _payload(count, with_datetime):
+    created = datetime.datetime(2014, 1, 1)
+    return [{'resource_id': 'resource-%d' % i,
+             'resource_type': 'instance',
+             'created_at': (created + datetime.timedelta(seconds=i)
+                            if with_datetime else '2014-01-01T00:00:00'),
+             'resource_meta': {'host': 'compute-%d' % (i % 100),
+                               'tags': ['ha', 'prod'],
+                               'vcpus': i % 8}}
+            for i in range(count)]
+
+
+def main():
+    parser = benchutils.parser(__doc__)
+    parser.add_argument('--resources', type=int, default=10000,
+                        help='Number of resources of the payload.')
+    args = benchutils.parse_args(parser)
+
+    for name, with_datetime in (('primitive', False), ('datetime', True)):
+        payload = _payload(args.resources, with_datetime)
+        _, baseline = benchutils.best(
+            lambda: json.dumps(payload, default=str), repeat=5)
+        print('%s payload, %d resources:' % (name, args.resources))
+        for label, func in (
+                ('json.dumps', lambda: json.dumps(payload, default=str)),
+                ('jsonutils.dumps', lambda: jsonutils.dumps(payload)),
+                ('to_primitive + dumps', lambda: json.dumps(
+                    jsonutils.to_primitive(payload))),
+                ('to_primitive', lambda: jsonutils.to_primitive(payload))):
+            _, elapsed = benchutils.best(func, repeat=5)
+            print('  %-22s %8.4fs %6.2fx' % (label, elapsed,
+                                             elapsed / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure the records formatted per second by log.ContextFormatter.
+
+Usage: bench_logging.py [--records N]
+
+Formats N records at DEBUG and INFO, with and without a request context,
+with the ContextFormatter and with a copy of its previous implementation
+which looked the format up and dictified the context on every record, and
+prints the records formatted per second by each.
+"""
+
+import logging
+import sys
+
+from oslo.config import cfg
+import six
+
+from entropy.openstack.common import context as common_context
+from entropy.openstack.common import local
+from entropy.openstack.common import log
+
+import benchutils
+
+
+class LegacyContextFormatter(log.ContextFormatter):
+    def format(self, record):
+        if not isinstance(record.msg, six.text_type):
+            record.msg = six.text_type(record.msg)
+
+        record.project = self.project
+        record.version = self.version
+
+        context = getattr(local.store, 'context', None)
+        if context:
+            d = log._dictify_context(context)
+            for k, v in d.items():
+                setattr(record, k, v)
+
+        for key in ('instance', 'color', 'user_identity'):
+            if key not in record.__dict__:
+                record.__dict__[key] = ''
+
+        if record.__dict__.get('request_id'):
+            fmt = cfg.CONF.logging_context_format_string
+        else:
+            fmt = cfg.CONF.logging_default_format_string
+
+        if (record.levelno == logging.DEBUG and
+                cfg.CONF.logging_debug_format_suffix):
+            fmt += " " + cfg.CONF.logging_debug_format_suffix
+
+        if sys.version_info < (3, 2):
+            self._fmt = fmt
+        else:
+            self._style = logging.PercentStyle(fmt)
+            self._fmt = self._style._fmt
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info, record)
+        return logging.Formatter.format(self, record)
+
+
+def _rate(formatter, level, count):
+    records = [logging.LogRecord('entropy.bench', level, __file__, 1,
+                                 'resource %s is %s', ('r-1', 'down'), None)
+               for _ in range(count)]
+    _, elapsed = benchutils.best(lambda: [formatter.format(r)
+                                          for r in records])
+    return count / elapsed
+
+
+def main():
+    parser = benchutils.parser(__doc__)
+    parser.add_argument('--records', type=int, default=50000,
+                        help='Number of records formatted per run.')
+    args = benchutils.parse_args(parser)
+
+    formatters = (('legacy', LegacyContextFormatter(project='entropy')),
+                  ('cached', log.ContextFormatter(project='entropy')))
+
+    for label, context in (('no context', None),
+                           ('context', common_context.RequestContext())):
+        if context is None:
+            local.store.__dict__.pop('context', None)
+        else:
+            local.store.context = context
+        for level in (logging.DEBUG, logging.INFO):
+            rates = [_rate(formatter, level, args.records)
+                     for _, formatter in formatters]
+            print('%-10s %-5s %s %6.2fx' % (
+                label, logging.getLevelName(level),
+                ' '.join('%s %9.0f/s' % (name, rate) for (name, _), rate
+                         in zip(formatters, rates)),
+                rates[1] / rates[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compare per-row and bulk resource ingestion throughput.
+
+Usage: bench_record_resources.py [--url URL] [--count N]
+
+The database pointed to by URL is upgraded before and cleared after each run.
+"""
+
+import uuid
+
+from entropy.db import impl_sqlalchemy
+
+import benchutils
+
+
+def _resources(count):
+    return [{'resource_id': str(uuid.uuid4()),
+             'resource_type': 'instance',
+             'resource_meta': {'host': 'compute-%d' % (i % 100)}}
+            for i in range(count)]
+
+
+def bench_per_row(conn, resources):
+    for r in resources:
+        conn.record_resources(r['resource_id'], r['resource_type'],
+                              r['resource_meta'])
+
+
+def bench_bulk(conn, resources):
+    conn.record_resources_bulk(resources)
+
+
+def main():
+    parser = benchutils.parser(__doc__)
+    parser.add_argument('--url', default='sqlite://',
+                        help='Database connection URL.')
+    parser.add_argument('--count', type=int, default=5000,
+                        help='Number of resources to record per run.')
+    args = benchutils.parse_args(parser)
+
+    for name, bench in (('per-row', bench_per_row), ('bulk', bench_bulk)):
+        conn = impl_sqlalchemy.Connection(args.url)
+        conn.upgrade()
+        _, elapsed = benchutils.timed(bench, conn, _resources(args.count))
+        conn.clear()
+        print('%-8s %8d rows %8.3fs %10.1f rows/s' % (
+            name, args.count, elapsed, args.count / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark the storage layer and report machine-readable results.
+
+Usage: bench_storage.py [--url URL ...] [--sizes N,N,...] [--count N]
+                        [--repeat N] [--seed N] [--output FILE]
+
+For every database URL, measures per-row and bulk record_resources(), then
+get_resources() full scans, pages and filtered listings over tables of each
+size.  JSON metadata encoding and timestamp conversion are measured once.
+Resource ids are generated from a fixed seed so that runs are comparable,
+and listings keep the best of several runs.
+
+Results are written as a JSON document, one entry per measurement with its
+rate, so that the output of two releases can be diffed or fed to a
+regression check, while a summary is printed on stderr.
+"""
+
+import datetime
+import json
+import platform
+import random
+import sys
+
+from oslo.utils import importutils
+import six.moves.urllib.parse as urlparse
+
+from entropy.db import impl_memory
+from entropy.db import impl_sqlalchemy
+from entropy import utils
+
+import benchutils
+
+
+# Number of resources recorded per record_resources_bulk() call when
+# loading tables.
+LOAD_CHUNK = 10000
+# Size of the pages listed, matching the api/max_limit default.
+PAGE_SIZE = 1000
+# Number of resources put in the filtered HA condition.
+FILTERED = 100
+
+METADATA = {'host': 'compute-1', 'flavor': 'm1.small',
+            'tags': ['ha', 'prod'], 'vcpus': 2}
+
+
+def _connect(url):
+    if urlparse.urlparse(url).scheme == 'memory':
+        conn = impl_memory.Connection(url)
+    else:
+        conn = impl_sqlalchemy.Connection(url)
+    conn.upgrade()
+    return conn
+
+
+def _driver_name(url):
+    return urlparse.urlparse(url).scheme.split('+')[0]
+
+
+def _resources(rng, count):
+    for _ in range(count):
+        yield {'resource_id': '%032x' % rng.getrandbits(128),
+               'resource_type': 'instance',
+               'resource_meta': METADATA}
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Results(object):
+    def __init__(self):
+        self.entries = []
+
+    def add(self, name, driver, rows, seconds, unit='rows/s', **extra):
+        entry = dict(name=name, driver=driver, rows=rows, seconds=seconds,
+                     rate=rows / seconds if seconds else None, unit=unit)
+        entry.update(extra)
+        self.entries.append(entry)
+        sys.stderr.write('%-28s %-8s %9d rows %9.3fs %14.1f %s\n' % (
+            name, driver or '-', rows, seconds, entry['rate'] or 0, unit))
+
+
+def _record_single(conn, resources):
+    for r in resources:
+        conn.record_resources(r['resource_id'], r['resource_type'],
+                              r['resource_meta'])
+
+
+def _record_bulk(conn, resources):
+    conn.record_resources_bulk(resources)
+
+
+def bench_record(results, url, rng, count):
+    driver = _driver_name(url)
+    for name, record in (('record_resources.single', _record_single),
+                         ('record_resources.bulk', _record_bulk)):
+        conn = _connect(url)
+        resources = list(_resources(rng, count))
+        _, seconds = benchutils.timed(record, conn, resources)
+        results.add(name, driver, count, seconds)
+        conn.clear()
+
+
+def bench_get_resources(results, url, rng, size, repeat):
+    driver = _driver_name(url)
+    conn = _connect(url)
+    _, seconds = benchutils.timed(
+        lambda: [conn.record_resources_bulk(chunk)
+                 for chunk in _chunks(_resources(rng, size), LOAD_CHUNK)])
+    results.add('load', driver, size, seconds, table_rows=size)
+
+    ids = [r.resource_id for r in conn.get_resources()]
+    for resource_id in ids[::max(len(ids) // FILTERED, 1)][:FILTERED]:
+        conn.update_ha_condition(resource_id, 'down')
+    middle = ids[len(ids) // 2]
+
+    rows, seconds = benchutils.best(
+        lambda: sum(1 for _ in conn.get_resources()), repeat)
+    results.add('get_resources.scan', driver, rows, seconds,
+                table_rows=size)
+    rows, seconds = benchutils.best(
+        lambda: sum(1 for r in conn.get_resources() if r.resource_meta),
+        repeat)
+    results.add('get_resources.scan_decode', driver, rows, seconds,
+                table_rows=size)
+    rows, seconds = benchutils.best(lambda: len(list(conn.get_resources(
+        limit=PAGE_SIZE, marker=middle))), repeat)
+    results.add('get_resources.page', driver, rows, seconds,
+                table_rows=size)
+    rows, seconds = benchutils.best(lambda: len(list(conn.get_resources(
+        ha_condition='down'))), repeat)
+    results.add('get_resources.filtered', driver, rows, seconds,
+                table_rows=size)
+    conn.clear()
+
+
+def bench_json(results, count):
+    for name in utils.JSON_CODECS:
+        if importutils.try_import(name) is None:
+            continue
+        utils.set_json_codec(name)
+        raw = utils.json_dumps(METADATA)
+        _, seconds = benchutils.best(lambda: utils.json_dumps(METADATA),
+                                     number=count)
+        results.add('json.encode', None, count, seconds * count,
+                    codec=name)
+        _, seconds = benchutils.best(lambda: utils.json_loads(raw),
+                                     number=count)
+        results.add('json.decode', None, count, seconds * count,
+                    codec=name)
+    utils.set_json_codec()
+
+
+def bench_timestamps(results, count):
+    begin = datetime.datetime(2014, 1, 1)
+    timestamps = [begin + datetime.timedelta(seconds=i, microseconds=i)
+                  for i in range(count)]
+    _, seconds = benchutils.timed(
+        lambda: [utils.us_to_dt(utils.dt_to_us(t)) for t in timestamps])
+    results.add('timestamps.round_trip', None, count, seconds)
+    _, seconds = benchutils.timed(
+        lambda: utils.us_to_dts(utils.dts_to_us(timestamps)))
+    results.add('timestamps.round_trip_bulk', None, count, seconds)
+
+
+def main():
+    parser = benchutils.parser(__doc__)
+    parser.add_argument('--url', action='append',
+                        help='Database connection URL, may be repeated. '
+                             'Defaults to memory:// and sqlite://.')
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='Comma separated table sizes listed by '
+                             'get_resources().')
+    parser.add_argument('--count', type=int, default=5000,
+                        help='Number of resources recorded, documents '
+                             'encoded and timestamps converted per run.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each listing, the best is '
+                             'kept.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the generated resource ids.')
+    parser.add_argument('--output',
+                        help='File the JSON results are written to, '
+                             'defaults to stdout.')
+    args = benchutils.parse_args(parser)
+
+    urls = args.url or ['memory://', 'sqlite://']
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    rng = random.Random(args.seed)
+
+    results = Results()
+    for url in urls:
+        bench_record(results, url, rng, args.count)
+        for size in sizes:
+            bench_get_resources(results, url, rng, size, args.repeat)
+    bench_json(results, args.count)
+    bench_timestamps(results, args.count)
+
+    document = {
+        'meta': {
+            'date': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'numpy': utils.numpy is not None,
+            'args': vars(args),
+        },
+        'results': results.entries,
+    }
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        json.dump(document, output, indent=2, sort_keys=True)
+        output.write('\n')
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
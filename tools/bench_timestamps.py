@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure timestamp conversion throughput of the storage layer.
+
+Usage: bench_timestamps.py [--count N]
+
+Round-trips N timestamps through the former Decimal conversion, the
+current Decimal helpers, the integer microsecond helpers and their bulk
+variants.
+"""
+
+import calendar
+import datetime
+import decimal
+
+from entropy import utils
+
+import benchutils
+
+
+def legacy_dt_to_decimal(utc):
+    decimal.getcontext().prec = 30
+    return (decimal.Decimal(str(calendar.timegm(utc.utctimetuple()))) +
+            (decimal.Decimal(str(utc.microsecond)) /
+             decimal.Decimal("1000000.0")))
+
+
+def legacy_decimal_to_dt(dec):
+    integer = int(dec)
+    micro = (dec - decimal.Decimal(integer)) * decimal.Decimal(1000000)
+    daittyme = datetime.datetime.utcfromtimestamp(integer)
+    return daittyme.replace(microsecond=int(round(micro)))
+
+
+def _per_row(encode, decode):
+    def run(timestamps):
+        return [decode(encode(t)) for t in timestamps]
+    return run
+
+
+def _bulk(timestamps):
+    return utils.us_to_dts(utils.dts_to_us(timestamps))
+
+
+BENCHMARKS = (
+    ('decimal (legacy)', _per_row(legacy_dt_to_decimal,
+                                  legacy_decimal_to_dt)),
+    ('decimal', _per_row(utils.dt_to_decimal, utils.decimal_to_dt)),
+    ('integer', _per_row(utils.dt_to_us, utils.us_to_dt)),
+    ('integer bulk', _bulk),
+)
+
+
+def main():
+    parser = benchutils.parser(__doc__)
+    parser.add_argument('--count', type=int, default=1000000,
+                        help='Number of timestamps to convert.')
+    args = benchutils.parse_args(parser)
+
+    start = datetime.datetime(2014, 1, 1)
+    timestamps = [start + datetime.timedelta(seconds=i, microseconds=i)
+                  for i in range(args.count)]
+    for name, bench in BENCHMARKS:
+        result, elapsed = benchutils.timed(bench, timestamps)
+        assert result == timestamps, name
+        print('%-18s %10d timestamps %8.3fs %12.1f /s' % (
+            name, args.count, elapsed, args.count / elapsed))
+
+
+if __name__ == '__main__':
+    main()
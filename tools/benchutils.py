@@ -0,0 +1,53 @@
+# -*- encoding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Helpers shared by the bench_*.py scripts."""
+
+import argparse
+import timeit
+
+from oslo.config import cfg
+
+
+def parser(description):
+    return argparse.ArgumentParser(
+        description=description,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+
+def parse_args(parser):
+    """Parse the command line and load the default configuration."""
+    args = parser.parse_args()
+    cfg.CONF([], project='entropy')
+    return args
+
+
+def timed(func, *args):
+    """Call func once, return its result and the seconds it took."""
+    start = timeit.default_timer()
+    result = func(*args)
+    return result, timeit.default_timer() - start
+
+
+def best(func, repeat=3, number=1):
+    """Return the result of func and its best time over repeat runs.
+
+    Each run calls func number times, and the time returned is per call.
+    """
+    times = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        for _ in range(number):
+            result = func()
+        times.append(timeit.default_timer() - start)
+    return result, min(times) / number